@@ -0,0 +1,92 @@
+import argparse
+import math
+import random
+import time
+
+from utils.constants import GOOD_WONDERS, MAX_CITIES_PER_ISLAND, WORLD_MAP_SIZE, ISLAND_LEADERBOARD_SIZE
+from utils.general_utils import assign_island_tiers, build_island_leaderboards, rank_islands
+from utils.island_scoring import DEFAULT_SCORING_WEIGHTS, IslandColumns, score_islands
+from utils.types import ResourceType, WonderType
+
+
+def generate_full_map(islands_count: int, seed: int) -> list[dict]:
+    """Random islands spread over the whole world map, a real world has somewhere between 500 and 2000 of them"""
+    generator = random.Random(seed)
+    all_coords = [(x, y) for x in range(1, WORLD_MAP_SIZE + 1) for y in range(1, WORLD_MAP_SIZE + 1)]
+
+    return [
+        {
+            'x': x,
+            'y': y,
+            'wood_level': generator.randint(1, 45),
+            'resource_type': str(generator.choice(list(ResourceType))),
+            'resource_level': generator.randint(1, 45),
+            'wonder_type': str(generator.choice(list(WonderType))),
+            'wonder_level': generator.randint(1, 5),
+            'taken_spots': generator.randint(0, MAX_CITIES_PER_ISLAND + 1),
+            'date_fetched': '2024-10-14 23:33:00'
+        }
+        for x, y in generator.sample(all_coords, min(islands_count, len(all_coords)))
+    ]
+
+
+def score_island_loop(island: dict) -> int:
+    """The island-by-island scoring the vectorized engine replaced, kept as the baseline to compare against"""
+    weights = DEFAULT_SCORING_WEIGHTS
+    rank_score = max(0, min(MAX_CITIES_PER_ISLAND, MAX_CITIES_PER_ISLAND - island['taken_spots'])) * weights.free_spot
+    rank_score += island['wood_level'] * weights.wood_level
+    rank_score += island['resource_level'] * weights.resource_level
+    rank_score += island['wonder_level'] * weights.wonder_level
+
+    if island['wonder_type'] in map(str, GOOD_WONDERS):
+        rank_score += weights.good_wonder_bonus
+
+    distance_from_center = math.sqrt((island['x'] - WORLD_MAP_SIZE / 2) ** 2 + (island['y'] - WORLD_MAP_SIZE / 2) ** 2)
+    rank_score -= int(distance_from_center) * weights.distance_from_center
+
+    return int(rank_score)
+
+
+def measure(label: str, function, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+
+    print(f"{label:<40} best {min(timings) * 1000:9.2f}ms   mean {sum(timings) / len(timings) * 1000:9.2f}ms")
+
+
+def run_benchmark(islands_count: int, repeat: int, seed: int):
+    islands_data = generate_full_map(islands_count, seed)
+    print(f"Benchmarking island scoring on {len(islands_data)} islands, {repeat} runs each\n")
+
+    # Both implementations must agree before their timings mean anything
+    vectorized_scores = score_islands(IslandColumns(islands_data))
+    assert [score_island_loop(island) for island in islands_data] == vectorized_scores.tolist(), "vectorized scores differ from the loop"
+
+    measure("loop: score every island", lambda: [score_island_loop(island) for island in islands_data], repeat)
+    measure("vectorized: build columns", lambda: IslandColumns(islands_data), repeat)
+    measure("vectorized: build columns + score", lambda: score_islands(IslandColumns(islands_data)), repeat)
+    measure("vectorized: assign tiers", lambda: assign_island_tiers(islands_data), repeat)
+    measure("loop: rank every filter combination", lambda: [
+        sorted(
+            ((island, score_island_loop(island)) for island in islands_data
+             if island['resource_type'] == str(resource_type) and island['wonder_type'] == str(wonder_type)
+             and (not no_full_islands or island['taken_spots'] < MAX_CITIES_PER_ISLAND)),
+            key=lambda ranked_island: ranked_island[1], reverse=True
+        )[:ISLAND_LEADERBOARD_SIZE]
+        for resource_type in ResourceType for wonder_type in WonderType for no_full_islands in (False, True)
+    ], repeat)
+    measure("vectorized: build every leaderboard", lambda: build_island_leaderboards(islands_data, ISLAND_LEADERBOARD_SIZE), repeat)
+    measure("vectorized: rank_islands (single filter)", lambda: rank_islands(islands_data, ResourceType.MARBLE, WonderType.FORGE, True), repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the island scoring engine on randomly generated world maps.")
+    parser.add_argument("--islands", type=int, default=WORLD_MAP_SIZE * WORLD_MAP_SIZE, help="Amount of islands, defaults to a completely full map.")
+    parser.add_argument("--repeat", type=int, default=10, help="How many times every step is measured.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated map, the same seed generates the same map.")
+
+    args = parser.parse_args()
+    run_benchmark(args.islands, args.repeat, args.seed)
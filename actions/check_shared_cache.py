@@ -0,0 +1,221 @@
+"""
+Fails when the bot stops working with a redis shared cache backend.
+
+First runs the redis backend against an in-process stand-in that speaks the redis protocol: values (including null
+and error replies), expiry, counters, deletes and the database it selects must all come back the way redis returns them.
+Then points SHARED_CACHE_URL at a redis port nothing listens on and loads the islands of the default world from a
+scratch copy of the database, the way the islands commands do. Every cache read must come back empty and every write
+must be skipped without raising, and only one attempt per backoff may wait on the backend.
+
+Usage: python -m actions.check_shared_cache
+"""
+import asyncio
+import os
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+UNREACHABLE_CACHE_URL = 'redis://127.0.0.1:1/0'
+DEFAULT_REGION_ID, DEFAULT_WORLD_ID = 2, 57
+MAX_DEGRADED_CALL_SECONDS = 0.05  # once the backend is known to be down, calls fail right away
+STAND_IN_DB = 3
+
+
+class RedisStandInHandler(socketserver.StreamRequestHandler):
+    """Serves a single connection, every connection starts on database 0 until it SELECTs another"""
+
+    def read_command(self) -> list[bytes] | None:
+        line = self.rfile.readline()
+        if not line:
+            return None
+
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+
+        return args
+
+    def handle(self):
+        db = 0
+        while (command := self.read_command()) is not None:
+            name, args = command[0].upper().decode(), command[1:]
+            if name == 'SELECT':
+                db = int(args[0])
+
+            with self.server.lock:
+                reply = self.server.run(self.server.databases.setdefault(db, {}), name, args)
+            self.wfile.write(reply)
+
+
+class RedisStandIn(socketserver.ThreadingTCPServer):
+    """Answers the redis commands the bot uses from memory, the way redis answers them"""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RedisStandInHandler)
+        self.databases = {}  # db -> key -> (value, monotonic time it expires at or None)
+        self.lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    @staticmethod
+    def get_value(entries: dict, key: bytes) -> bytes | None:
+        entry = entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del entries[key]
+            return None
+
+        return entry[0] if entry else None
+
+    def run(self, entries: dict, name: str, args: list[bytes]) -> bytes:
+        if name in ('AUTH', 'SELECT'):
+            return b"+OK\r\n"
+
+        if name == 'GET':
+            value = self.get_value(entries, args[0])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+        if name == 'SET':
+            expires_at = time.monotonic() + int(args[3]) / 1000 if len(args) == 4 and args[2].upper() == b'PX' else None
+            entries[args[0]] = (args[1], expires_at)
+            return b"+OK\r\n"
+
+        if name == 'DEL':
+            return b":%d\r\n" % (entries.pop(args[0], None) is not None)
+
+        if name == 'INCR':
+            try:
+                value = int(self.get_value(entries, args[0]) or 0) + 1
+            except ValueError:
+                return b"-ERR value is not an integer or out of range\r\n"
+
+            entries[args[0]] = (str(value).encode(), None)
+            return b":%d\r\n" % value
+
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+
+def check_redis_backend(failures: list[str]):
+    from utils import cache_backends
+    from utils.cache_backends import CacheBackendError, RedisCacheBackend, SharedCache
+
+    stand_in = RedisStandIn()
+    threading.Thread(target=stand_in.serve_forever, name="redis-stand-in", daemon=True).start()
+    backend = RedisCacheBackend('127.0.0.1', stand_in.port, STAND_IN_DB)
+
+    def expect(description: str, actual, expected):
+        if actual != expected:
+            failures.append(f"redis backend: {description} returned {actual!r} instead of {expected!r}")
+
+    try:
+        expect("GET of a missing key", backend.get("missing"), None)
+
+        value = b"\x00binary\r\nvalue"
+        backend.set("key", value, 60)
+        expect("GET after SET", backend.get("key"), value)
+        expect("the database SELECTed on connect", set(stand_in.databases.get(STAND_IN_DB, {})), {b"key"})
+
+        backend.set("short-lived", b"value", 0.05)
+        time.sleep(0.1)
+        expect("GET after the PX expiry", backend.get("short-lived"), None)
+
+        expect("GET of a missing counter", backend.get_counter("counter"), 0)
+        expect("INCR of a missing counter", backend.incr("counter"), 1)
+        expect("INCR", backend.incr("counter"), 2)
+        expect("GET of a counter", backend.get_counter("counter"), 2)
+
+        backend.delete("key")
+        expect("GET after DEL", backend.get("key"), None)
+
+        for description, command in (("INCR of a value that isn't a number", ('INCR', 'text')),
+                                     ("an unknown command", ('NOSUCHCOMMAND',))):
+            backend.set("text", b"text", 60)
+            try:
+                backend.execute(*command)
+                failures.append(f"redis backend: {description} didn't raise CacheBackendError")
+            except CacheBackendError:
+                pass
+            # The error reply is read whole, the connection stays in sync and is kept
+            expect(f"GET after {description}", backend.get("text"), b"text")
+
+        cache_backends.shared_cache_backend = backend
+        cache = SharedCache("check", 60)
+        cache.set("key", {"value": [1, 2]})
+        expect("SharedCache.get", cache.get("key"), {"value": [1, 2]})
+        cache.invalidate()
+        expect("SharedCache.get after invalidating", cache.get("key", "missing"), "missing")
+    except Exception as e:
+        failures.append(f"redis backend: {type(e).__name__}: {e}")
+    finally:
+        cache_backends.shared_cache_backend = None
+        backend.close()
+        stand_in.shutdown()
+        stand_in.server_close()
+
+
+def check_unreachable_backend(failures: list[str]):
+    from database import guild_settings_manager
+    from utils.cache_backends import SharedCache
+    from utils.world_data import WorldData
+
+    try:
+        cache = SharedCache("check", 60)
+        cache.set("key", {"value": 1})
+        if cache.get("key", "missing") != "missing":
+            failures.append("a read from the unreachable backend returned a value")
+        cache.delete("key")
+        cache.invalidate()
+
+        start_time = time.perf_counter()
+        for _ in range(100):
+            cache.get("key")
+            cache.generation = None  # forces a generation check every time
+        if (time.perf_counter() - start_time) / 100 > MAX_DEGRADED_CALL_SECONDS:
+            failures.append(f"reads from the unreachable backend take over {MAX_DEGRADED_CALL_SECONDS}s each")
+
+        world_data = WorldData(DEFAULT_REGION_ID, DEFAULT_WORLD_ID)
+        for load in (world_data.load_islands, world_data.reload_islands):
+            if not load().islands_data:
+                failures.append(f"{load.__name__} returned no islands")
+
+        asyncio.run(world_data.get_island_leaderboard("wine", "forge", True))
+        guild_settings_manager.invalidate_islands_data()
+    except Exception as e:
+        failures.append(f"unreachable backend: {type(e).__name__}: {e}")
+
+
+def main() -> int:
+    scratch_dir = tempfile.mkdtemp(prefix="ika-cache-check-")
+    database_path = os.path.join(scratch_dir, 'guild_settings.sqlite')
+    shutil.copy(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'guild_settings.sqlite'), database_path)
+
+    # The constants read these when first imported, so the bot's modules are only imported once they are set
+    os.environ['SHARED_CACHE_URL'] = UNREACHABLE_CACHE_URL
+    os.environ['DATABASE_PATH'] = database_path
+    os.environ['CACHE_DIR'] = os.path.join(scratch_dir, 'cache')
+
+    failures = []
+    try:
+        check_redis_backend(failures)
+        check_unreachable_backend(failures)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    if failures:
+        print("The bot doesn't work with a redis shared cache:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+
+    print(f"The redis backend speaks the protocol, and the bot works as without a shared cache while {UNREACHABLE_CACHE_URL} is unreachable")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+import argparse
+
+from database.guild_settings_manager import invalidate_islands_data
+from utils.constants import LOG_LEVEL, LOG_FORMAT, LOG_RATE_LIMIT_RECORDS, LOG_RATE_LIMIT_WINDOW_SECONDS
+from utils.logging_utils import setup_logging
+from utils.types import BaseCommand
+from utils.upstream import ikalogs_client
+
+INVALIDATORS = {
+    "islands": invalidate_islands_data,
+    "responses": ikalogs_client.shared_cache.invalidate,
+    "results": BaseCommand.results_cache.invalidate,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Drop cached data in every bot process sharing the cache (SHARED_CACHE_URL), e.g. after the islands data was collected again."
+    )
+    parser.add_argument("caches", nargs="+", choices=sorted(INVALIDATORS), help="The caches to drop.")
+
+    args = parser.parse_args()
+    setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_RATE_LIMIT_RECORDS, LOG_RATE_LIMIT_WINDOW_SECONDS)
+    for cache_name in args.caches:
+        INVALIDATORS[cache_name]()
+        print(f"Invalidated the {cache_name} cache")
@@ -0,0 +1,378 @@
+"""
+Load tests the command dispatcher: fake interactions run the bot's slash commands (and through them run_command and
+every command class) at a given concurrency and arrival rate, against a local ika-logs stand-in and a scratch copy of
+the database. Reports the throughput, the latency percentiles of every command, the event loop lag and the peak memory.
+
+Usage: python -m actions.load_test --concurrency 20 --rate 50 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+LAG_SAMPLE_INTERVAL_SECONDS = 0.05
+DEFAULT_REGION_ID, DEFAULT_WORLD_ID = 2, 57  # the world of the default settings, every fake guild plays in it
+SEEDED_SNAPSHOT_AGES_HOURS = (96, 72, 1)  # how long ago the archived snapshots of the scratch database were taken
+
+
+def generate_world_rows(islands: list[tuple[int, int]], cities_count: int, players_count: int, alliances_count: int, seed: int) -> list[dict]:
+    """Cities spread over the islands of the world, in the format ika-logs answers with"""
+    generator = random.Random(seed)
+
+    rows = []
+    for city_index in range(cities_count):
+        x, y = generator.choice(islands)
+        player_index = city_index % players_count
+        rows.append({
+            'x': x,
+            'y': y,
+            'tradegood': generator.randint(1, 4),
+            'wonder': generator.randint(1, 8),
+            'island_tradegood': generator.randint(1, 45),
+            'island_wonder': generator.randint(1, 5),
+            'island_wood': generator.randint(1, 45),
+            'island_name': f"island{x}_{y}",
+            'city_level': generator.randint(1, 40),
+            'city_name': f"city{city_index}",
+            'player_name': f"player{player_index}",
+            'player_score': generator.randint(1, 1000000),
+            'ally_name': f"ally{player_index % alliances_count}",
+        })
+
+    return rows
+
+
+def seed_snapshots(rows: list[dict], seed: int):
+    """
+    Archives a few snapshots of the world rows in the scratch database, the way the bot archives the cities it fetched.
+    Every city is observed in every snapshot, but only about half of the players' scores ever change, so the other
+    half is inactive and /find_inactive_targets has targets to list.
+    """
+    from database.snapshot_store import restore_snapshot_archive, save_snapshot
+    from utils.constants import SNAPSHOT_KEYFRAME_INTERVAL
+    from utils.snapshot_archive import WorldSnapshotArchive
+    from utils.types import CityData
+
+    generator = random.Random(seed)
+    archive = WorldSnapshotArchive(SNAPSHOT_KEYFRAME_INTERVAL)
+    restore_snapshot_archive(DEFAULT_REGION_ID, DEFAULT_WORLD_ID, archive)
+
+    player_names = sorted({row['player_name'] for row in rows})
+    active_players = set(generator.sample(player_names, len(player_names) // 2))
+    for snapshot_index, age_hours in enumerate(SEEDED_SNAPSHOT_AGES_HOURS):
+        archive.observe([
+            CityData({**row, 'player_score': row['player_score'] + (snapshot_index if row['player_name'] in active_players else 0)})
+            for row in rows
+        ])
+
+        record = archive.take_snapshot(time.time() - age_hours * 60 * 60)
+        save_snapshot(DEFAULT_REGION_ID, DEFAULT_WORLD_ID, record)
+        archive.commit_snapshot(record)
+
+
+class IkalogsStandInHandler(BaseHTTPRequestHandler):
+    """Answers User_WorldFind reports the way ika-logs does, from the rows of the stand-in server"""
+    server: 'IkalogsStandIn'
+
+    def do_POST(self):
+        query = parse_qs(parse_qs(urlparse(self.path).query).get('query', [''])[0])
+        rows = self.server.rows
+
+        if 'nick' in query:
+            rows = [row for row in rows if row['player_name'].startswith(query['nick'][0].lower())]
+        if 'allies[1]' in query:
+            rows = [row for row in rows if row['ally_name'] == query['allies[1]'][0].lower()]
+        if 'x' in query and 'y' in query:
+            rows = [row for row in rows if row['x'] == int(query['x'][0]) and row['y'] == int(query['y'][0])]
+
+        time.sleep(self.server.latency_seconds)
+
+        # Ika-logs answers with a non-json page when nothing matches the query
+        body, content_type = (json.dumps({'body': {'rows': rows}}).encode(), 'application/json') if rows else (b"<html></html>", 'text/html')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class IkalogsStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, rows: list[dict], latency_seconds: float):
+        super().__init__(('127.0.0.1', 0), IkalogsStandInHandler)
+        self.rows = rows
+        self.latency_seconds = latency_seconds
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/"
+
+
+class FakeResponse:
+    """The part of discord.InteractionResponse the commands use, every call takes as long as discord would"""
+
+    def __init__(self, latency_seconds: float):
+        self.latency_seconds = latency_seconds
+        self.messages = []
+
+    async def send_message(self, content: str = None, **kwargs):
+        await asyncio.sleep(self.latency_seconds)
+        self.messages.append({'content': content, **kwargs})
+
+    async def edit_message(self, **kwargs):
+        await self.send_message(**kwargs)
+
+    async def defer(self, **kwargs):
+        await asyncio.sleep(self.latency_seconds)
+
+    def is_done(self) -> bool:
+        return bool(self.messages)
+
+    def is_error(self) -> bool:
+        embed = self.messages[-1].get('embed') if self.messages else None
+        return not self.messages or (embed is not None and embed.title == "Error")
+
+
+def make_interaction(client, command, guild_id: int, user_id: int, discord_latency_seconds: float) -> SimpleNamespace:
+    """A stand-in for the discord.Interaction of a slash command, with the attributes the bot reads"""
+    return SimpleNamespace(
+        client=client,
+        command=command,
+        guild=SimpleNamespace(id=guild_id, name=f"load-test-guild-{guild_id}", system_channel=None),
+        user=SimpleNamespace(id=user_id, name=f"load-test-user-{user_id}", bot=False),
+        namespace=SimpleNamespace(),
+        response=FakeResponse(discord_latency_seconds),
+    )
+
+
+def build_scenarios(islands: list[tuple[int, int]], players_count: int, alliances_count: int) -> dict:
+    """Slash command name -> function that picks the arguments of a random invocation of it"""
+    from utils.types import ClosestCitySearchTypes, ResourceType, UnitType, WonderType
+
+    def coords(generator: random.Random) -> str:
+        x, y = generator.choice(islands)
+        return f"{x}:{y}"
+
+    def player(generator: random.Random) -> str:
+        return f"player{generator.randrange(players_count)}"
+
+    def alliance(generator: random.Random) -> str:
+        return f"ally{generator.randrange(alliances_count)}"
+
+    return {
+        'find_player': lambda g: {'player_name': player(g)},
+        'find_island': lambda g: {'coords': coords(g)},
+        'search_islands': lambda g: {'coords': coords(g), 'radius': g.randint(5, 20)},
+        'travel_time': lambda g: {'unit_type': g.choice(list(UnitType)), 'start_coords': coords(g), 'destination_coords': coords(g)},
+        'travel_time_matrix': lambda g: {
+            'unit_type': g.choice(list(UnitType)), 'search_type': ClosestCitySearchTypes.ALLIANCE, 'name': alliance(g),
+            'target_coords': ",".join(coords(g) for _ in range(3))
+        },
+        'plan_attack': lambda g: {
+            'unit_type': g.choice(list(UnitType)), 'target_coords': coords(g), 'landing_time': "23:59",
+            'search_type': ClosestCitySearchTypes.PLAYER, 'names': ",".join(player(g) for _ in range(3))
+        },
+        'closest_city_to_target': lambda g: {'search_type': ClosestCitySearchTypes.ALLIANCE, 'name': alliance(g), 'coords': coords(g)},
+        'frontline': lambda g: {'alliance_name': alliance(g), 'enemy_alliance_name': alliance(g)},
+        'find_inactive_targets': lambda g: {'coords': coords(g)},
+        'list_best_islands': lambda g: {'resource_type': g.choice(list(ResourceType)), 'miracle_type': g.choice(list(WonderType))},
+        'calculate_clusters': lambda g: {'alliance_name': alliance(g), 'min_cities_per_island': 1, 'max_cluster_distance': 10, 'min_cities_per_cluster': 2},
+        'generate_heatmap': lambda g: {'alliance_name': alliance(g), 'smoothing': g.randint(0, 3)},
+        'show_settings': lambda g: {},
+        'help': lambda g: {},
+    }
+
+
+class LoadTestResults:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.loop_lags: list[float] = []
+
+    def record(self, command_name: str, latency: float, failed: bool):
+        self.latencies.setdefault(command_name, []).append(latency)
+        self.errors[command_name] = self.errors.get(command_name, 0) + failed
+
+
+async def monitor_loop_lag(results: LoadTestResults, stopped: asyncio.Event):
+    """How late the event loop wakes up a sleeping task, anything blocking the loop shows up here"""
+    while not stopped.is_set():
+        expected = time.perf_counter() + LAG_SAMPLE_INTERVAL_SECONDS
+        await asyncio.sleep(LAG_SAMPLE_INTERVAL_SECONDS)
+        results.loop_lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def run_interaction(client, command_name: str, kwargs: dict, arrival_time: float, args, generator: random.Random,
+                          slots: asyncio.Semaphore, results: LoadTestResults):
+    command = client.tree.get_command(command_name)
+    interaction = make_interaction(
+        client, command, generator.randrange(args.guilds) + 1, generator.randrange(1000) + 1, args.discord_latency_ms / 1000
+    )
+
+    async with slots:
+        try:
+            await command.callback(interaction, **kwargs)
+            failed = interaction.response.is_error()
+        except Exception:
+            failed = True
+
+    # Measured from when the interaction arrived, time spent waiting for a free slot included
+    results.record(command_name, time.perf_counter() - arrival_time, failed)
+
+
+async def drive_load(client, scenarios: dict, args) -> tuple[LoadTestResults, float]:
+    """
+    With a rate, interactions arrive at random (poisson) intervals regardless of how fast they are served, at most
+    args.concurrency of them run at once. Without one, args.concurrency users send their next command as soon as
+    the previous one is answered.
+    """
+    generator = random.Random(args.seed)
+    results = LoadTestResults()
+    slots = asyncio.Semaphore(args.concurrency)
+    stopped = asyncio.Event()
+    lag_monitor = asyncio.create_task(monitor_loop_lag(results, stopped))
+
+    def pick_interaction() -> tuple[str, dict]:
+        command_name = generator.choice(args.commands)
+        return command_name, scenarios[command_name](generator)
+
+    start_time = time.perf_counter()
+    deadline = start_time + args.duration
+
+    if args.rate > 0:
+        tasks = []
+        next_arrival = start_time
+        while next_arrival < deadline:
+            # Arrivals are scheduled ahead, a slow loop makes them late instead of making the load lighter
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            tasks.append(asyncio.create_task(run_interaction(client, *pick_interaction(), next_arrival, args, generator, slots, results)))
+            next_arrival += generator.expovariate(args.rate)
+        await asyncio.gather(*tasks)
+    else:
+        async def user():
+            while time.perf_counter() < deadline:
+                await run_interaction(client, *pick_interaction(), time.perf_counter(), args, generator, slots, results)
+
+        await asyncio.gather(*(user() for _ in range(args.concurrency)))
+
+    elapsed = time.perf_counter() - start_time
+    stopped.set()
+    await lag_monitor
+
+    return results, elapsed
+
+
+def get_peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+
+    # Kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def print_report(results: LoadTestResults, elapsed: float, args):
+    all_latencies = [latency for latencies in results.latencies.values() for latency in latencies]
+    total_errors = sum(results.errors.values())
+    print(f"\n{len(all_latencies)} interactions in {elapsed:.1f}s: {len(all_latencies) / elapsed:.1f}/s, {total_errors} failed")
+    print(f"(concurrency {args.concurrency}, {f'{args.rate}/s arrivals' if args.rate > 0 else 'closed loop'}, "
+          f"ika-logs latency {args.ikalogs_latency_ms}ms, discord latency {args.discord_latency_ms}ms)\n")
+
+    print(f"{'command':<24}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for command_name, latencies in [("all", all_latencies), *sorted(results.latencies.items())]:
+        if not latencies:
+            continue
+
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        errors = total_errors if command_name == "all" else results.errors[command_name]
+        print(f"{command_name:<24}{len(latencies):>7}{errors:>8}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{max(latencies) * 1000:>10.1f}")
+
+    if results.loop_lags:
+        lag_p50, lag_p99 = np.percentile(results.loop_lags, [50, 99]) * 1000
+        print(f"\nevent loop lag: p50 {lag_p50:.1f}ms, p99 {lag_p99:.1f}ms, max {max(results.loop_lags) * 1000:.1f}ms")
+
+    peak_rss = get_peak_rss_mb()
+    print(f"peak memory: {f'{peak_rss:.1f}MB resident' if peak_rss is not None else 'resident size unavailable'}", end="")
+    if tracemalloc.is_tracing():
+        print(f", {tracemalloc.get_traced_memory()[1] / 1024 / 1024:.1f}MB python heap", end="")
+    print()
+
+
+def run_load_test(args):
+    scratch_dir = tempfile.mkdtemp(prefix="ika-load-test-")
+    database_path = os.path.join(scratch_dir, 'guild_settings.sqlite')
+    shutil.copy(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'guild_settings.sqlite'), database_path)
+
+    with sqlite3.connect(database_path) as conn:
+        islands = conn.execute(
+            "SELECT x, y FROM islands_data WHERE region_id = ? AND world_id = ?", (DEFAULT_REGION_ID, DEFAULT_WORLD_ID)
+        ).fetchall() or [(random.Random(args.seed).randint(1, 100), random.Random(args.seed + 1).randint(1, 100))]
+
+    world_rows = generate_world_rows(islands, args.cities, args.players, args.alliances, args.seed)
+    stand_in = IkalogsStandIn(world_rows, args.ikalogs_latency_ms / 1000)
+    threading.Thread(target=stand_in.serve_forever, name="ikalogs-stand-in", daemon=True).start()
+
+    # The constants read these when first imported, so the bot is only imported once they point at the scratch copies
+    os.environ['IKALOGS_URL'] = stand_in.url
+    os.environ['DATABASE_PATH'] = database_path
+    os.environ['CACHE_DIR'] = os.path.join(scratch_dir, 'cache')
+    os.environ['SHARED_CACHE_URL'] = 'memory://'
+    os.environ.setdefault('BOT_ENV', 'dev')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import bot
+
+    seed_snapshots(world_rows, args.seed)
+    scenarios = build_scenarios(islands, args.players, args.alliances)
+    args.commands = args.commands or list(scenarios)
+    unknown_commands = set(args.commands) - set(scenarios)
+    if unknown_commands:
+        raise SystemExit(f"No scenario for {', '.join(sorted(unknown_commands))}, pick from {', '.join(scenarios)}")
+
+    print(f"Load testing {len(args.commands)} commands for {args.duration}s, scratch files in {scratch_dir}")
+    if args.trace_memory:
+        tracemalloc.start()
+
+    try:
+        results, elapsed = asyncio.run(drive_load(bot.client, scenarios, args))
+        print_report(results, elapsed, args)
+    finally:
+        stand_in.shutdown()
+        if not args.keep_scratch:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the command dispatcher with fake interactions against a local ika-logs stand-in.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Most interactions handled at once.")
+    parser.add_argument("--rate", type=float, default=0, help="Interactions arriving per second, 0 sends the next one as soon as one is answered.")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to keep sending interactions for.")
+    parser.add_argument("--commands", nargs="*", help="The slash commands to send, defaults to every command with a scenario.")
+    parser.add_argument("--guilds", type=int, default=20, help="Amount of guilds the interactions come from.")
+    parser.add_argument("--cities", type=int, default=5000, help="Amount of cities in the stand-in world.")
+    parser.add_argument("--players", type=int, default=500, help="Amount of players owning them.")
+    parser.add_argument("--alliances", type=int, default=20, help="Amount of alliances the players are in.")
+    parser.add_argument("--ikalogs-latency-ms", type=float, default=100, help="How long the stand-in takes to answer.")
+    parser.add_argument("--discord-latency-ms", type=float, default=50, help="How long every message sent to discord takes.")
+    parser.add_argument("--trace-memory", action="store_true", help="Also report the python heap peak, slows everything down.")
+    parser.add_argument("--keep-scratch", action="store_true", help="Keep the scratch database and caches for inspection.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the stand-in world and the interactions.")
+
+    run_load_test(parser.parse_args())
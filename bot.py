@@ -1,29 +1,67 @@
-from datetime import datetime
+import asyncio
+import logging
 
 import discord
 from discord import app_commands
 
 from commands.calculate_clusters import CalculateClusters
 from commands.closest_city_to_target import ClosestCityToTarget
+from commands.find_inactive_targets import FindInactiveTargets
 from commands.find_island import FindIsland
 from commands.find_player import FindPlayer
+from commands.frontline import DetectFrontline
+from commands.generate_heatmap import GenerateHeatmap
 from commands.help import HelpCommand
 from commands.list_best_islands import ListBestIslands
-from commands.manage_settings import ResetSettings, ShowSettings, UpdateSetting
+from commands.manage_profiling import ManageProfiling
+from commands.manage_settings import ResetSettings, SetTradeChannel, ShowSettings, UpdateSetting
+from commands.plan_attack import PlanSynchronizedAttack
+from commands.search_islands import SearchIslands
 from commands.travel_time import CalculateTravelTime
+from commands.travel_time_matrix import CalculateTravelTimeMatrix
 from database.guild_settings_manager import fetch_or_create_settings
-from embeds.embeds import welcome_message_embed
-from handlers.trade_matcher import check_msg_for_trade_offer
+from embeds.embeds import create_embed
+from handlers.autocomplete import (
+    player_name_autocomplete,
+    alliance_name_autocomplete,
+    player_or_alliance_name_autocomplete,
+    names_list_autocomplete,
+    command_name_autocomplete
+)
+from handlers.cache_prewarmer import prewarm_caches_forever
+from handlers.guild_sync import guild_join_queue, process_guild_joins_forever, reconcile_guilds
+from handlers.snapshot_archiver import archive_snapshots_forever
+from handlers.trade_matcher import check_msg_for_trade_offer, process_trade_offers_forever
 from utils.constants import (
     CALCULATE_CLUSTERS_DESCRIPTION,
     FIND_PLAYER_DESCRIPTION,
     TRAVEL_TIME_DESCRIPTION,
+    TRAVEL_TIME_MATRIX_DESCRIPTION,
+    PLAN_ATTACK_DESCRIPTION,
+    FRONTLINE_DESCRIPTION,
+    FIND_INACTIVE_TARGETS_DESCRIPTION,
+    SEARCH_ISLANDS_DESCRIPTION,
+    GENERATE_HEATMAP_DESCRIPTION,
     CLOSEST_CITY_TO_TARGET_DESCRIPTION,
     LIST_BEST_ISLANDS_DESCRIPTION,
+    SET_TRADE_CHANNEL_DESCRIPTION,
+    PROFILING_DESCRIPTION,
     BOT_TOKEN,
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_RATE_LIMIT_RECORDS,
+    LOG_RATE_LIMIT_WINDOW_SECONDS,
     CHANGE_SETTING_DESCRIPTION, FIND_ISLAND_DESCRIPTION
 )
+from utils.logging_utils import setup_logging
 from utils.types import WonderType, ResourceType, UnitType, ConfigurableSetting, ClosestCitySearchTypes
+from utils.usage_tracker import command_usage
+from utils.world_data import attach_guild, detach_guild
+
+logger = logging.getLogger(__name__)
+
+# Records logged up to here (e.g. by the database migrations) only made it to stderr if they were warnings or errors
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_RATE_LIMIT_RECORDS, LOG_RATE_LIMIT_WINDOW_SECONDS)
 
 
 class DiscordBotClient(discord.Client):
@@ -34,38 +72,51 @@ class DiscordBotClient(discord.Client):
         super().__init__(intents=intents)
 
         self.tree = app_commands.CommandTree(self)
+        self.prewarm_task = None
+        self.snapshot_task = None
+        self.guild_join_task = None
+        self.trade_task = None
 
     async def setup_hook(self):
         # Sync commands globally to all servers the bot is in
         await self.tree.sync()
 
+        # Keep the data of the worlds our guilds play in warm, so users don't wait for ika-logs
+        self.prewarm_task = asyncio.create_task(prewarm_caches_forever())
+
+        # Track how the cities we collect evolve over time
+        self.snapshot_task = asyncio.create_task(archive_snapshots_forever())
+
+        # Set up the guilds that join us in batches, a burst of joins costs a few queries instead of a few per guild
+        self.guild_join_task = asyncio.create_task(process_guild_joins_forever())
+
+        # Trade offers are matched and saved in batches, away from the gateway events
+        self.trade_task = asyncio.create_task(process_trade_offers_forever(self))
+
     async def on_ready(self):
         await self.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name="Ikariam"))
-        print(
-            f"{datetime.now()} | Logged in as {self.user} (ID: {self.user.id}) \n"
-            "------"
-        )
+
+        # Catch up on the guilds that added or removed us while we were offline
+        await reconcile_guilds(list(self.guilds), all_guilds=True)
+        logger.info(f"Logged in as {self.user} (ID: {self.user.id})")
 
     async def on_message(self, message: discord.Message):
         if message.author == self.user:
             return
 
-        # Call the trade checking logic
-        await check_msg_for_trade_offer(message, self)
+        # Only queues trade offers, every other message is dropped after a few in-memory checks
+        check_msg_for_trade_offer(message)
 
     async def on_connect(self):
-        print(f"{datetime.now()} | Successfully connected to Discord Services")
+        logger.info("Successfully connected to Discord Services")
 
     async def on_guild_join(self, guild: discord.Guild):
+        # The guild's settings are initialized and it is greeted along with the other guilds joining around the same time
+        guild_join_queue.put_nowait(guild)
 
-        # Check if the server already has existing settings, if not, initialize them
-        fetch_or_create_settings(guild)
-
-        # Send a greeting message
-        greeting_message = welcome_message_embed(guild)
-
-        if guild.system_channel:
-            await guild.system_channel.send(embed=greeting_message)
+    async def on_guild_remove(self, guild: discord.Guild):
+        # The data of the guild's world is released if no other guild plays in it
+        detach_guild(guild.id)
 
 
 client = DiscordBotClient()
@@ -78,9 +129,11 @@ async def run_command(interaction: discord.Interaction, command_class, command_p
 
     # Check if the server already has existing settings, if not, initialize them
     settings = fetch_or_create_settings(interaction.guild)
+    command_usage.record((settings['region_id'], settings['world_id']))
+    world_data = attach_guild(interaction.guild.id, settings['region_id'], settings['world_id'])
 
     # Create an instance of the command class and run it
-    command_class_instance = command_class(interaction, command_params, settings)
+    command_class_instance = command_class(interaction, command_params, settings, world_data)
     await command_class_instance.run()
 
 
@@ -89,6 +142,7 @@ async def run_command(interaction: discord.Interaction, command_class, command_p
 ###
 @client.tree.command()
 @app_commands.describe(**CALCULATE_CLUSTERS_DESCRIPTION)
+@app_commands.autocomplete(alliance_name=alliance_name_autocomplete)
 async def calculate_clusters(interaction: discord.Interaction, alliance_name: str, min_cities_per_island: int,
                              max_cluster_distance: int, min_cities_per_cluster: int):
     """Calculates which island groups (clusters) have the most cities from the selected alliance"""
@@ -100,8 +154,21 @@ async def calculate_clusters(interaction: discord.Interaction, alliance_name: st
     })
 
 
+@client.tree.command()
+@app_commands.describe(**GENERATE_HEATMAP_DESCRIPTION)
+@app_commands.autocomplete(alliance_name=alliance_name_autocomplete)
+async def generate_heatmap(interaction: discord.Interaction, alliance_name: str, min_cities_on_island: int = 1, smoothing: int = 0):
+    """Renders an image of where the alliance's cities are concentrated on the world map"""
+    await run_command(interaction, GenerateHeatmap, {
+        'alliance_name': alliance_name.lower(),
+        'min_cities_on_island': min_cities_on_island,
+        'smoothing': smoothing
+    })
+
+
 @client.tree.command()
 @app_commands.describe(**FIND_PLAYER_DESCRIPTION)
+@app_commands.autocomplete(player_name=player_name_autocomplete, alliance_name=alliance_name_autocomplete)
 async def find_player(interaction: discord.Interaction, player_name: str, alliance_name: str = None):
     """Retrieves information about the player's cities locations"""
     await run_command(interaction, FindPlayer, {"player_name": player_name.lower(), "alliance_name": alliance_name})
@@ -114,6 +181,20 @@ async def find_island(interaction: discord.Interaction, coords: str):
     await run_command(interaction, FindIsland, {"coords": coords})
 
 
+@client.tree.command()
+@app_commands.describe(**SEARCH_ISLANDS_DESCRIPTION)
+async def search_islands(interaction: discord.Interaction, coords: str, radius: int = 10, min_free_spots: int = 1,
+                         resource_type: ResourceType = None, miracle_type: WonderType = None):
+    """Finds the islands around a location that match your filters, closest first"""
+    await run_command(interaction, SearchIslands, {
+        "coords": coords,
+        "radius": radius,
+        "min_free_spots": min_free_spots,
+        "resource_type": resource_type,
+        "miracle_type": miracle_type
+    })
+
+
 @client.tree.command()
 @app_commands.describe(**TRAVEL_TIME_DESCRIPTION)
 async def travel_time(
@@ -131,8 +212,52 @@ async def travel_time(
     })
 
 
+@client.tree.command()
+@app_commands.describe(**TRAVEL_TIME_MATRIX_DESCRIPTION)
+@app_commands.autocomplete(name=player_or_alliance_name_autocomplete)
+async def travel_time_matrix(
+        interaction: discord.Interaction, unit_type: UnitType, search_type: ClosestCitySearchTypes, name: str,
+        target_coords: str, using_poseidon: bool = False, using_oligarchy: bool = False, sea_chart_level: int = 0,
+        page: int = 1
+):
+    """Calculates travel times from every city of a player/alliance to every target, fastest first"""
+    await run_command(interaction, CalculateTravelTimeMatrix, {
+        "unit_type": unit_type,
+        "search_type": search_type,
+        "name": name.lower(),
+        "target_coords": target_coords,
+        "using_poseidon": using_poseidon,
+        "using_oligarchy": using_oligarchy,
+        "sea_chart_level": sea_chart_level,
+        "page": page,
+    })
+
+
+@client.tree.command()
+@app_commands.describe(**PLAN_ATTACK_DESCRIPTION)
+@app_commands.autocomplete(names=names_list_autocomplete)
+async def plan_attack(
+        interaction: discord.Interaction, unit_type: UnitType, target_coords: str, landing_time: str,
+        search_type: ClosestCitySearchTypes, names: str, using_poseidon: bool = False, using_oligarchy: bool = False,
+        sea_chart_level: int = 0, page: int = 1
+):
+    """Calculates when every participating city has to send its units so that all waves land together"""
+    await run_command(interaction, PlanSynchronizedAttack, {
+        "unit_type": unit_type,
+        "target_coords": target_coords,
+        "landing_time": landing_time,
+        "search_type": search_type,
+        "names": names.lower(),
+        "using_poseidon": using_poseidon,
+        "using_oligarchy": using_oligarchy,
+        "sea_chart_level": sea_chart_level,
+        "page": page,
+    })
+
+
 @client.tree.command()
 @app_commands.describe(**CLOSEST_CITY_TO_TARGET_DESCRIPTION)
+@app_commands.autocomplete(name=player_or_alliance_name_autocomplete)
 async def closest_city_to_target(interaction: discord.Interaction, search_type: ClosestCitySearchTypes, name: str, coords: str):
     """Checks which of the player's/alliance cities is the closest to the target island"""
     await run_command(interaction, ClosestCityToTarget, {
@@ -142,6 +267,29 @@ async def closest_city_to_target(interaction: discord.Interaction, search_type:
     })
 
 
+@client.tree.command()
+@app_commands.describe(**FRONTLINE_DESCRIPTION)
+@app_commands.autocomplete(alliance_name=alliance_name_autocomplete, enemy_alliance_name=alliance_name_autocomplete)
+async def frontline(interaction: discord.Interaction, alliance_name: str, enemy_alliance_name: str, contested_distance: int = 5):
+    """Finds the nearest friendly city for every enemy city and the islands both alliances are fighting over"""
+    await run_command(interaction, DetectFrontline, {
+        "alliance_name": alliance_name.lower(),
+        "enemy_alliance_name": enemy_alliance_name.lower(),
+        "contested_distance": contested_distance
+    })
+
+
+@client.tree.command()
+@app_commands.describe(**FIND_INACTIVE_TARGETS_DESCRIPTION)
+async def find_inactive_targets(interaction: discord.Interaction, coords: str, radius: int = 10, inactive_hours: int = 48):
+    """Lists the cities near your coords whose owners' score hasn't changed for a while"""
+    await run_command(interaction, FindInactiveTargets, {
+        "coords": coords,
+        "radius": radius,
+        "inactive_hours": inactive_hours
+    })
+
+
 @client.tree.command()
 @app_commands.describe(**LIST_BEST_ISLANDS_DESCRIPTION)
 async def list_best_islands(interaction: discord.Interaction, resource_type: ResourceType, miracle_type: WonderType,
@@ -184,10 +332,19 @@ async def reset_settings(interaction: discord.Interaction):
     await run_command(interaction, ResetSettings, {})
 
 
+@client.tree.command()
+@app_commands.describe(**SET_TRADE_CHANNEL_DESCRIPTION)
+@app_commands.checks.has_permissions(administrator=True)
+async def set_trade_channel(interaction: discord.Interaction, channel: discord.TextChannel = None):
+    """Pick up trade offers in a single channel only, or in every channel"""
+    await run_command(interaction, SetTradeChannel, {"channel": channel})
+
+
 # Handle permission errors
 @change_setting.error
 @show_settings.error
 @reset_settings.error
+@set_trade_channel.error
 async def permission_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
     if isinstance(error, app_commands.MissingPermissions):
         # noinspection PyUnresolvedReferences
@@ -200,10 +357,41 @@ async def permission_error(interaction: discord.Interaction, error: app_commands
         )
 
 
+###
+# Profiling Commands
+###
+async def is_bot_owner(interaction: discord.Interaction) -> bool:
+    return await interaction.client.is_owner(interaction.user)
+
+
+@client.tree.command()
+@app_commands.describe(**PROFILING_DESCRIPTION)
+@app_commands.autocomplete(command=command_name_autocomplete)
+@app_commands.check(is_bot_owner)
+async def profiling(interaction: discord.Interaction, sample_rate: app_commands.Range[float, 0, 1] = None, command: str = None):
+    """Profile a fraction of all commands, or every run of a single command (bot owner only)"""
+    await run_command(interaction, ManageProfiling, {
+        "sample_rate": sample_rate,
+        "command_name": command
+    })
+
+
+@profiling.error
+async def profiling_permission_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.CheckFailure):
+        # noinspection PyUnresolvedReferences
+        await interaction.response.send_message(
+            embed=create_embed("Only my owner can profile my commands.", color=discord.Color.red()),
+            ephemeral=True
+        )
+
+
 @client.tree.command()
 async def help(interaction: discord.Interaction):
     """Displays a dynamic help menu with all available commands."""
     await run_command(interaction, HelpCommand, {})
 
 
-client.run(BOT_TOKEN)
+if __name__ == "__main__":
+    # discord.py logs through our handlers instead of setting up its own
+    client.run(BOT_TOKEN, log_handler=None)
@@ -1,26 +1,54 @@
-from itertools import product
+import discord
 
 from embeds.embeds import calculate_clusters_embed
-from utils.data_utils import fetch_data
+from utils.cache_utils import LRUCache
+from utils.cluster_utils import SingleLinkageDendrogram
+from utils.constants import CLUSTERS_CACHE_SIZE
+from utils.data_utils import get_cities_data_version
 from utils.general_utils import count_cities_per_island, generate_cluster_name
 from utils.types import BaseCommand, CityData
 
+# Dendrograms keyed by (region_id, world_id, alliance_name, min_cities_per_island, data version)
+cached_dendrograms = LRUCache(CLUSTERS_CACHE_SIZE)
+
 
 class CalculateClusters(BaseCommand):
 
     async def command_logic(self):
-        cities_data = fetch_data(f"server={self.region_id}&world={self.world_id}&state=active&search=ally&allies[1]={self.command_params['alliance_name']}")
+        cities_data = await self.world_data.fetch_alliance_cities(self.command_params['alliance_name'])
         if not cities_data:
             raise ValueError(f"alliance '{self.command_params['alliance_name']}' doesn't exist or has no data!")
 
         city_counts = count_cities_per_island(cities_data)
-        filtered_cities_data = self.filter_data_by_min_amount_of_cities_on_island(cities_data, city_counts)
-        city_clusters = self.cluster_cities(filtered_cities_data)
-
-        await self.ctx.response.send_message(embed=calculate_clusters_embed(
+        dendrogram = self.get_dendrogram(cities_data, city_counts)
+
+        await self.send_message(
+            embed=self.cluster_embed(dendrogram, city_counts, self.command_params['max_cluster_distance']),
+            view=ClusterDistanceView(self, dendrogram, city_counts)
+        )
+
+    def get_dendrogram(self, cities_data: list[CityData], city_counts: dict) -> SingleLinkageDendrogram:
+        """Builds the alliance's dendrogram once per snapshot of its cities, any cluster distance is then just a cut"""
+        cache_key = (
+            self.region_id, self.world_id, self.command_params['alliance_name'],
+            self.command_params['min_cities_per_island'], get_cities_data_version(cities_data)
+        )
+
+        dendrogram = cached_dendrograms.get(cache_key)
+        if dendrogram is None:
+            filtered_cities_data = self.filter_data_by_min_amount_of_cities_on_island(cities_data, city_counts)
+            dendrogram = SingleLinkageDendrogram(self.unique_islands(filtered_cities_data))
+            cached_dendrograms.set(cache_key, dendrogram)
+
+        return dendrogram
+
+    def cluster_embed(self, dendrogram: SingleLinkageDendrogram, city_counts: dict, max_cluster_distance: int) -> discord.Embed:
+        city_clusters = dendrogram.cut(max_cluster_distance)
+        return calculate_clusters_embed(
             self.clusters_to_str(city_clusters, city_counts),
-            self.command_params['alliance_name']
-        ))
+            self.command_params['alliance_name'],
+            max_cluster_distance
+        )
 
     def clusters_to_str(self, clusters: list[list[CityData]], city_counts: dict) -> list[str]:
         formatted_clusters = []
@@ -43,44 +71,50 @@ class CalculateClusters(BaseCommand):
 
         return formatted_clusters
 
-    def cluster_cities(self, cities_data: list[CityData]) -> list[list[CityData]]:
-        coord_set = set(city.coords for city in cities_data)
-        visited = set()
-        clusters = []
-
-        # Helper function for depth-first search
-        def depth_first_search(city: CityData, cluster: list):
-            stack = [city]
-            while stack:
-                current_city = stack.pop()
-                if current_city.coords in visited:
-                    continue
-                visited.add(current_city.coords)
-                cluster.append(current_city)
-
-                # Only check relevant neighbors within the given distance
-                for dx, dy in product(range(-self.command_params['max_cluster_distance'],
-                                            self.command_params['max_cluster_distance'] + 1), repeat=2):
-                    if dx == 0 and dy == 0:
-                        continue
-
-                    neighbor_coords = (current_city.coords[0] + dx, current_city.coords[1] + dy)
-                    if neighbor_coords in coord_set and neighbor_coords not in visited:
-                        for neighbor in cities_data:
-                            if neighbor.coords == neighbor_coords:
-                                stack.append(neighbor)
-                                break  # Stop searching once we found the first matching neighbor
-
-        # Start clustering cities
+    @staticmethod
+    def unique_islands(cities_data: list[CityData]) -> list[CityData]:
+        """Keeps a single city per island, in the order the islands first appear"""
+        islands = {}
         for city in cities_data:
-            if city.coords not in visited:
-                cluster = []
-                depth_first_search(city, cluster)
-                if cluster:  # Only add non-empty clusters
-                    clusters.append(cluster)
+            islands.setdefault(city.coords, city)
 
-        return clusters
+        return list(islands.values())
 
     def filter_data_by_min_amount_of_cities_on_island(self, cities_data: list[CityData], city_counts: dict) -> list:
         return [city for city in cities_data if
                 city_counts[city.coords] >= self.command_params['min_cities_per_island']]
+
+
+class ClusterDistanceView(discord.ui.View):
+    """Lets the user who ran the command slide the cluster distance up and down, every change re-cuts the cached dendrogram"""
+
+    def __init__(self, command: CalculateClusters, dendrogram: SingleLinkageDendrogram, city_counts: dict):
+        super().__init__(timeout=300)
+        self.command = command
+        self.dendrogram = dendrogram
+        self.city_counts = city_counts
+        self.max_cluster_distance = command.command_params['max_cluster_distance']
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id == self.command.ctx.user.id:
+            return True
+
+        # noinspection PyUnresolvedReferences
+        await interaction.response.send_message("Only the user who ran the command can change the cluster distance.", ephemeral=True)
+        return False
+
+    async def change_distance(self, interaction: discord.Interaction, change: int):
+        self.max_cluster_distance = max(0, self.max_cluster_distance + change)
+
+        # noinspection PyUnresolvedReferences
+        await interaction.response.edit_message(
+            embed=self.command.cluster_embed(self.dendrogram, self.city_counts, self.max_cluster_distance), view=self
+        )
+
+    @discord.ui.button(label="Distance -1", style=discord.ButtonStyle.secondary)
+    async def decrease_distance(self, interaction: discord.Interaction, _button: discord.ui.Button):
+        await self.change_distance(interaction, -1)
+
+    @discord.ui.button(label="Distance +1", style=discord.ButtonStyle.secondary)
+    async def increase_distance(self, interaction: discord.Interaction, _button: discord.ui.Button):
+        await self.change_distance(interaction, 1)
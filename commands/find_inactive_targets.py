@@ -0,0 +1,36 @@
+import time
+
+from embeds.embeds import inactive_targets_embed
+from utils.constants import TARGET_FINDER_MAX_INACTIVE_HOURS, TARGET_FINDER_MAX_RADIUS
+from utils.general_utils import parse_coords_list
+from utils.types import BaseCommand
+
+
+class FindInactiveTargets(BaseCommand):
+
+    async def command_logic(self):
+        """
+        Finds the cities around the given coords whose owner's score hasn't changed for a while.
+
+        Raises:
+            ValueError: If the coords are invalid or the inactivity period is out of range.
+            ValueError: If there are no snapshots of the world yet, or they don't go back far enough.
+        """
+        coords_list = parse_coords_list(self.command_params['coords'])
+        radius = max(1, min(self.command_params['radius'], TARGET_FINDER_MAX_RADIUS))
+        inactive_hours = self.command_params['inactive_hours']
+
+        if not 1 <= inactive_hours <= TARGET_FINDER_MAX_INACTIVE_HOURS:
+            raise ValueError(f"inactive_hours must be between 1 and {TARGET_FINDER_MAX_INACTIVE_HOURS}!")
+
+        index = await self.world_data.get_inactive_targets_index()
+        if index is None:
+            raise ValueError("no cities of this world were archived yet, use the other commands for a while and try again later!")
+
+        inactive_since = time.time() - inactive_hours * 60 * 60
+        if index.tracked_since > inactive_since:
+            raise ValueError(f"the archive of this world only goes back {int((time.time() - index.tracked_since) // 3600)} hours, "
+                             f"try a shorter inactive_hours!")
+
+        targets = index.find(coords_list, radius, inactive_since)
+        await self.send_message(embed=inactive_targets_embed(targets, coords_list, {**self.command_params, "radius": radius}))
@@ -1,5 +1,4 @@
 from embeds.embeds import find_island_embed
-from utils.data_utils import fetch_data
 from utils.types import BaseCommand
 
 
@@ -20,9 +19,9 @@ class FindIsland(BaseCommand):
             raise ValueError(f"invalid coordinates format: {self.command_params.get('coords')}. Expected format 'X:Y'.")
 
         # Fetch the data of the cities present on the selected island
-        island_cities_data = fetch_data(f"server={self.region_id}&world={self.world_id}&search=city&x={x}&y={y}")
+        island_cities_data = await self.world_data.fetch_island_cities(x, y)
         if not island_cities_data:
             raise ValueError(f"could not find any cities on the island at {x}:{y}!")
 
-        embed = find_island_embed(island_cities_data, self.world_id, self.region_id)
-        await self.ctx.response.send_message(embed=embed)
+        embed = find_island_embed(island_cities_data, await self.world_data.get_island_tiers())
+        await self.send_message(embed=embed)
@@ -1,5 +1,4 @@
 from embeds.embeds import find_player_embed
-from utils.data_utils import fetch_data
 from utils.types import BaseCommand
 
 
@@ -19,11 +18,10 @@ class FindPlayer(BaseCommand):
         if len(player_name) < 3 or len(player_name) > 18:
             raise ValueError(f"a player that goes by the name of '{player_name}' doesn't exist!")
 
-        cities_data = fetch_data(
-            f"server={self.region_id}&world={self.world_id}&state=&search=city&nick={player_name}{f'&ally={alliance_name}' if alliance_name else ''}",
-            self.command_params['player_name']
-        )
+        cities_data = await self.world_data.fetch_player_cities(player_name)
+        if alliance_name:
+            cities_data = [city for city in cities_data if str(getattr(city, 'ally_name', '')).lower() == alliance_name.lower()]
 
         # Sort cities by their coordinates
         cities_data.sort(key=lambda city: (city.coords[0], city.coords[1]))
-        await self.ctx.response.send_message(embed=find_player_embed(cities_data, player_name, self.world_id, self.region_id))
+        await self.send_message(embed=find_player_embed(cities_data, player_name, await self.world_data.get_island_tiers()))
@@ -0,0 +1,91 @@
+import asyncio
+
+from embeds.embeds import frontline_embed
+from utils.general_utils import count_cities_per_island
+from utils.spatial_utils import SpatialGrid
+from utils.tracing import traced
+from utils.types import BaseCommand, CityData
+
+
+class DetectFrontline(BaseCommand):
+
+    async def command_logic(self):
+        """
+        Finds the nearest friendly city for every enemy city, and the islands where both alliances sit close to each other.
+
+        Raises:
+            ValueError: If one of the alliances doesn't exist or has no data.
+        """
+        alliance_name = self.command_params['alliance_name']
+        enemy_alliance_name = self.command_params['enemy_alliance_name']
+
+        friendly_cities, enemy_cities = await asyncio.gather(
+            self.world_data.fetch_alliance_cities(alliance_name), self.world_data.fetch_alliance_cities(enemy_alliance_name)
+        )
+        if not friendly_cities:
+            raise ValueError(f"alliance '{alliance_name}' doesn't exist or has no data!")
+
+        if not enemy_cities:
+            raise ValueError(f"alliance '{enemy_alliance_name}' doesn't exist or has no data!")
+
+        # Cities on the same island are the same distance away, so the grids only need to hold islands
+        friendly_islands = self.group_cities_by_island(friendly_cities)
+        enemy_islands = self.group_cities_by_island(enemy_cities)
+        friendly_grid = SpatialGrid(list(friendly_islands))
+        enemy_grid = SpatialGrid(list(enemy_islands))
+
+        frontline = self.find_nearest_friendly_cities(enemy_cities, friendly_islands, friendly_grid)
+        contested_islands = self.find_contested_islands(friendly_cities, enemy_cities, friendly_grid, enemy_grid)
+
+        await self.send_message(embed=frontline_embed(frontline, contested_islands, self.command_params))
+
+    @staticmethod
+    def group_cities_by_island(cities_data: list[CityData]) -> dict[tuple, list[CityData]]:
+        islands = {}
+        for city in cities_data:
+            islands.setdefault(city.coords, []).append(city)
+
+        return islands
+
+    @staticmethod
+    @traced()
+    def find_nearest_friendly_cities(enemy_cities: list[CityData], friendly_islands: dict[tuple, list[CityData]], friendly_grid: SpatialGrid) -> list[tuple[CityData, CityData, float]]:
+        """Pairs every enemy city with its nearest friendly city, closest pairs first"""
+        nearest_island_cache = {}
+        frontline = []
+
+        for enemy_city in enemy_cities:
+            if enemy_city.coords not in nearest_island_cache:
+                nearest_island_cache[enemy_city.coords] = friendly_grid.nearest(enemy_city.coords)
+
+            island_index, distance = nearest_island_cache[enemy_city.coords]
+            nearest_friendly_city = max(friendly_islands[friendly_grid.points[island_index]], key=lambda city: city.city_level)
+            frontline.append((enemy_city, nearest_friendly_city, distance))
+
+        return sorted(frontline, key=lambda pair: pair[2])
+
+    @traced()
+    def find_contested_islands(self, friendly_cities: list[CityData], enemy_cities: list[CityData], friendly_grid: SpatialGrid,
+                               enemy_grid: SpatialGrid) -> list[tuple[tuple, int, int, float]]:
+        """
+        Finds every island that is held by one alliance while the other alliance sits within the contested distance.
+
+        :return: (island coords, friendly cities on it, enemy cities on it, distance to the closest opposing island), closest first
+        """
+        contested_distance = self.command_params['contested_distance']
+        friendly_counts = count_cities_per_island(friendly_cities)
+        enemy_counts = count_cities_per_island(enemy_cities)
+
+        contested_islands = {}
+        for own_grid, opposing_grid in ((friendly_grid, enemy_grid), (enemy_grid, friendly_grid)):
+            for island_coords in own_grid.points:
+                opposing_islands = opposing_grid.within_radius(island_coords, contested_distance)
+                if opposing_islands:
+                    contested_islands[island_coords] = (
+                        island_coords,
+                        friendly_counts.get(island_coords, 0),
+                        enemy_counts.get(island_coords, 0),
+                        opposing_islands[0][1]
+                    )
+
+        return sorted(contested_islands.values(), key=lambda island: (island[3], -(island[1] + island[2])))
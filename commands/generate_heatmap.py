@@ -0,0 +1,54 @@
+import io
+
+import discord
+
+from embeds.embeds import generate_heatmap_embed
+from utils.cache_utils import LRUCache
+from utils.constants import HEATMAP_CACHE_SIZE, HEATMAP_TILE_SIZE
+from utils.data_utils import get_cities_data_version
+from utils.general_utils import count_cities_per_island
+from utils.image_utils import rasterize_coords, smooth_grid, grid_to_heatmap_rgb, encode_png
+from utils.types import BaseCommand
+
+# Rendered heatmaps keyed by (region_id, world_id, alliance_name, min_cities_on_island, smoothing, data version)
+rendered_heatmaps = LRUCache(HEATMAP_CACHE_SIZE)
+
+
+class GenerateHeatmap(BaseCommand):
+
+    async def command_logic(self):
+        """
+        Renders the density of an alliance's cities across the world map into an image.
+
+        Raises:
+            ValueError: If the alliance doesn't exist or has no data.
+            ValueError: If no island passes the min_cities_on_island filter.
+        """
+        alliance_name = self.command_params['alliance_name']
+        min_cities_on_island = self.command_params['min_cities_on_island']
+        smoothing = max(0, min(self.command_params.get('smoothing', 0), 10))
+
+        cities_data = await self.world_data.fetch_alliance_cities(alliance_name)
+        if not cities_data:
+            raise ValueError(f"alliance '{alliance_name}' doesn't exist or has no data!")
+
+        cache_key = (self.region_id, self.world_id, alliance_name, min_cities_on_island, smoothing, get_cities_data_version(cities_data))
+        heatmap = rendered_heatmaps.get(cache_key)
+
+        if heatmap is None:
+            city_counts = {coords: count for coords, count in count_cities_per_island(cities_data).items() if count >= min_cities_on_island}
+            if not city_counts:
+                raise ValueError(f"alliance '{alliance_name}' has no islands with at least {min_cities_on_island} cities!")
+
+            grid = smooth_grid(rasterize_coords(list(city_counts), list(city_counts.values())), smoothing)
+            hottest_island = max(city_counts.items(), key=lambda island: island[1])
+
+            heatmap = (encode_png(grid_to_heatmap_rgb(grid, HEATMAP_TILE_SIZE)), sum(city_counts.values()), len(city_counts), hottest_island)
+            rendered_heatmaps.set(cache_key, heatmap)
+
+        png_bytes, cities_count, islands_count, hottest_island = heatmap
+
+        await self.send_message(
+            embed=generate_heatmap_embed(alliance_name, cities_count, islands_count, hottest_island, "heatmap.png"),
+            file=discord.File(io.BytesIO(png_bytes), filename="heatmap.png")
+        )
@@ -5,4 +5,4 @@ from utils.types import BaseCommand
 class HelpCommand(BaseCommand):
 
     async def command_logic(self):
-        await self.ctx.response.send_message(embed=help_embed(self.ctx), ephemeral=True)
+        await self.send_message(embed=help_embed(self.ctx), ephemeral=True)
@@ -1,16 +1,20 @@
-from database.guild_settings_manager import get_islands_data
 from embeds.embeds import list_best_islands_embed
-from utils.general_utils import rank_islands
 from utils.types import BaseCommand
 
 
 class ListBestIslands(BaseCommand):
+    cache_results = True
+
+    async def get_data_version(self):
+        return await self.world_data.get_islands_version()
 
     async def command_logic(self):
-        islands_data = get_islands_data(self.world_id, self.region_id)
+        islands_data = await self.world_data.get_islands()
         if not islands_data:
             raise ValueError(
                 f"island data is not available for the {str(self.guild_settings['region']).upper()} {str(self.guild_settings['world']).capitalize()} server. Sorry")
 
-        ranked_islands = rank_islands(islands_data, self.command_params['resource_type'], self.command_params['miracle_type'], self.command_params['no_full_islands'])
-        await self.ctx.response.send_message(embed=list_best_islands_embed(ranked_islands, self.command_params))
+        applicable_count, top_islands = await self.world_data.get_island_leaderboard(
+            str(self.command_params['resource_type']), str(self.command_params['miracle_type']), self.command_params['no_full_islands']
+        )
+        await self.send_response(embed=list_best_islands_embed(top_islands, self.command_params, applicable_count))
@@ -0,0 +1,19 @@
+from embeds.embeds import profiling_status_embed
+from utils.profiling import get_command_profiler
+from utils.types import BaseCommand
+
+
+class ManageProfiling(BaseCommand):
+    async def command_logic(self):
+        profiler = get_command_profiler()
+
+        if self.command_params["sample_rate"] is not None:
+            profiler.sample_rate = self.command_params["sample_rate"]
+
+        command_name = self.command_params["command_name"]
+        if command_name:
+            if command_name not in {command.name for command in self.ctx.client.tree.get_commands()}:
+                raise ValueError(f"There is no '{command_name}' command")
+            profiler.toggle_command(command_name)
+
+        await self.send_message(embed=profiling_status_embed(profiler), ephemeral=True)
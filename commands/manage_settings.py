@@ -1,7 +1,16 @@
-from database.guild_settings_manager import save_settings, update_setting, fetch_or_create_settings, DEFAULT_SETTINGS
+import discord
+
+from database.guild_settings_manager import save_settings, update_setting, fetch_or_create_settings, set_trade_channel, DEFAULT_SETTINGS
 from embeds.embeds import create_embed, show_settings_embed
 from utils.general_utils import str_and_lower
 from utils.types import BaseCommand
+from utils.world_data import attach_guild
+
+
+def reattach_guild(guild: discord.Guild):
+    """Moves the guild over to the data of the world its settings now point at"""
+    settings = fetch_or_create_settings(guild)
+    attach_guild(guild.id, settings['region_id'], settings['world_id'])
 
 
 class UpdateSetting(BaseCommand):
@@ -9,8 +18,9 @@ class UpdateSetting(BaseCommand):
         setting_name = str_and_lower(self.command_params["setting_name"])
         new_value = str_and_lower(self.command_params["new_value"])
         update_setting(self.ctx.guild, setting_name, new_value)
+        reattach_guild(self.ctx.guild)
 
-        await self.ctx.response.send_message(
+        await self.send_message(
             embed=create_embed("Setting Updated Successfully", f"'{setting_name}' has been updated to '{new_value}'"),
             ephemeral=True
         )
@@ -19,13 +29,28 @@ class UpdateSetting(BaseCommand):
 class ShowSettings(BaseCommand):
     async def command_logic(self):
         settings = fetch_or_create_settings(self.ctx.guild)
-        await self.ctx.response.send_message(embed=show_settings_embed(settings), ephemeral=True)
+        await self.send_message(embed=show_settings_embed(settings), ephemeral=True)
 
 
 class ResetSettings(BaseCommand):
     async def command_logic(self):
         save_settings(self.ctx.guild, **DEFAULT_SETTINGS)
-        await self.ctx.response.send_message(
+        reattach_guild(self.ctx.guild)
+        await self.send_message(
             embed=create_embed("Settings have been reset to default", "Use `/show_settings` to see them."),
             ephemeral=True
         )
+
+
+class SetTradeChannel(BaseCommand):
+    async def command_logic(self):
+        channel = self.command_params["channel"]
+        set_trade_channel(self.ctx.guild, channel.id if channel else None)
+
+        await self.send_message(
+            embed=create_embed(
+                "Trade Channel Updated",
+                f"Trade offers are now only picked up in {channel.mention}" if channel else "Trade offers are now picked up in every channel"
+            ),
+            ephemeral=True
+        )
@@ -0,0 +1,86 @@
+import asyncio
+import datetime
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from embeds.embeds import plan_attack_embed
+from utils.constants import PLAN_ATTACK_PLAYERS_PER_PAGE
+from utils.general_utils import parse_coords, parse_landing_time
+from utils.math_utils import get_unit_speed, get_travel_times_matrix
+from utils.tracing import traced
+from utils.types import BaseCommand, CityData, ClosestCitySearchTypes
+
+
+class PlanSynchronizedAttack(BaseCommand):
+
+    async def command_logic(self):
+        """
+        Calculates when every participating city has to send its units so that all waves land at the same time.
+
+        Raises:
+            ValueError: If the target coordinates or landing time are in an invalid format.
+            ValueError: If none of the participants have any cities.
+            ValueError: If the requested page doesn't exist.
+        """
+        target_coords = parse_coords(self.command_params['target_coords'])
+        landing_time = parse_landing_time(self.command_params['landing_time'])
+        cities_data = await self.fetch_participating_cities()
+
+        unit_speed = get_unit_speed(
+            self.command_params['unit_type'],
+            using_oligarchy=self.command_params.get('using_oligarchy', False),
+            using_poseidon=self.command_params.get('using_poseidon', False),
+            sea_chart_level=self.command_params.get('sea_chart_level', 0)
+        )
+
+        # A single (cities x 1) matrix holds the travel time of every participating city
+        travel_times = get_travel_times_matrix([city.coords for city in cities_data], [target_coords], unit_speed)[:, 0]
+        departure_timestamps = landing_time.timestamp() - travel_times * 60
+
+        departures_per_player = self.group_departures_by_player(cities_data, travel_times, departure_timestamps)
+
+        total_pages = math.ceil(len(departures_per_player) / PLAN_ATTACK_PLAYERS_PER_PAGE)
+        page = self.command_params.get('page', 1)
+        if page < 1 or page > total_pages:
+            raise ValueError(f"page {page} doesn't exist, there are only {total_pages} pages of results")
+
+        page_players = list(departures_per_player.items())[(page - 1) * PLAN_ATTACK_PLAYERS_PER_PAGE:page * PLAN_ATTACK_PLAYERS_PER_PAGE]
+        too_late_count = int(np.count_nonzero(departure_timestamps < datetime.datetime.now(datetime.timezone.utc).timestamp()))
+
+        await self.send_message(embed=plan_attack_embed(
+            page_players, self.command_params, target_coords, landing_time, len(cities_data), too_late_count, page, total_pages
+        ))
+
+    async def fetch_participating_cities(self) -> list[CityData]:
+        search_type = self.command_params['search_type']
+        names = [name.strip() for name in self.command_params['names'].split(',') if name.strip()]
+
+        # Every participant is fetched at the same time
+        if search_type == ClosestCitySearchTypes.PLAYER:
+            fetch_cities = self.world_data.fetch_player_cities
+        else:
+            fetch_cities = self.world_data.fetch_alliance_cities
+
+        participants_cities = await asyncio.gather(*(fetch_cities(name) for name in dict.fromkeys(names)))
+        cities_data = [city for participant_cities in participants_cities for city in participant_cities]
+
+        if not cities_data:
+            raise ValueError(f"could not find any cities for {', '.join(names) or 'the participants'}! Are you sure they exist?")
+
+        return cities_data
+
+    @staticmethod
+    @traced()
+    def group_departures_by_player(cities_data: list[CityData], travel_times: np.ndarray, departure_timestamps: np.ndarray) -> dict[str, list[tuple[CityData, float, int]]]:
+        """Groups (city, travel time, departure timestamp) by player, players that need to leave first come first"""
+        departures_per_player = defaultdict(list)
+
+        for city_index in np.argsort(departure_timestamps, kind='stable'):
+            city = cities_data[city_index]
+            departures_per_player[city.player_name].append(
+                (city, float(travel_times[city_index]), int(departure_timestamps[city_index]))
+            )
+
+        return dict(departures_per_player)
@@ -0,0 +1,30 @@
+from embeds.embeds import search_islands_embed
+from utils.constants import ISLAND_SEARCH_MAX_RADIUS
+from utils.general_utils import parse_coords
+from utils.types import BaseCommand
+
+
+class SearchIslands(BaseCommand):
+
+    async def command_logic(self):
+        """
+        Finds the islands around the coords that pass the requested filters, closest first.
+
+        Raises:
+            ValueError: If the coordinates provided are in an invalid format.
+            ValueError: If there is no island data for the world.
+        """
+        coords = parse_coords(self.command_params['coords'])
+        radius = max(1, min(self.command_params['radius'], ISLAND_SEARCH_MAX_RADIUS))
+        resource_type = self.command_params.get('resource_type')
+        miracle_type = self.command_params.get('miracle_type')
+
+        if not await self.world_data.get_islands():
+            raise ValueError(
+                f"island data is not available for the {str(self.guild_settings['region']).upper()} {str(self.guild_settings['world']).capitalize()} server. Sorry")
+
+        islands = (await self.world_data.get_island_search_index()).search(
+            coords, radius, self.command_params['min_free_spots'],
+            str(resource_type) if resource_type else None, str(miracle_type) if miracle_type else None
+        )
+        await self.send_message(embed=search_islands_embed(islands, coords, {**self.command_params, "radius": radius}))
@@ -0,0 +1,66 @@
+import math
+
+import numpy as np
+
+from embeds.embeds import travel_time_matrix_embed
+from utils.constants import TRAVEL_TIME_MATRIX_PAGE_SIZE
+from utils.general_utils import parse_coords_list
+from utils.math_utils import get_unit_speed, get_travel_times_matrix
+from utils.types import BaseCommand, CityData, ClosestCitySearchTypes
+
+
+class CalculateTravelTimeMatrix(BaseCommand):
+
+    async def command_logic(self):
+        """
+        Calculates the travel time from every city of a player/alliance to every target in a single pass.
+
+        Raises:
+            ValueError: If the target coordinates are in an invalid format.
+            ValueError: If the player/alliance has no cities.
+            ValueError: If the requested page doesn't exist.
+        """
+        target_coords = parse_coords_list(self.command_params['target_coords'])
+        source_cities = await self.fetch_source_cities()
+
+        unit_speed = get_unit_speed(
+            self.command_params['unit_type'],
+            using_oligarchy=self.command_params.get('using_oligarchy', False),
+            using_poseidon=self.command_params.get('using_poseidon', False),
+            sea_chart_level=self.command_params.get('sea_chart_level', 0)
+        )
+        travel_times = get_travel_times_matrix([city.coords for city in source_cities], target_coords, unit_speed)
+
+        # Sort every (source, target) pair by its travel time, fastest first
+        sorted_pairs = np.argsort(travel_times, axis=None, kind='stable')
+
+        total_pages = math.ceil(sorted_pairs.size / TRAVEL_TIME_MATRIX_PAGE_SIZE)
+        page = self.command_params.get('page', 1)
+        if page < 1 or page > total_pages:
+            raise ValueError(f"page {page} doesn't exist, there are only {total_pages} pages of results")
+
+        page_pairs = sorted_pairs[(page - 1) * TRAVEL_TIME_MATRIX_PAGE_SIZE:page * TRAVEL_TIME_MATRIX_PAGE_SIZE]
+        source_indexes, target_indexes = np.unravel_index(page_pairs, travel_times.shape)
+
+        rows = [
+            (source_cities[source_index], target_coords[target_index], float(travel_times[source_index, target_index]))
+            for source_index, target_index in zip(source_indexes, target_indexes)
+        ]
+
+        await self.send_message(embed=travel_time_matrix_embed(
+            rows, self.command_params, unit_speed, len(source_cities), len(target_coords), page, total_pages
+        ))
+
+    async def fetch_source_cities(self) -> list[CityData]:
+        search_type = self.command_params['search_type']
+        name = self.command_params['name']
+
+        if search_type == ClosestCitySearchTypes.PLAYER:
+            cities_data = await self.world_data.fetch_player_cities(name)
+        else:
+            cities_data = await self.world_data.fetch_alliance_cities(name)
+
+        if not cities_data:
+            raise ValueError(f"could not fetch cities data for {str(search_type.value).lower()} {name}! Are you sure it exists?")
+
+        return cities_data
@@ -0,0 +1,79 @@
+"""
+Fails when a hot query of the bot would scan a whole table instead of using an index.
+Runs against an in-memory copy of the database with every migration applied, the database file itself is never changed.
+
+Usage: python -m database.check_query_plans
+"""
+import sqlite3
+import sys
+
+from database.migrations import BOT_ENVS, apply_migrations
+from utils.constants import DATABASE_PATH
+
+# (name, query) of every query that runs on each command or message, keep them in sync with the queries in the code
+HOT_QUERIES: list[tuple[str, str]] = [
+    ("load_islands_data", "SELECT * FROM islands_data WHERE region_id = 2 AND world_id = 57"),
+    ("load_island_leaderboards", """
+        SELECT * FROM islands_leaderboards
+        WHERE region_id = 2 AND world_id = 57
+        ORDER BY resource_type, wonder_type, no_full_islands, position
+    """),
+] + [
+    query
+    for env in BOT_ENVS
+    for query in (
+        (f"fetch_settings ({env})", f"SELECT * FROM {env}_guild_settings WHERE guild_id = 1"),
+        (f"load_settings ({env})", f"SELECT * FROM {env}_guild_settings WHERE guild_id IN ('1', '2')"),
+        (f"purge_expired_trades ({env})", f"DELETE FROM {env}_trades_history WHERE proposal_time < datetime('now', '-1 day')"),
+        (f"match_trade_offer ({env})", f"""
+            SELECT * FROM {env}_trades_history
+            WHERE proposal_time >= datetime('now', '-1 day')
+                AND guild_id = 1
+                AND proposer_id != 2
+                AND (have = 'wine' AND want = 'marble')
+        """),
+    )
+]
+
+
+def get_query_plan(conn: sqlite3.Connection, query: str) -> list[str]:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}")]
+
+
+def is_full_scan(plan_step: str) -> bool:
+    """Scanning a covering index reads every entry but never touches the table, anything else that scans is a full scan"""
+    return (plan_step.startswith("SCAN") and "COVERING INDEX" not in plan_step) or "USE TEMP B-TREE" in plan_step
+
+
+def check_query_plans(conn: sqlite3.Connection) -> list[str]:
+    """Returns a description of every hot query that doesn't use an index, empty when they all do"""
+    failures = []
+    for name, query in HOT_QUERIES:
+        plan = get_query_plan(conn, query)
+        if any(is_full_scan(plan_step) for plan_step in plan):
+            failures.append(f"{name}: {' | '.join(plan)}")
+
+    return failures
+
+
+def main() -> int:
+    conn = sqlite3.connect(':memory:')
+    with sqlite3.connect(DATABASE_PATH) as database_file:
+        database_file.backup(conn)
+
+    schema_version = apply_migrations(conn)
+    failures = check_query_plans(conn)
+    conn.close()
+
+    if failures:
+        print(f"{len(failures)} hot queries scan whole tables at schema version {schema_version}:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+
+    print(f"All {len(HOT_QUERIES)} hot queries use indexes at schema version {schema_version}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
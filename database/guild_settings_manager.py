@@ -1,15 +1,30 @@
-import os
+import logging
 import sqlite3
+import time
 
 import discord
 
-from utils.constants import BOT_ENV, BASE_DIR
+from database.migrations import apply_migrations
+from utils.constants import BOT_ENV, DATABASE_PATH, ISLANDS_DATA_CACHE_SECONDS, ISLAND_LEADERBOARD_SIZE
+from utils.cache_backends import SharedCache
 from utils.constants import DEFAULT_SETTINGS_FILE_PATH
 from utils.data_utils import load_json_file
+from utils.general_utils import assign_island_tiers, build_island_leaderboards
+from utils.island_scoring import DEFAULT_SCORING_WEIGHTS
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
 
 SETTINGS_TABLE_NAME = f'{BOT_ENV}_guild_settings'
+ISLAND_LEADERBOARDS_TABLE_NAME = 'islands_leaderboards'
 DEFAULT_SETTINGS = load_json_file(DEFAULT_SETTINGS_FILE_PATH)
 
+# guild_id -> settings, spares a db round trip for every command and every autocomplete keystroke
+settings_cache: dict[int, dict] = {}
+
+# "region_id:world_id" -> (islands data, time it was loaded at), the islands loaded by any bot process sharing the cache
+shared_islands_cache = SharedCache("islands", ISLANDS_DATA_CACHE_SECONDS)
+
 
 def get_value_from_mappings(region_name: str, region_mapping: dict):
     if region_name not in region_mapping:
@@ -20,12 +35,44 @@ def get_value_from_mappings(region_name: str, region_mapping: dict):
 
 def get_connection():
     """Establish a connection to the SQLite database."""
-    conn = sqlite3.connect(os.path.join(BASE_DIR, 'database', 'guild_settings.sqlite'))
+    conn = sqlite3.connect(DATABASE_PATH)
     conn.row_factory = sqlite3.Row
 
     return conn
 
 
+def migrate_database():
+    """Brings the database schema (tables and indexes) up to date, runs once when the bot starts."""
+    conn = get_connection()
+    try:
+        apply_migrations(conn)
+    finally:
+        conn.close()
+
+
+def run_many(query: str, rows: list[tuple]):
+    """Executes a parameterized query once for every row, all in a single transaction."""
+    conn = get_connection()
+    try:
+        logger.debug("Running query for %d rows: %s", len(rows), query)
+        with span("sqlite.run_many", statement=query, rows=len(rows)), conn:
+            conn.executemany(query, rows)
+    finally:
+        conn.close()
+
+
+def run_batches(batches: list[tuple[str, list[tuple]]]):
+    """Executes every (parameterized query, rows) batch in a single transaction, either every batch is applied or none."""
+    conn = get_connection()
+    try:
+        with span("sqlite.run_batches", batches=len(batches)), conn:
+            for query, rows in batches:
+                logger.debug("Running query for %d rows: %s", len(rows), query)
+                conn.executemany(query, rows)
+    finally:
+        conn.close()
+
+
 def get_table(name: str) -> list[dict]:
     """Fetch settings for a specific guild from the database."""
 
@@ -40,42 +87,128 @@ def is_table_exist(table_name: str) -> bool:
     return result is not None
 
 
-def run_query(query: str) -> list[dict]:
-    """Executes a query on the db and returns the results."""
+def run_query(query: str, params: tuple = ()) -> list[dict]:
+    """Executes a query on the db and returns the results, params fill the query's '?' placeholders."""
     conn = get_connection()
     cursor = conn.cursor()
 
-    print("Running query:", query)
-    cursor.execute(query)
+    logger.debug("Running query: %s", query)
+    with span("sqlite.run_query", statement=query):
+        cursor.execute(query, params)
 
-    # Commit the transaction if it modifies the database (e.g., UPDATE, INSERT, DELETE)
-    if query.strip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
-        conn.commit()
-        return []
+        # Commit the transaction if it modifies the database (e.g., UPDATE, INSERT, DELETE)
+        if query.strip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
+            conn.commit()
+            return []
 
-    result = cursor.fetchall()
+        result = cursor.fetchall()
     conn.close()
 
     return [dict(row) for row in result]
 
 
-def get_islands_data(world_id: int, region_id: int) -> list[dict]:
-    """Fetch all islands from the world map."""
+def load_islands_data(world_id: int, region_id: int, loaded_after: float = None) -> tuple[list[dict], float]:
+    """
+    Load all islands of the world map, along with the time they were loaded at. Another bot process sharing the cache
+    may have loaded a newer copy than the caller's (loaded at loaded_after) already, it is taken as is, otherwise the
+    islands are loaded from the database. The world's WorldData keeps them in memory.
+    """
+    shared = shared_islands_cache.get(f"{region_id}:{world_id}") if shared_islands_cache.is_shared else None
+    if shared is not None and (loaded_after is None or shared[1] > loaded_after):
+        return shared[0], shared[1]
+
     # Add subquery for cities_data to get each islands city based on foregin key
-    return run_query(f"""
+    islands_data = run_query(f"""
         SELECT * FROM islands_data
         WHERE 
             region_id = {region_id} 
             AND world_id = {world_id}
     """)
 
+    assign_island_tiers(islands_data)
+    loaded_at = time.time()
+    if shared_islands_cache.is_shared:
+        shared_islands_cache.set(f"{region_id}:{world_id}", (islands_data, loaded_at))
+
+    return islands_data, loaded_at
+
+
+def invalidate_islands_data():
+    """Makes every bot process sharing the cache reload the islands of every world, once the islands data changed."""
+    shared_islands_cache.invalidate()
+
+
+def get_islands_source_version(islands_data: list[dict]) -> str:
+    """Identifies the islands data and scoring weights that leaderboards were computed from"""
+    return f"{max((str(island['date_fetched']) for island in islands_data), default='')}|{len(islands_data)}|{DEFAULT_SCORING_WEIGHTS.get_version()}"
+
+
+def get_or_build_island_leaderboards(world_id: int, region_id: int, islands_data: list[dict]) -> dict:
+    """Loads the world's leaderboards from the db, they are only recomputed when the islands data changed since."""
+    source_version = get_islands_source_version(islands_data)
+
+    leaderboards = load_island_leaderboards(world_id, region_id, islands_data, source_version)
+    if leaderboards is None:
+        leaderboards = build_island_leaderboards(islands_data, ISLAND_LEADERBOARD_SIZE)
+        save_island_leaderboards(world_id, region_id, leaderboards, source_version)
+
+    return leaderboards
+
+
+def load_island_leaderboards(world_id: int, region_id: int, islands_data: list[dict], source_version: str) -> dict | None:
+    """Returns the stored leaderboards, None if there are none or they were computed from different islands data."""
+    rows = run_query(f"""
+        SELECT * FROM {ISLAND_LEADERBOARDS_TABLE_NAME}
+        WHERE region_id = {region_id} AND world_id = {world_id}
+        ORDER BY resource_type, wonder_type, no_full_islands, position
+    """)
+
+    if not rows or any(row['source_version'] != source_version for row in rows):
+        return None
+
+    islands_by_coords = {(island['x'], island['y']): island for island in islands_data}
+    leaderboards = {}
+    for row in rows:
+        island = islands_by_coords.get((row['x'], row['y']))
+        if island is None:
+            return None
+
+        key = (row['resource_type'], row['wonder_type'], bool(row['no_full_islands']))
+        leaderboards.setdefault(key, (row['applicable_count'], []))[1].append((island, row['score']))
+
+    return leaderboards
+
+
+def save_island_leaderboards(world_id: int, region_id: int, leaderboards: dict, source_version: str):
+    run_query(f"DELETE FROM {ISLAND_LEADERBOARDS_TABLE_NAME} WHERE region_id = {region_id} AND world_id = {world_id}")
+    run_many(
+        f"INSERT INTO {ISLAND_LEADERBOARDS_TABLE_NAME} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (region_id, world_id, resource_type, wonder_type, int(no_full_islands), position, island['x'], island['y'], score, applicable_count, source_version)
+            for (resource_type, wonder_type, no_full_islands), (applicable_count, top_islands) in leaderboards.items()
+            for position, (island, score) in enumerate(top_islands)
+        ]
+    )
+
 
 def fetch_settings(guild: discord.Guild) -> dict:
     """Fetch settings for a specific guild from the database."""
+    if guild.id in settings_cache:
+        return settings_cache[guild.id]
+
     results = run_query(f"""SELECT * FROM {SETTINGS_TABLE_NAME} WHERE guild_id = {guild.id}""")
+    if results:
+        settings_cache[guild.id] = results[0]
+
     return results[0] if results else {}
 
 
+def reload_settings(guild: discord.Guild) -> dict:
+    """Re-reads the guild's settings after they changed, the trade matcher only ever reads the cached copy"""
+    settings_cache.pop(guild.id, None)
+    return fetch_settings(guild)
+
+
 def update_setting(guild: discord.Guild, column_name: str, new_value: str):
     """Update a specific guild setting in the database."""
 
@@ -103,11 +236,11 @@ def update_setting(guild: discord.Guild, column_name: str, new_value: str):
             {column_name}_id = {value_id}
         WHERE guild_id = {guild.id}
     """)
+    reload_settings(guild)
 
 
 def save_settings(guild: discord.Guild, world, region, world_id, region_id):
-    """Save or update guild settings in the database."""
-
+    """Save or update guild settings in the database, which also routes the guild's trade offers to every channel again."""
     run_query(f"""
         INSERT INTO {SETTINGS_TABLE_NAME} (guild_id, guild_name, world, region, world_id, region_id)
         VALUES ({guild.id}, '{guild.name}', '{world}', '{region}', {world_id}, {region_id})
@@ -117,8 +250,16 @@ def save_settings(guild: discord.Guild, world, region, world_id, region_id):
             world = excluded.world,
             region = excluded.region,
             world_id = excluded.world_id,
-            region_id = excluded.region_id;
+            region_id = excluded.region_id,
+            trade_channel_id = NULL;
     """)
+    reload_settings(guild)
+
+
+def set_trade_channel(guild: discord.Guild, channel_id: int | None):
+    """Route the guild's trade offers to a single channel, or to every channel when channel_id is None."""
+    run_query(f"""UPDATE {SETTINGS_TABLE_NAME} SET trade_channel_id = ? WHERE guild_id = {guild.id}""", (channel_id,))
+    reload_settings(guild)
 
 
 def fetch_or_create_settings(guild: discord.Guild) -> dict:
@@ -126,11 +267,46 @@ def fetch_or_create_settings(guild: discord.Guild) -> dict:
 
     if not settings:
         # Initialize guild settings if missing
-        save_settings(guild, **DEFAULT_SETTINGS)
+        create_default_settings([guild])
         settings = fetch_settings(guild)
 
     return settings
 
 
+def load_settings(guild_ids: list[int] = None) -> dict[int, dict]:
+    """Fetch the settings of the given guilds (or of every guild) in a single query and keep them in the settings cache."""
+    if guild_ids is not None and not guild_ids:
+        return {}
+
+    if guild_ids is None:
+        results = run_query(f"""SELECT * FROM {SETTINGS_TABLE_NAME}""")
+    else:
+        results = run_query(
+            f"""SELECT * FROM {SETTINGS_TABLE_NAME} WHERE guild_id IN ({', '.join('?' * len(guild_ids))})""",
+            tuple(str(guild_id) for guild_id in guild_ids)
+        )
+
+    all_settings = {int(settings['guild_id']): settings for settings in results}
+    settings_cache.update(all_settings)
+
+    return all_settings
+
+
+def create_default_settings(guilds: list[discord.Guild]):
+    """Save the default settings of every guild in a single transaction, guilds that already have settings keep them."""
+    run_many(
+        f"""
+            INSERT INTO {SETTINGS_TABLE_NAME} (guild_id, guild_name, world, region, world_id, region_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(guild_id) DO NOTHING
+        """,
+        [
+            (str(guild.id), guild.name, DEFAULT_SETTINGS['world'], DEFAULT_SETTINGS['region'], DEFAULT_SETTINGS['world_id'], DEFAULT_SETTINGS['region_id'])
+            for guild in guilds
+        ]
+    )
+
+
+migrate_database()
 REGION_MAPPINGS = get_table('regions')
 WORLD_MAPPINGS = get_table('worlds')
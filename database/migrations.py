@@ -0,0 +1,134 @@
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# Both environments share the same database file, so every migration covers the tables of both
+BOT_ENVS = ('dev', 'prod')
+
+# Every migration is a (description, statements) pair, its version is its position in the list (starting at 1).
+# Applied migrations must never be edited, add a new migration instead.
+MIGRATIONS: list[tuple[str, list[str]]] = [
+    (
+        "Index the islands of every world, get_islands_data loads a single world at a time",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_islands_data_world ON islands_data (region_id, world_id)",
+        ]
+    ),
+    (
+        "Index trade offers the way find_matching_trades looks them up",
+        [
+            f"""CREATE INDEX IF NOT EXISTS idx_{env}_trades_match
+                ON {env}_trades_history (guild_id, have, want, proposal_time, proposer_id)"""
+            for env in BOT_ENVS
+        ]
+    ),
+    (
+        "Replace the duplicated guild_id indexes (the primary key already indexes it) with a covering index of the configured worlds",
+        [
+            statement
+            for env in BOT_ENVS
+            for statement in (
+                f"DROP INDEX IF EXISTS idx_{env}_guild_id",
+                f"CREATE INDEX IF NOT EXISTS idx_{env}_guild_settings_world ON {env}_guild_settings (region_id, world_id)",
+            )
+        ]
+    ),
+    (
+        "Store the precomputed list_best_islands leaderboards",
+        [
+            """CREATE TABLE IF NOT EXISTS islands_leaderboards (
+                region_id INTEGER NOT NULL,
+                world_id INTEGER NOT NULL,
+                resource_type TEXT NOT NULL,
+                wonder_type TEXT NOT NULL,
+                no_full_islands INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                score INTEGER NOT NULL,
+                applicable_count INTEGER NOT NULL,
+                source_version TEXT NOT NULL,
+                PRIMARY KEY (region_id, world_id, resource_type, wonder_type, no_full_islands, position)
+            )""",
+        ]
+    ),
+    (
+        "Store the delta-encoded city snapshots of every world: the level, score, alliance and last observation of every city",
+        [
+            """CREATE TABLE IF NOT EXISTS city_snapshots (
+                region_id INTEGER NOT NULL,
+                world_id INTEGER NOT NULL,
+                snapshot_id INTEGER NOT NULL,
+                taken_at REAL NOT NULL,
+                is_keyframe INTEGER NOT NULL,
+                cities_count INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (region_id, world_id, snapshot_id)
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_city_snapshots_time ON city_snapshots (region_id, world_id, taken_at)",
+            """CREATE TABLE IF NOT EXISTS city_snapshot_cities (
+                region_id INTEGER NOT NULL,
+                world_id INTEGER NOT NULL,
+                city_id INTEGER NOT NULL,
+                player_name TEXT NOT NULL,
+                city_name TEXT NOT NULL,
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                PRIMARY KEY (region_id, world_id, city_id)
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_city_snapshot_cities_player ON city_snapshot_cities (region_id, world_id, player_name COLLATE NOCASE)",
+            """CREATE TABLE IF NOT EXISTS city_snapshot_alliances (
+                region_id INTEGER NOT NULL,
+                world_id INTEGER NOT NULL,
+                alliance_id INTEGER NOT NULL,
+                alliance_name TEXT NOT NULL,
+                PRIMARY KEY (region_id, world_id, alliance_id)
+            )""",
+        ]
+    ),
+    (
+        "Let guilds route trade offers to a single channel, and index trade offers by age to purge the expired ones",
+        [
+            statement
+            for env in BOT_ENVS
+            for statement in (
+                f"ALTER TABLE {env}_guild_settings ADD COLUMN trade_channel_id INTEGER",
+                f"CREATE INDEX IF NOT EXISTS idx_{env}_trades_time ON {env}_trades_history (proposal_time)",
+            )
+        ]
+    ),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Applies every migration the database hasn't seen yet, in order. Each migration runs in its own transaction
+    together with the bump of the schema version, so a failed migration leaves the database at the previous version.
+
+    :return: the schema version of the database after migrating
+    """
+    schema_version = get_schema_version(conn)
+
+    for version, (description, statements) in enumerate(MIGRATIONS, start=1):
+        if version <= schema_version:
+            continue
+
+        logger.info(f"Applying migration {version}: {description}")
+        try:
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+        schema_version = version
+
+    return schema_version
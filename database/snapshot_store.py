@@ -0,0 +1,185 @@
+from database.guild_settings_manager import run_query, run_batches
+from utils.snapshot_archive import SNAPSHOT_COLUMNS, SnapshotRecord, WorldSnapshotArchive, apply_snapshot
+
+
+def save_snapshot(region_id: int, world_id: int, record: SnapshotRecord):
+    """Appends the snapshot to the archive, along with the cities and alliances it saw for the first time, all or nothing"""
+    run_batches([
+        (
+            "INSERT INTO city_snapshot_cities VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(region_id, world_id, city_id, *city_key) for city_id, city_key in record.new_cities]
+        ),
+        (
+            "INSERT INTO city_snapshot_alliances VALUES (?, ?, ?, ?)",
+            [(region_id, world_id, alliance_id, alliance_name) for alliance_id, alliance_name in record.new_alliances]
+        ),
+        (
+            "INSERT INTO city_snapshots VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(region_id, world_id, record.snapshot_id, record.taken_at, int(record.is_keyframe), record.cities_count, record.payload)]
+        ),
+    ])
+
+
+def get_snapshots(region_id: int, world_id: int, start_time: float = None, end_time: float = None) -> list[dict]:
+    """The id, time and size of every snapshot taken between start_time and end_time (both optional), oldest first"""
+    return run_query(f"""
+        SELECT snapshot_id, taken_at, is_keyframe, cities_count FROM city_snapshots
+        WHERE region_id = {region_id} AND world_id = {world_id}
+            AND taken_at >= ? AND taken_at <= ?
+        ORDER BY taken_at
+    """, (start_time if start_time is not None else float('-inf'), end_time if end_time is not None else float('inf')))
+
+
+def load_payloads(region_id: int, world_id: int, to_snapshot_id: int, from_snapshot_id: int = None) -> list[dict]:
+    """
+    The payloads needed to reconstruct every snapshot from from_snapshot_id (defaults to to_snapshot_id)
+    up to to_snapshot_id: the keyframe preceding from_snapshot_id and every snapshot after it.
+    """
+    from_snapshot_id = from_snapshot_id or to_snapshot_id
+    return run_query(f"""
+        SELECT snapshot_id, taken_at, is_keyframe, payload FROM city_snapshots
+        WHERE region_id = {region_id} AND world_id = {world_id}
+            AND snapshot_id <= {to_snapshot_id}
+            AND snapshot_id >= (
+                SELECT COALESCE(MAX(snapshot_id), 0) FROM city_snapshots
+                WHERE region_id = {region_id} AND world_id = {world_id} AND is_keyframe = 1 AND snapshot_id <= {from_snapshot_id}
+            )
+        ORDER BY snapshot_id
+    """)
+
+
+def reconstruct_state(payloads: list[dict], city_ids: set[int] = None) -> dict[int, tuple]:
+    state = {}
+    for snapshot in payloads:
+        if snapshot['is_keyframe']:
+            state = {}
+        apply_snapshot(state, snapshot['payload'], city_ids)
+
+    return state
+
+
+def get_city_keys(region_id: int, world_id: int, player_name: str = None) -> dict[int, tuple]:
+    """city id -> (player_name, city_name, x, y) of every archived city, or only of the player's cities"""
+    rows = run_query(f"""
+        SELECT city_id, player_name, city_name, x, y FROM city_snapshot_cities
+        WHERE region_id = {region_id} AND world_id = {world_id}
+            {"AND player_name = ? COLLATE NOCASE" if player_name is not None else ""}
+    """, (player_name,) if player_name is not None else ())
+
+    return {row['city_id']: (row['player_name'], row['city_name'], row['x'], row['y']) for row in rows}
+
+
+def get_alliance_names(region_id: int, world_id: int) -> dict[int, str]:
+    rows = run_query(f"SELECT alliance_id, alliance_name FROM city_snapshot_alliances WHERE region_id = {region_id} AND world_id = {world_id}")
+    return {row['alliance_id']: row['alliance_name'] for row in rows}
+
+
+def state_to_cities(state: dict[int, tuple], city_keys: dict[int, tuple], alliance_names: dict[int, str]) -> list[dict]:
+    cities = []
+    for city_id, values in state.items():
+        player_name, city_name, x, y = city_keys[city_id]
+        city = dict(zip(SNAPSHOT_COLUMNS, values))
+        city.update(player_name=player_name, city_name=city_name, x=x, y=y, ally_name=alliance_names.get(city.pop('alliance_id'), ''))
+        cities.append(city)
+
+    return cities
+
+
+def restore_snapshot_archive(region_id: int, world_id: int, archive: WorldSnapshotArchive):
+    """Loads the latest snapshot of the world into the archive, so the next snapshot continues where the last run stopped"""
+    latest = run_query(f"""
+        SELECT snapshot_id FROM city_snapshots
+        WHERE region_id = {region_id} AND world_id = {world_id}
+        ORDER BY snapshot_id DESC LIMIT 1
+    """)
+    if not latest:
+        archive.restore({}, {}, {}, 0, 0)
+        return
+
+    payloads = load_payloads(region_id, world_id, latest[0]['snapshot_id'])
+    archive.restore(
+        get_city_keys(region_id, world_id),
+        get_alliance_names(region_id, world_id),
+        reconstruct_state(payloads),
+        latest[0]['snapshot_id'],
+        len(payloads) - 1
+    )
+
+
+def get_world_snapshot(region_id: int, world_id: int, at_time: float) -> list[dict]:
+    """Every city of the world as it was archived in the last snapshot taken at or before at_time"""
+    snapshots = get_snapshots(region_id, world_id, end_time=at_time)
+    if not snapshots:
+        return []
+
+    state = reconstruct_state(load_payloads(region_id, world_id, snapshots[-1]['snapshot_id']))
+    return state_to_cities(state, get_city_keys(region_id, world_id), get_alliance_names(region_id, world_id))
+
+
+def get_player_history(region_id: int, world_id: int, player_name: str, start_time: float, end_time: float) -> list[tuple[float, list[dict]]]:
+    """
+    The player's cities in every snapshot taken between start_time and end_time, as (time taken at, cities).
+    Only the player's cities are reconstructed, the rest of every snapshot is skipped while decoding.
+    """
+    city_keys = get_city_keys(region_id, world_id, player_name)
+    snapshots = get_snapshots(region_id, world_id, start_time, end_time)
+    if not city_keys or not snapshots:
+        return []
+
+    alliance_names = get_alliance_names(region_id, world_id)
+    first_snapshot_id = snapshots[0]['snapshot_id']
+    payloads = load_payloads(region_id, world_id, snapshots[-1]['snapshot_id'], first_snapshot_id)
+
+    # Replays from the keyframe preceding the time range, but only records the snapshots within it
+    history, state = [], {}
+    for snapshot in payloads:
+        if snapshot['is_keyframe']:
+            state = {}
+        apply_snapshot(state, snapshot['payload'], set(city_keys))
+
+        if snapshot['snapshot_id'] >= first_snapshot_id:
+            history.append((snapshot['taken_at'], state_to_cities(state, city_keys, alliance_names)))
+
+    return history
+
+
+def get_latest_snapshot_id(region_id: int, world_id: int) -> int:
+    latest = run_query(f"SELECT MAX(snapshot_id) AS snapshot_id FROM city_snapshots WHERE region_id = {region_id} AND world_id = {world_id}")
+    return latest[0]['snapshot_id'] or 0
+
+
+def get_player_activity(region_id: int, world_id: int, since_time: float) -> tuple[list[dict], dict[str, float], float] | None:
+    """
+    Replays the snapshots since since_time to find out when the score of every player last changed.
+    Scores are only compared when a city was observed again, the observed_at of the returned cities tells how
+    recent the last comparison of their player is.
+
+    :return: (the cities of the latest snapshot, lowercase player name -> time its score last changed, time the replay
+        started at), players that never changed during the replay get the start time. None if there are no snapshots.
+    """
+    latest_snapshot_id = get_latest_snapshot_id(region_id, world_id)
+    if not latest_snapshot_id:
+        return None
+
+    # Without snapshots since since_time there is nothing to compare, the latest snapshot is all we can tell
+    snapshots = get_snapshots(region_id, world_id, start_time=since_time)
+    first_snapshot_id = snapshots[0]['snapshot_id'] if snapshots else latest_snapshot_id
+
+    city_keys = get_city_keys(region_id, world_id)
+    score_column = SNAPSHOT_COLUMNS.index('player_score')
+    payloads = load_payloads(region_id, world_id, latest_snapshot_id, first_snapshot_id)
+
+    state, last_score_change = {}, {}
+    for snapshot in payloads:
+        if snapshot['is_keyframe']:
+            # A keyframe holds every city as if it were new, compare it to the state it replaces instead
+            previous_state, state = state, {}
+            changes = [(city_id, previous_state.get(city_id)) for city_id, _ in apply_snapshot(state, snapshot['payload'])]
+        else:
+            changes = apply_snapshot(state, snapshot['payload'])
+
+        for city_id, previous_values in changes:
+            if previous_values is None or previous_values[score_column] != state[city_id][score_column]:
+                last_score_change[city_keys[city_id][0].lower()] = snapshot['taken_at']
+
+    return state_to_cities(state, city_keys, get_alliance_names(region_id, world_id)), last_score_change, payloads[0]['taken_at']
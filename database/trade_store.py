@@ -0,0 +1,42 @@
+from database.guild_settings_manager import get_connection
+from utils.constants import BOT_ENV
+
+TRADES_TABLE_NAME = f'{BOT_ENV}_trades_history'
+
+
+def match_or_save_trade_offers(offers: list[tuple[int, int, str, str]]) -> list[list[dict]]:
+    """
+    Matches every (guild_id, proposer_id, have, want) offer, in order, against the offers of the last day, all in a
+    single transaction. A matched offer concludes the offers it matched (they are deleted), an offer without a match
+    is saved so a later offer can match it, even one of the same batch. Expired offers are purged along the way.
+
+    :return: the offers that every offer matched
+    """
+    conn = get_connection()
+    try:
+        with conn:
+            conn.execute(f"DELETE FROM {TRADES_TABLE_NAME} WHERE proposal_time < datetime('now', '-1 day')")
+
+            all_matches = []
+            for guild_id, proposer_id, have, want in offers:
+                matches = [dict(row) for row in conn.execute(f"""
+                    SELECT * FROM {TRADES_TABLE_NAME}
+                    WHERE proposal_time >= datetime('now', '-1 day')
+                        AND guild_id = ?
+                        AND proposer_id != ?
+                        AND (have = ? AND want = ?)
+                """, (guild_id, proposer_id, want, have))]
+
+                if matches:
+                    conn.executemany(f"DELETE FROM {TRADES_TABLE_NAME} WHERE trade_id = ?", [(trade['trade_id'],) for trade in matches])
+                else:
+                    conn.execute(
+                        f"INSERT INTO {TRADES_TABLE_NAME} (guild_id, proposer_id, have, want) VALUES (?, ?, ?, ?)",
+                        (guild_id, proposer_id, have, want)
+                    )
+
+                all_matches.append(matches)
+    finally:
+        conn.close()
+
+    return all_matches
@@ -1,13 +1,19 @@
+import datetime
+import time
+
 import discord
 from table2ascii import table2ascii as t2a, PresetStyle, Alignment
 
-from database.guild_settings_manager import get_islands_data
 from embeds.embeds_helpers import create_embed, city_to_ascii_table_row, get_island_residents_info_embed
-from utils.general_utils import truncate_string, get_island_tier, coords_to_string, collect_island_data, get_amount_of_open_spots
+from utils.constants import PLAN_ATTACK_CITIES_PER_PLAYER, FRONTLINE_ROWS, TARGET_FINDER_ROWS, ISLAND_SEARCH_ROWS, e_very_outraged
+from utils.general_utils import truncate_string, get_island_tier, coords_to_string, collect_island_data, get_amount_of_open_spots, format_travel_time
+from utils.profiling import CommandProfiler
+from utils.tracing import traced
 from utils.types import CityData, UnitType
 
 
-def calculate_clusters_embed(clusters_as_str: list[str], alliance_name: str) -> discord.Embed:
+@traced()
+def calculate_clusters_embed(clusters_as_str: list[str], alliance_name: str, max_cluster_distance: int = None) -> discord.Embed:
     fields = []
     for cluster in clusters_as_str:
         cluster_lines = cluster.split('\n')
@@ -18,6 +24,7 @@ def calculate_clusters_embed(clusters_as_str: list[str], alliance_name: str) ->
 
     return create_embed(
         title=f"Cluster Information for alliance {alliance_name.capitalize()}",
+        description=f"Islands up to {max_cluster_distance} tiles apart are clustered together" if max_cluster_distance is not None else "",
         color=discord.Color.blue(),
         fields=fields
     )
@@ -68,12 +75,13 @@ def closest_alliance_member_to_target_embed(closest_cities: list[CityData], targ
     )
 
 
-def find_island_embed(island_cities_data: list[CityData], world_id: int, region_id: int) -> discord.Embed:
-    island_rankings = get_islands_data(world_id, region_id)
+@traced()
+def find_island_embed(island_cities_data: list[CityData], island_tiers: dict[tuple[int, int], str]) -> discord.Embed:
     player_info, alliance_info = get_island_residents_info_embed(island_cities_data)
 
-    island_data = island_cities_data[0].__dict__
-    island_data['tier'] = get_island_tier(island_data['x'], island_data['y'], island_rankings)
+    island_data = dict(island_cities_data[0].__dict__)
+    island_data['taken_spots'] = len(island_cities_data)
+    island_data['tier'] = get_island_tier(island_data['x'], island_data['y'], island_tiers)
 
     table_content = t2a(
         header=["Coords", "Spots", "Wood", "Resource", "Wonder", "Tier"],
@@ -98,16 +106,31 @@ def find_island_embed(island_cities_data: list[CityData], world_id: int, region_
 
 
 def show_settings_embed(settings: dict) -> discord.Embed:
+    trade_channel_id = settings.get('trade_channel_id')
     return create_embed(
         title="Server Settings", description="Current server settings for the bot.",
-        fields=[(key.capitalize(), value, False) for key, value in settings.items() if not key.endswith('_id')]
+        fields=[(key.capitalize(), value, False) for key, value in settings.items() if not key.endswith('_id')] + [
+            ("Trade channel", f"<#{trade_channel_id}>" if trade_channel_id else "Every channel", False)
+        ]
     )
 
 
-def find_player_embed(cities_data: list[CityData], player_name: str, world_id: int, region_id: int) -> discord.Embed:
-    # Load island tier data from the JSON file
-    islands_data = get_islands_data(world_id, region_id)
 
+def profiling_status_embed(profiler: CommandProfiler) -> discord.Embed:
+    always_profiled = ", ".join(f"`{name}`" for name in sorted(profiler.always_profiled))
+    return create_embed(
+        title="Command Profiling",
+        description="Profiling is on" if profiler.is_enabled() else "Profiling is off",
+        fields=[
+            ("Sample rate", f"{profiler.sample_rate:.1%} of all invocations", False),
+            ("Always profiled", always_profiled or "None", False),
+            ("Saved profiles", f"{profiler.count_profiles()} in `{profiler.output_dir}`", False),
+        ]
+    )
+
+
+@traced()
+def find_player_embed(cities_data: list[CityData], player_name: str, island_tiers: dict[tuple[int, int], str]) -> discord.Embed:
     # Prepare data for the table
     table_data = []
     for city in cities_data:
@@ -117,7 +140,7 @@ def find_player_embed(cities_data: list[CityData], player_name: str, world_id: i
         resource_type = truncate_string(city.resource_type, 6)
 
         # Get the tier of the island
-        island_tier = get_island_tier(city.x, city.y, islands_data)
+        island_tier = get_island_tier(city.x, city.y, island_tiers)
 
         # Append row data
         table_data.append([
@@ -151,8 +174,10 @@ def help_embed(ctx: discord.Interaction) -> discord.Embed:
     )
 
 
-def list_best_islands_embed(islands_data: list[tuple[dict, int]], command_params: dict) -> discord.Embed:
+@traced()
+def list_best_islands_embed(islands_data: list[tuple[dict, int]], command_params: dict, applicable_count: int = None) -> discord.Embed:
     best_islands = islands_data[:10]  # Get the top 10 islands
+    applicable_count = len(islands_data) if applicable_count is None else applicable_count
 
     # Prepare data for the table
     table_data = []
@@ -168,7 +193,7 @@ def list_best_islands_embed(islands_data: list[tuple[dict, int]], command_params
 
     # Create embed for island stats
     return create_embed(
-        title=f"Top {len(best_islands)} {str(command_params['resource_type'])} {str(command_params['miracle_type'])} islands (Out of {len(islands_data)} applicable)",
+        title=f"Top {len(best_islands)} {str(command_params['resource_type'])} {str(command_params['miracle_type'])} islands (Out of {applicable_count} applicable)",
         description=f"Top {len(best_islands)} best {str(command_params['resource_type'])} {str(command_params['miracle_type'])} islands",
         fields=[
             ("", f"```\n{table_content}\n```", False)
@@ -176,6 +201,33 @@ def list_best_islands_embed(islands_data: list[tuple[dict, int]], command_params
     )
 
 
+@traced()
+def search_islands_embed(islands: list[tuple[dict, float]], coords: tuple[int, int], command_params: dict) -> discord.Embed:
+    filters = [f"{command_params['min_free_spots']}+ free spots"]
+    filters += [str(command_params[key]) for key in ('resource_type', 'miracle_type') if command_params.get(key)]
+    description = f"Islands within {command_params['radius']} tiles of {coords_to_string(coords)} with {', '.join(filters)}"
+
+    if not islands:
+        return create_embed(title="No islands found", description=description)
+
+    table_content = t2a(
+        header=["Coords", "Dist", "Spots", "Wood", "Resource", "Wonder", "Tier"],
+        body=[
+            [row[0], round(distance, 1), *row[1:]]
+            for island_data, distance in islands[:ISLAND_SEARCH_ROWS]
+            for row in [collect_island_data(island_data, coords_to_string((island_data['x'], island_data['y'])))]
+        ],
+        style=PresetStyle.thick_compact,
+        alignments=[Alignment.CENTER, Alignment.RIGHT, Alignment.LEFT, Alignment.LEFT, Alignment.CENTER, Alignment.CENTER, Alignment.CENTER]
+    )
+
+    return create_embed(
+        title=f"{len(islands)} matching islands, closest first",
+        description=description,
+        fields=[("", f"```\n{table_content}\n```", False)]
+    )
+
+
 def travel_time_embed(unit_type: UnitType, start_coords: tuple, dest_coords: tuple, hours: int, minutes: int, base_speed: int, distance: float) -> discord.Embed:
     description = "Travel time is approximately "
     description += f"{hours} hours" if hours > 0 else ""
@@ -183,7 +235,7 @@ def travel_time_embed(unit_type: UnitType, start_coords: tuple, dest_coords: tup
     description += f" {minutes} minutes" if minutes > 0 else ""
 
     return create_embed(
-        f"{unit_type.name.replace('_', ' ').title()} from {':'.join(start_coords)} to {':'.join(dest_coords)}.",
+        f"{unit_type.name.replace('_', ' ').title()} from {coords_to_string(start_coords)} to {coords_to_string(dest_coords)}.",
         description=description,
         fields=[
             ("Unit Type", unit_type.name.replace('_', ' ').title(), True),
@@ -194,12 +246,156 @@ def travel_time_embed(unit_type: UnitType, start_coords: tuple, dest_coords: tup
     )
 
 
+@traced()
+def travel_time_matrix_embed(rows: list[tuple[CityData, tuple, float]], command_params: dict, unit_speed: float,
+                             sources_count: int, targets_count: int, page: int, total_pages: int) -> discord.Embed:
+    unit_name = command_params['unit_type'].name.replace('_', ' ').title()
+
+    table_content = t2a(
+        header=["From", "Owner", "To", "Time"],
+        body=[
+            [coords_to_string(city.coords), truncate_string(city.player_name, 10), coords_to_string(target_coords), format_travel_time(travel_time)]
+            for city, target_coords, travel_time in rows
+        ],
+        style=PresetStyle.thick_compact,
+        alignments=[Alignment.CENTER, Alignment.LEFT, Alignment.CENTER, Alignment.RIGHT]
+    )
+
+    return create_embed(
+        title=f"{unit_name} travel times for {str(command_params['search_type'].value).lower()} {command_params['name']}",
+        description=(
+            f"{sources_count} cities x {targets_count} targets at a speed of {round(unit_speed, 2)}, fastest first. "
+            f"Page {page}/{total_pages}"
+        ),
+        fields=[
+            ("", f"```\n{table_content}\n```", False)
+        ]
+    )
+
+
+@traced()
+def plan_attack_embed(departures_per_player: list[tuple[str, list[tuple[CityData, float, int]]]], command_params: dict,
+                      target_coords: tuple, landing_time: datetime.datetime, cities_count: int, too_late_count: int,
+                      page: int, total_pages: int) -> discord.Embed:
+    fields = []
+    for player_name, departures in departures_per_player:
+        lines = [
+            f"`{coords_to_string(city.coords):>5}` {format_travel_time(travel_time)} - leave <t:{departure_timestamp}:f> (<t:{departure_timestamp}:R>)"
+            for city, travel_time, departure_timestamp in departures[:PLAN_ATTACK_CITIES_PER_PLAYER]
+        ]
+        if len(departures) > PLAN_ATTACK_CITIES_PER_PLAYER:
+            lines.append(f"...and {len(departures) - PLAN_ATTACK_CITIES_PER_PLAYER} more cities leaving later")
+
+        fields.append((f"{player_name} ({len(departures)} {'cities' if len(departures) > 1 else 'city'})", "\n".join(lines), False))
+
+    landing_timestamp = int(landing_time.timestamp())
+    description = (
+        f"{cities_count} cities sending {command_params['unit_type'].name.replace('_', ' ').title()}s "
+        f"to land together at <t:{landing_timestamp}:f>. Page {page}/{total_pages}"
+    )
+    if too_late_count:
+        description += f"\n{e_very_outraged} {too_late_count} cities are already too late to make it!"
+
+    return create_embed(
+        title=f"Synchronized attack on {coords_to_string(target_coords)}",
+        description=description,
+        fields=fields
+    )
+
+
+@traced()
+def frontline_embed(frontline: list[tuple[CityData, CityData, float]], contested_islands: list[tuple[tuple, int, int, float]], command_params: dict) -> discord.Embed:
+    alliance_name = command_params['alliance_name'].capitalize()
+    enemy_alliance_name = command_params['enemy_alliance_name'].capitalize()
+
+    frontline_table = t2a(
+        header=["Enemy", "Owner", "Ours", "Owner", "Dist"],
+        body=[
+            [coords_to_string(enemy_city.coords), truncate_string(enemy_city.player_name, 8),
+             coords_to_string(friendly_city.coords), truncate_string(friendly_city.player_name, 8), round(distance, 1)]
+            for enemy_city, friendly_city, distance in frontline[:FRONTLINE_ROWS]
+        ],
+        style=PresetStyle.thick_compact,
+        alignments=[Alignment.CENTER, Alignment.LEFT, Alignment.CENTER, Alignment.LEFT, Alignment.RIGHT]
+    )
+
+    fields = [(f"Closest enemy cities ({len(frontline)} total)", f"```\n{frontline_table}\n```", False)]
+
+    if contested_islands:
+        contested_table = t2a(
+            header=["Island", "Ours", "Enemy", "Dist"],
+            body=[
+                [coords_to_string(island_coords), friendly_count, enemy_count, round(distance, 1)]
+                for island_coords, friendly_count, enemy_count, distance in contested_islands[:FRONTLINE_ROWS]
+            ],
+            style=PresetStyle.thick_compact,
+            alignments=[Alignment.CENTER, Alignment.RIGHT, Alignment.RIGHT, Alignment.RIGHT]
+        )
+        fields.append((f"Contested islands ({len(contested_islands)} total)", f"```\n{contested_table}\n```", False))
+    else:
+        fields.append(("Contested islands", f"No islands have both alliances within {command_params['contested_distance']} tiles.", False))
+
+    return create_embed(
+        title=f"Frontline between {alliance_name} and {enemy_alliance_name}",
+        description=f"Nearest {alliance_name} city for every {enemy_alliance_name} city, closest first",
+        fields=fields
+    )
+
+
+def generate_heatmap_embed(alliance_name: str, cities_count: int, islands_count: int, hottest_island: tuple[tuple, int], image_filename: str) -> discord.Embed:
+    hottest_coords, hottest_count = hottest_island
+
+    embed = create_embed(
+        title=f"City density of alliance {alliance_name.capitalize()}",
+        description=(
+            f"{cities_count} cities spread over {islands_count} islands. "
+            f"The most crowded island is {coords_to_string(hottest_coords)} with {hottest_count} cities."
+        )
+    )
+    embed.set_image(url=f"attachment://{image_filename}")
+
+    return embed
+
+
+@traced()
+def inactive_targets_embed(targets: list[tuple[dict, float, float]], coords_list: list[tuple[int, int]], command_params: dict) -> discord.Embed:
+    searched_coords = ", ".join(coords_to_string(coords) for coords in coords_list)
+
+    if not targets:
+        return create_embed(
+            title="No inactive targets found",
+            description=f"No player within {command_params['radius']} tiles of {searched_coords} "
+                        f"has been inactive for {command_params['inactive_hours']} hours, among the players looked up since then."
+        )
+
+    now = time.time()
+    targets_table = t2a(
+        header=["Coords", "Player", "Ally", "Lvl", "Dist", "Idle"],
+        body=[
+            [coords_to_string((city['x'], city['y'])), truncate_string(city['player_name'], 10), truncate_string(city['ally_name'] or '-', 6),
+             city['city_level'], round(distance, 1), f"{int((now - last_score_change) // 3600)}h"]
+            for city, distance, last_score_change in targets[:TARGET_FINDER_ROWS]
+        ],
+        style=PresetStyle.thick_compact,
+        alignments=[Alignment.CENTER, Alignment.LEFT, Alignment.LEFT, Alignment.RIGHT, Alignment.RIGHT, Alignment.RIGHT]
+    )
+
+    return create_embed(
+        title=f"Inactive targets near {truncate_string(searched_coords, 200)}",
+        description=(
+            f"{len(targets)} cities within {command_params['radius']} tiles whose owner's score hasn't changed for "
+            f"{command_params['inactive_hours']}+ hours, closest first"
+        ),
+        fields=[("", f"```\n{targets_table}\n```", False)]
+    )
+
+
 def trade_offer_embed(offer: str, want: str, author: discord.Member) -> discord.Embed:
     return create_embed(
         description=f"{author.mention} is looking to trade: {offer} for {want}",
         footer=(
             "This offer will expire in 1 day. Post your own offer by typing 'Trade: (resource1) for (resource2)' "
-            f"or message {author.name} directly to notify them about the trade", author.avatar.url
+            f"or message {author.name} directly to notify them about the trade", author.display_avatar.url
         )
     )
 
@@ -209,12 +405,12 @@ def trade_dm_embed(trade: dict, matching_offer_author: discord.User) -> discord.
         title="a matching trade has been found!",
         description=f"<@{matching_offer_author.id}> is looking to trade: {trade['have']} for {trade['want']}",
         color=discord.Color.green(),
-        footer=("Contact the user directly to finalize the trade", matching_offer_author.avatar.url)
+        footer=("Contact the user directly to finalize the trade", matching_offer_author.display_avatar.url)
     )
 
 
-def welcome_message_embed(guild: discord.Guild):
-    create_embed(
+def welcome_message_embed(guild: discord.Guild) -> discord.Embed:
+    return create_embed(
         "IkaDiscordBot",
         f"Hello, {guild.name}! 👋\n\n"
 
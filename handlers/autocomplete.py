@@ -0,0 +1,73 @@
+import discord
+from discord import app_commands
+
+from database.guild_settings_manager import fetch_settings
+from utils.name_index import NamePrefixIndex
+from utils.types import ClosestCitySearchTypes
+from utils.world_data import get_world_data
+
+MAX_AUTOCOMPLETE_CHOICES = 25  # discord won't show more than 25 suggestions
+
+
+def get_guild_world_indexes(interaction: discord.Interaction):
+    """The name indexes of the world the guild is configured for, None if the guild has no settings or world data yet"""
+    settings = fetch_settings(interaction.guild) if interaction.guild else {}
+    world_data = get_world_data(settings['region_id'], settings['world_id']) if settings else None
+    if world_data is None:
+        return None
+
+    return world_data.name_indexes
+
+
+def names_to_choices(name_index: NamePrefixIndex | None, current: str, prefix: str = "") -> list[app_commands.Choice[str]]:
+    if name_index is None:
+        return []
+
+    return [
+        app_commands.Choice(name=f"{prefix}{name}"[:100], value=f"{prefix}{name}"[:100])
+        for name in name_index.search(current.strip(), MAX_AUTOCOMPLETE_CHOICES)
+    ]
+
+
+def is_player_search(interaction: discord.Interaction) -> bool:
+    search_type = getattr(interaction.namespace, 'search_type', None)
+    return search_type in (ClosestCitySearchTypes.PLAYER, ClosestCitySearchTypes.PLAYER.value)
+
+
+async def player_name_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    indexes = get_guild_world_indexes(interaction)
+    return names_to_choices(indexes.players if indexes else None, current)
+
+
+async def alliance_name_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    indexes = get_guild_world_indexes(interaction)
+    return names_to_choices(indexes.alliances if indexes else None, current)
+
+
+async def player_or_alliance_name_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    """Suggests players or alliances depending on the search_type the user picked"""
+    indexes = get_guild_world_indexes(interaction)
+    if not indexes:
+        return []
+
+    return names_to_choices(indexes.players if is_player_search(interaction) else indexes.alliances, current)
+
+
+async def names_list_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    """Completes the last name of a comma separated list of players or alliances"""
+    indexes = get_guild_world_indexes(interaction)
+    if not indexes:
+        return []
+
+    completed_names, _, last_name = current.rpartition(',')
+    prefix = f"{completed_names}, " if completed_names else ""
+
+    return names_to_choices(indexes.players if is_player_search(interaction) else indexes.alliances, last_name, prefix)
+
+
+async def command_name_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    current = current.strip().lower()
+    return [
+        app_commands.Choice(name=command.name, value=command.name)
+        for command in interaction.client.tree.get_commands() if current in command.name
+    ][:MAX_AUTOCOMPLETE_CHOICES]
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+
+from utils.constants import (
+    ISLANDS_DATA_CACHE_SECONDS,
+    PREWARM_INTERVAL_SECONDS,
+    PREWARM_REFRESH_AHEAD_RATIO,
+    PREWARM_ALLIANCES_PER_WORLD,
+    PREWARM_REQUEST_SPACING_SECONDS,
+    RESPONSE_FRESH_SECONDS
+)
+from utils.upstream import ikalogs_client
+from utils.usage_tracker import command_usage, alliance_usage
+from utils.world_data import WorldData, world_data_registry
+
+logger = logging.getLogger(__name__)
+
+
+def rank_worlds_by_usage(worlds: list[WorldData]) -> list[WorldData]:
+    """Busiest worlds first, so they are the first to be refreshed when there isn't time for all of them"""
+    usage_counts = command_usage.counts()
+    return sorted(worlds, key=lambda world: usage_counts.get((world.region_id, world.world_id), 0), reverse=True)
+
+
+def is_expiring(age: float | None, lifetime: float) -> bool:
+    return age is None or age >= lifetime * PREWARM_REFRESH_AHEAD_RATIO
+
+
+async def prewarm_world(world_data: WorldData):
+    """Refreshes the world's islands data and most requested alliances before they expire"""
+    region_id, world_id = world_data.region_id, world_data.world_id
+    if is_expiring(world_data.get_islands_age(), ISLANDS_DATA_CACHE_SECONDS):
+        await asyncio.to_thread(world_data.reload_islands)
+
+    popular_alliances = alliance_usage.most_common(
+        PREWARM_ALLIANCES_PER_WORLD, key_filter=lambda alliance_key: alliance_key[:2] == (region_id, world_id)
+    )
+
+    for (_, _, alliance_name), _ in popular_alliances:
+        response_age = ikalogs_client.get_response_age(world_data.get_alliance_query(alliance_name))
+        if not is_expiring(response_age, RESPONSE_FRESH_SECONDS):
+            continue
+
+        try:
+            await asyncio.to_thread(world_data.prefetch_alliance_cities, alliance_name)
+        except ValueError as e:
+            logger.warning(f"Could not pre-warm alliance '{alliance_name}' of world {region_id}:{world_id}: {e}")
+
+        # Spread the requests over time instead of bursting them at ika-logs
+        await asyncio.sleep(PREWARM_REQUEST_SPACING_SECONDS)
+
+
+async def prewarm_caches():
+    # Copied, guilds may attach to or leave worlds while we wait on ika-logs
+    for world_data in rank_worlds_by_usage(list(world_data_registry.values())):
+        await prewarm_world(world_data)
+
+
+async def prewarm_caches_forever():
+    """Background task that keeps the data of every world our guilds play in warm, started once the bot logs in"""
+    while True:
+        try:
+            await prewarm_caches()
+        except Exception as e:
+            logger.exception(f"Cache pre-warming failed: {e}")
+
+        await asyncio.sleep(PREWARM_INTERVAL_SECONDS)
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+
+import discord
+
+from database.guild_settings_manager import create_default_settings, load_settings, settings_cache
+from embeds.embeds import welcome_message_embed
+from utils.async_utils import collect_batch
+from utils.constants import GUILD_JOIN_BATCH_SECONDS, GUILD_JOIN_BATCH_SIZE
+from utils.world_data import attach_guild, detach_guild, guild_worlds
+
+logger = logging.getLogger(__name__)
+
+# Guilds the bot joined that weren't set up yet, drained in batches by process_guild_joins_forever
+guild_join_queue: asyncio.Queue[discord.Guild] = asyncio.Queue()
+
+
+def load_guild_settings(guilds: list[discord.Guild], all_guilds: bool = False) -> tuple[dict[int, dict], set[int]]:
+    """
+    The settings of every guild, in a fixed amount of queries no matter how many guilds there are: their settings are
+    loaded at once and the missing ones are created with the defaults in a single transaction.
+    When all_guilds is set the whole settings table is loaded (and cached), it is cheaper than listing every guild id,
+    and the ids of the guilds that have settings but aren't among the guilds are returned along with the settings.
+    """
+    all_settings = load_settings(None if all_guilds else [guild.id for guild in guilds])
+
+    missing_guilds = [guild for guild in guilds if guild.id not in all_settings]
+    if missing_guilds:
+        create_default_settings(missing_guilds)
+        all_settings.update(load_settings([guild.id for guild in missing_guilds]))
+
+    logger.info(f"Loaded the settings of {len(guilds)} guilds, created the settings of {len(missing_guilds)} of them")
+    guild_settings = {guild.id: all_settings[guild.id] for guild in guilds}
+    return guild_settings, set(all_settings) - set(guild_settings)
+
+
+async def reconcile_guilds(guilds: list[discord.Guild], all_guilds: bool = False):
+    """
+    Makes sure every guild has settings and is attached to the data of its world.
+    When all_guilds is set, the guilds are every guild the bot is in: the guilds that have settings or are attached
+    but aren't among them removed the bot while it was offline, they are detached and their settings leave the cache
+    (the settings stay in the database in case the bot is added back).
+    """
+    guild_settings, other_guild_ids = await asyncio.to_thread(load_guild_settings, guilds, all_guilds)
+
+    for guild_id, settings in guild_settings.items():
+        attach_guild(guild_id, settings['region_id'], settings['world_id'])
+
+    if all_guilds:
+        departed_guild_ids = (other_guild_ids | set(guild_worlds)) - set(guild_settings)
+        # Only the attached ones left since we last saw them, the settings of every guild that ever left stay behind
+        detached_count = len(departed_guild_ids & set(guild_worlds))
+        for guild_id in departed_guild_ids:
+            detach_guild(guild_id)
+            settings_cache.pop(guild_id, None)
+
+        if detached_count:
+            logger.info(f"{detached_count} guilds removed the bot while it was disconnected")
+        logger.debug(f"{len(departed_guild_ids) - detached_count} other guilds with settings don't have the bot anymore")
+
+
+async def collect_guild_joins() -> list[discord.Guild]:
+    """The guilds joining around the same time, each guild once"""
+    guilds = await collect_batch(guild_join_queue, GUILD_JOIN_BATCH_SIZE, GUILD_JOIN_BATCH_SECONDS)
+    return list({guild.id: guild for guild in guilds}.values())
+
+
+async def welcome_guild(guild: discord.Guild):
+    if not guild.system_channel:
+        return
+
+    try:
+        await guild.system_channel.send(embed=welcome_message_embed(guild))
+    except discord.HTTPException as e:
+        logger.warning(f"Could not greet guild {guild.name}: {e}")
+
+
+async def process_guild_joins_forever():
+    """Background task that sets up the guilds the bot joins in batches, started once the bot logs in"""
+    while True:
+        guilds = await collect_guild_joins()
+
+        try:
+            await reconcile_guilds(guilds)
+        except Exception as e:
+            logger.exception(f"Setting up {len(guilds)} joined guilds failed: {e}")
+
+        await asyncio.gather(*(welcome_guild(guild) for guild in guilds))
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+
+from database.snapshot_store import restore_snapshot_archive, save_snapshot
+from utils.constants import SNAPSHOT_INTERVAL_SECONDS
+from utils.snapshot_archive import WorldSnapshotArchive
+from utils.world_data import drop_stored_snapshot_archives, get_snapshot_archives
+
+logger = logging.getLogger(__name__)
+
+
+def archive_world_snapshot(region_id: int, world_id: int, archive: WorldSnapshotArchive):
+    """Appends everything collected about the world since its last snapshot to its archive"""
+    if not archive.is_restored:
+        restore_snapshot_archive(region_id, world_id, archive)
+
+    record = archive.take_snapshot()
+    if record is not None:
+        try:
+            save_snapshot(region_id, world_id, record)
+        except Exception:
+            archive.discard_snapshot(record)
+            raise
+
+        archive.commit_snapshot(record)
+        logger.info(f"Archived snapshot {record.snapshot_id} of world {region_id}:{world_id} "
+                    f"({record.cities_count} cities, {len(record.payload)} bytes{', keyframe' if record.is_keyframe else ''})")
+
+
+async def archive_snapshots():
+    for (region_id, world_id), archive in get_snapshot_archives():
+        if archive.has_pending_changes():
+            await asyncio.to_thread(archive_world_snapshot, region_id, world_id, archive)
+
+    drop_stored_snapshot_archives()
+
+
+async def archive_snapshots_forever():
+    """Background task that snapshots the cities of every world we collected cities for, started once the bot logs in"""
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_SECONDS)
+
+        try:
+            await archive_snapshots()
+        except Exception as e:
+            logger.exception(f"Archiving snapshots failed: {e}")
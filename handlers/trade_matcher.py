@@ -1,77 +1,103 @@
+import asyncio
+import logging
 import re
 
 import discord
 
-from database.guild_settings_manager import run_query
+from database.guild_settings_manager import settings_cache
+from database.trade_store import match_or_save_trade_offers
 from embeds.embeds import trade_offer_embed, trade_dm_embed
-from utils.constants import TRADE_REG_PATTERN, BOT_ENV
+from utils.async_utils import collect_batch
+from utils.constants import TRADE_REG_PATTERN, TRADE_QUEUE_SIZE, TRADE_BATCH_SIZE, TRADE_BATCH_SECONDS
 from utils.general_utils import convert_to_emojis
 
+logger = logging.getLogger(__name__)
 
-def find_matching_trades(guild: discord.Guild, trade_offer_author: discord.User, trade_have: str, trade_want: str) -> list[dict]:
-    """load trade history from the last day"""
-    return run_query(f"""
-        SELECT * FROM {BOT_ENV}_trades_history 
-        WHERE proposal_time >= datetime('now', '-1 day')
-            AND guild_id = {guild.id}
-            AND proposer_id != {trade_offer_author.id}
-            AND (have = '{trade_want}' AND want = '{trade_have}')   
-    """)
+# Every message goes through the prefix check, only the few that pass it are parsed with the full pattern
+TRADE_PREFIX_PATTERN = re.compile(r"trade:", re.IGNORECASE)
+TRADE_OFFER_PATTERN = re.compile(TRADE_REG_PATTERN, re.IGNORECASE)
 
+# (message, have, want) of the trade offers posted but not processed yet
+trade_offers_queue: asyncio.Queue[tuple[discord.Message, str, str]] = asyncio.Queue(TRADE_QUEUE_SIZE)
 
-def save_new_trade_offer(guild: discord.Guild, trade_offer_author: discord.User, trade_have: str, trade_want: str):
-    """Insert a new trade offer to the db"""
 
-    run_query(f"""
-        INSERT INTO {BOT_ENV}_trades_history (guild_id, proposer_id, have, want)
-        VALUES ({guild.id}, {trade_offer_author.id}, '{trade_have}', '{trade_want}')
-    """)
+def is_trade_channel(message: discord.Message) -> bool:
+    """Guilds that configured a trade channel only trade there, the others trade in every channel"""
+    settings = settings_cache.get(message.guild.id)
+    trade_channel_id = settings.get('trade_channel_id') if settings else None
 
+    return trade_channel_id is None or trade_channel_id == message.channel.id
 
-async def check_msg_for_trade_offer(message: discord.Message, bot_self):
-    trade_msg = re.match(TRADE_REG_PATTERN, message.content.lower(), re.IGNORECASE)
-    if not trade_msg:
-        return
 
-    have = trade_msg.group(1).strip()
-    want = trade_msg.group(2).strip()
+def parse_trade_offer(content: str) -> tuple[str, str] | None:
+    """The (have, want) of a 'Trade: X for Y' message, None if the message isn't a trade offer"""
+    if not TRADE_PREFIX_PATTERN.match(content):
+        return None
 
-    offer_with_emojis = convert_to_emojis(have)
-    want_with_emojis = convert_to_emojis(want)
+    trade_msg = TRADE_OFFER_PATTERN.match(content)
+    if not trade_msg:
+        return None
 
-    embed = trade_offer_embed(offer_with_emojis, want_with_emojis, message.author)
+    return trade_msg.group(1).strip().lower(), trade_msg.group(2).strip().lower()
 
-    # Delete user message, post embed instead
-    await message.delete()
-    await message.channel.send(embed=embed)
 
-    # Check for a matching trade
-    trade_offers_from_last_day = find_matching_trades(message.guild, message.author, have, want)
-    if trade_offers_from_last_day:
-        for trade in trade_offers_from_last_day:
-            await dm_user_about_trade(bot_self, message.author.id, trade['user_id'], trade)
-            await dm_user_about_trade(bot_self, trade['user_id'], message.author.id, {"have": trade['have'], "want": trade['want']})
+def check_msg_for_trade_offer(message: discord.Message):
+    """
+    Runs for every message the bot sees, so it only does in-memory checks: trade offers are queued for
+    process_trade_offers_forever, every other message is dropped right away.
+    """
+    if message.guild is None or message.author.bot or not is_trade_channel(message):
+        return
 
-        # Remove the finished trades from the database
-        delete_concluded_trades(trade_offers_from_last_day)
+    trade_offer = parse_trade_offer(message.content)
+    if trade_offer is None:
+        return
+
+    try:
+        trade_offers_queue.put_nowait((message, *trade_offer))
+    except asyncio.QueueFull:
+        logger.warning(f"Dropped a trade offer in guild {message.guild.name}, too many offers are waiting to be processed")
 
-    # No matching trade found - add the trade to the db for tracking
-    else:
-        save_new_trade_offer(message.guild, message.author, have, want)
 
+async def post_trade_offer(bot: discord.Client, message: discord.Message, have: str, want: str, matching_trades: list[dict]):
+    embed = trade_offer_embed(convert_to_emojis(have), convert_to_emojis(want), message.author)
 
-def delete_concluded_trades(trade_offers_from_last_day):
-    """Remove concluded trades from the db"""
-    run_query(f"""
-        DELETE FROM {BOT_ENV}_trades_history
-        WHERE id IN ({", ".join(str(trade['id']) for trade in trade_offers_from_last_day)})
-            OR proposal_time > NOW() - INTERVAL 1 DAY
-    """)
+    # Delete user message, post embed instead
+    try:
+        await message.delete()
+        await message.channel.send(embed=embed)
+    except discord.HTTPException as e:
+        logger.warning(f"Could not repost the trade offer in guild {message.guild.name}: {e}")
+
+    for trade in matching_trades:
+        await dm_user_about_trade(bot, message.author.id, trade['proposer_id'], trade)
+        await dm_user_about_trade(bot, trade['proposer_id'], message.author.id, {"have": have, "want": want})
+
+
+async def process_trade_offers_forever(bot: discord.Client):
+    """
+    Background task that processes the queued trade offers in batches, started once the bot logs in.
+    The offers of a batch are matched and saved in a single transaction, then posted in the order they were made.
+    """
+    while True:
+        batch = await collect_batch(trade_offers_queue, TRADE_BATCH_SIZE, TRADE_BATCH_SECONDS)
+
+        try:
+            all_matches = await asyncio.to_thread(
+                match_or_save_trade_offers, [(message.guild.id, message.author.id, have, want) for message, have, want in batch]
+            )
+            for (message, have, want), matching_trades in zip(batch, all_matches):
+                await post_trade_offer(bot, message, have, want, matching_trades)
+        except Exception as e:
+            logger.exception(f"Processing {len(batch)} trade offers failed: {e}")
 
 
 async def dm_user_about_trade(bot, trade_poster_id: int, matching_trade_poster_id: int, trade: dict):
-    trade_poster = await bot.fetch_user(trade_poster_id)
-    matching_trade_poster = await bot.fetch_user(matching_trade_poster_id)
-
-    # Send a DM to the trade poster about the matching trade
-    await trade_poster.send(embed=trade_dm_embed(trade, matching_trade_poster))
+    try:
+        trade_poster = bot.get_user(trade_poster_id) or await bot.fetch_user(trade_poster_id)
+        matching_trade_poster = bot.get_user(matching_trade_poster_id) or await bot.fetch_user(matching_trade_poster_id)
+
+        # Send a DM to the trade poster about the matching trade
+        await trade_poster.send(embed=trade_dm_embed(trade, matching_trade_poster))
+    except discord.HTTPException as e:
+        logger.warning(f"Could not DM user {trade_poster_id} about a matching trade: {e}")
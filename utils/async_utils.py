@@ -0,0 +1,32 @@
+import asyncio
+
+from utils.profiling import sampled_in_thread
+
+
+async def collect_batch(queue: asyncio.Queue, max_size: int, max_wait_seconds: float) -> list:
+    """Waits for an item, then gathers the items queued within max_wait_seconds after it (up to max_size) into a batch"""
+    batch = [await queue.get()]
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_wait_seconds
+    while len(batch) < max_size:
+        # Items that are already queued are taken without waiting
+        if not queue.empty():
+            batch.append(queue.get_nowait())
+            continue
+
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), remaining))
+        except asyncio.TimeoutError:
+            break
+
+    return batch
+
+
+async def to_thread(func, *args, **kwargs):
+    """asyncio.to_thread, the thread is sampled as part of the profile of the command that runs the function (if any)"""
+    return await asyncio.to_thread(sampled_in_thread(func), *args, **kwargs)
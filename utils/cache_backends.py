@@ -0,0 +1,375 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import urlparse, unquote
+
+logger = logging.getLogger(__name__)
+
+# Values are stored as json, prefixed by whether it was compressed
+RAW_PREFIX = b'j'
+COMPRESSED_PREFIX = b'z'
+COMPRESS_MIN_BYTES = 512  # smaller values don't shrink enough to be worth compressing
+
+GENERATION_CHECK_SECONDS = 2  # how long an invalidation made by another process may go unnoticed
+RECONNECT_BACKOFF_SECONDS = 15  # how long a backend that couldn't be reached fails right away instead of being retried
+
+
+class CacheBackendError(Exception):
+    """The cache backend could not be reached or answered with an error"""
+
+
+def serialize(value) -> bytes:
+    """Encodes a json-compatible value, compressing it once it is large enough for compression to pay off"""
+    encoded = json.dumps(value, separators=(',', ':')).encode()
+    if len(encoded) < COMPRESS_MIN_BYTES:
+        return RAW_PREFIX + encoded
+
+    return COMPRESSED_PREFIX + zlib.compress(encoded, 6)
+
+
+def deserialize(data: bytes):
+    if data[:1] == COMPRESSED_PREFIX:
+        return json.loads(zlib.decompress(data[1:]))
+
+    return json.loads(data[1:])
+
+
+class CacheBackend:
+    """
+    Stores bytes under string keys, every entry expires after its ttl.
+    Backends that are shared (is_shared) are seen by every bot process that uses the same backend.
+    """
+    is_shared: bool = False
+
+    def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        """Atomically increments the counter (0 if missing) and returns its new value, counters never expire"""
+        raise NotImplementedError
+
+    def get_counter(self, key: str) -> int:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Keeps the entries in this process only, the least recently used ones are evicted once it is full"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (value, expires at)
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            if entry[1] < time.time():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        with self.lock:
+            self.entries[key] = (value, time.time() + ttl_seconds)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+    def get_counter(self, key: str) -> int:
+        with self.lock:
+            return self.counters.get(key, 0)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Keeps the entries in a SQLite file, shared by every process on the host that opens the same file.
+    Expired entries are skipped when read and purged every once in a while when writing.
+    """
+    is_shared = True
+    PURGE_EVERY_WRITES = 256
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()  # sqlite connections can't be shared between threads
+        self.writes = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.execute("""CREATE TABLE IF NOT EXISTS cache_entries (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            expires_at REAL NOT NULL
+        )""")
+        self.execute("CREATE TABLE IF NOT EXISTS cache_counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def get_connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # Readers never block the writer (and the other way around) in write-ahead logging mode
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+
+        return conn
+
+    def execute(self, query: str, params: tuple = ()) -> list[tuple]:
+        try:
+            return self.get_connection().execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            raise CacheBackendError(f"sqlite cache at {self.path} failed: {e}") from e
+
+    def get(self, key: str) -> bytes | None:
+        rows = self.execute("SELECT value FROM cache_entries WHERE key = ? AND expires_at >= ?", (key, time.time()))
+        return rows[0][0] if rows else None
+
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        self.execute("INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?)", (key, value, time.time() + ttl_seconds))
+
+        self.writes += 1
+        if self.writes % self.PURGE_EVERY_WRITES == 0:
+            self.execute("DELETE FROM cache_entries WHERE expires_at < ?", (time.time(),))
+
+    def delete(self, key: str):
+        self.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def incr(self, key: str) -> int:
+        rows = self.execute(
+            "INSERT INTO cache_counters VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1 RETURNING value", (key,)
+        )
+        return rows[0][0]
+
+    def get_counter(self, key: str) -> int:
+        rows = self.execute("SELECT value FROM cache_counters WHERE key = ?", (key,))
+        return rows[0][0] if rows else 0
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Keeps the entries in Redis (or any server speaking its protocol), shared by every process that connects to it.
+    Speaks the protocol directly over a single connection, reconnecting whenever it drops.
+    """
+    is_shared = True
+
+    def __init__(self, host: str, port: int, db: int = 0, password: str = None, timeout: float = 2):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+        self.unreachable_until = 0.0  # monotonic time until which connecting isn't retried
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.reader = self.sock.makefile('rb')
+
+        if self.password:
+            self.send_command('AUTH', self.password)
+        if self.db:
+            self.send_command('SELECT', self.db)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = self.reader = None
+
+    @staticmethod
+    def encode_command(*args) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            arg = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(f"${len(arg)}\r\n".encode() + arg + b"\r\n")
+
+        return b"".join(parts)
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by the server")
+
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise CacheBackendError(f"redis error: {payload.decode()}")
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            return None if length == -1 else [self.read_reply() for _ in range(length)]
+
+        raise CacheBackendError(f"unexpected redis reply: {line!r}")
+
+    def send_command(self, *args):
+        self.sock.sendall(self.encode_command(*args))
+        return self.read_reply()
+
+    def execute(self, *args):
+        with self.lock:
+            # Every attempt on a server that is down can block for the whole timeout, so they are spaced out
+            if self.sock is None and time.monotonic() < self.unreachable_until:
+                raise CacheBackendError(f"redis at {self.host}:{self.port} is unreachable, not retrying yet")
+
+            try:
+                if self.sock is None:
+                    self.connect()
+                return self.send_command(*args)
+            except OSError as e:
+                # The connection is in an unknown state, start over with a new one once the backoff passed
+                self.close()
+                self.unreachable_until = time.monotonic() + RECONNECT_BACKOFF_SECONDS
+                raise CacheBackendError(f"redis at {self.host}:{self.port} failed: {e}") from e
+
+    def get(self, key: str) -> bytes | None:
+        return self.execute('GET', key)
+
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        self.execute('SET', key, value, 'PX', max(1, int(ttl_seconds * 1000)))
+
+    def delete(self, key: str):
+        self.execute('DEL', key)
+
+    def incr(self, key: str) -> int:
+        return self.execute('INCR', key)
+
+    def get_counter(self, key: str) -> int:
+        value = self.execute('GET', key)
+        return int(value) if value is not None else 0
+
+
+def open_cache_backend(url: str, base_dir: str, memory_max_entries: int) -> CacheBackend:
+    """
+    Opens the backend of the url: 'memory://', 'sqlite:///<path>' (relative to base_dir unless absolute)
+    or 'redis://[:password@]host[:port][/db]'.
+    """
+    parsed = urlparse(url)
+
+    if parsed.scheme == 'memory':
+        return MemoryCacheBackend(memory_max_entries)
+
+    if parsed.scheme == 'sqlite':
+        path = unquote(url[len('sqlite:///'):])
+        return SQLiteCacheBackend(path if os.path.isabs(path) else os.path.join(base_dir, path))
+
+    if parsed.scheme == 'redis':
+        db = int(parsed.path.strip('/') or 0)
+        return RedisCacheBackend(parsed.hostname or 'localhost', parsed.port or 6379, db, unquote(parsed.password) if parsed.password else None)
+
+    raise ValueError(f"Unsupported shared cache url '{url}', expected memory://, sqlite:/// or redis://")
+
+
+shared_cache_backend: CacheBackend | None = None
+
+
+def get_shared_cache_backend() -> CacheBackend:
+    """The backend configured by SHARED_CACHE_URL, opened on first use"""
+    global shared_cache_backend
+    if shared_cache_backend is None:
+        # utils.constants imports utils.types, which uses this module, so the constants can only be imported here
+        from utils.constants import BASE_DIR, SHARED_CACHE_URL, SHARED_CACHE_MEMORY_MAX_ENTRIES
+        shared_cache_backend = open_cache_backend(SHARED_CACHE_URL, BASE_DIR, SHARED_CACHE_MEMORY_MAX_ENTRIES)
+
+    return shared_cache_backend
+
+
+class SharedCache:
+    """
+    A namespace of the shared cache backend holding json-compatible values.
+
+    Every key is stored under the namespace's current generation. Invalidating the namespace bumps the generation,
+    which every process notices within GENERATION_CHECK_SECONDS, so the entries of the previous generation are never
+    read again (they are left to expire). A backend that can't be reached behaves like an empty cache.
+    """
+
+    def __init__(self, namespace: str, ttl_seconds: float):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.generation = None  # (generation, time it was read at)
+
+    @property
+    def backend(self) -> CacheBackend:
+        return get_shared_cache_backend()
+
+    @property
+    def is_shared(self) -> bool:
+        return self.backend.is_shared
+
+    def get_generation(self) -> int:
+        if self.generation is None or time.monotonic() - self.generation[1] > GENERATION_CHECK_SECONDS:
+            try:
+                generation = self.backend.get_counter(f"{self.namespace}:generation")
+            except CacheBackendError as e:
+                # The last known generation is kept (0 before the first read) and checked again next time
+                logger.warning(f"Could not read the generation of the {self.namespace} cache: {e}")
+                generation = self.generation[0] if self.generation else 0
+
+            self.generation = (generation, time.monotonic())
+
+        return self.generation[0]
+
+    def make_key(self, key: str) -> str:
+        return f"{self.namespace}:{self.get_generation()}:{key}"
+
+    def get(self, key: str, default=None):
+        try:
+            data = self.backend.get(self.make_key(key))
+        except CacheBackendError as e:
+            logger.warning(f"Could not read '{key}' from the {self.namespace} cache: {e}")
+            return default
+
+        return deserialize(data) if data is not None else default
+
+    def set(self, key: str, value):
+        try:
+            self.backend.set(self.make_key(key), serialize(value), self.ttl_seconds)
+        except CacheBackendError as e:
+            logger.warning(f"Could not write '{key}' to the {self.namespace} cache: {e}")
+
+    def delete(self, key: str):
+        try:
+            self.backend.delete(self.make_key(key))
+        except CacheBackendError as e:
+            logger.warning(f"Could not delete '{key}' from the {self.namespace} cache: {e}")
+
+    def invalidate(self):
+        """Drops every entry of the namespace, in every process sharing the backend"""
+        try:
+            self.generation = (self.backend.incr(f"{self.namespace}:generation"), time.monotonic())
+        except CacheBackendError as e:
+            logger.warning(f"Could not invalidate the {self.namespace} cache: {e}")
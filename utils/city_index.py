@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+from utils.constants import CITY_INDEX_MAX_CITIES
+from utils.types import CityData
+
+
+class CitiesInvertedIndex:
+    """
+    Maps a normalized (lowercase) name to the cities that belong to it, so a lookup is a single dictionary hit.
+    Holds at most max_cities cities, the names that were used the least recently are evicted first.
+    """
+    max_cities: int
+    entries: OrderedDict  # name -> (cities, time the cities were fetched at)
+    cities_count: int
+
+    def __init__(self, max_cities: int = CITY_INDEX_MAX_CITIES):
+        self.max_cities = max_cities
+        self.entries = OrderedDict()
+        self.cities_count = 0
+        self.lock = threading.Lock()  # fetches index their results from worker threads
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def replace(self, name: str, cities_data: list[CityData], fetched_at: float = None):
+        """Stores the complete and up-to-date list of the name's cities, replacing whatever we knew about it before"""
+        name = name.lower()
+        with self.lock:
+            self.pop_entry(name)
+
+            self.entries[name] = (list(cities_data), fetched_at or time.time())
+            self.cities_count += len(cities_data)
+
+            while self.cities_count > self.max_cities and len(self.entries) > 1:
+                _, (evicted_cities, _) = self.entries.popitem(last=False)
+                self.cities_count -= len(evicted_cities)
+
+    def remove(self, name: str):
+        with self.lock:
+            self.pop_entry(name.lower())
+
+    def pop_entry(self, name: str):
+        entry = self.entries.pop(name, None)
+        if entry:
+            self.cities_count -= len(entry[0])
+
+    def get(self, name: str, max_age: float) -> list[CityData] | None:
+        """Returns a copy of the name's cities, None if we don't know them or they are older than max_age seconds"""
+        name = name.lower()
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or time.time() - entry[1] > max_age:
+                return None
+
+            self.entries.move_to_end(name)
+            return list(entry[0])
+
+    def stats(self) -> dict:
+        return {"names": len(self.entries), "cities": self.cities_count, "max_cities": self.max_cities}
+
+
+class WorldCityIndexes:
+    """The player -> cities and alliance -> cities indexes of a single world"""
+    players: CitiesInvertedIndex
+    alliances: CitiesInvertedIndex
+
+    def __init__(self):
+        self.players = CitiesInvertedIndex()
+        self.alliances = CitiesInvertedIndex()
+
+    def index_players(self, cities_data: list[CityData]):
+        """The cities must contain every city of every player in them (e.g. results of a nick search)"""
+        cities_per_player = {}
+        for city in cities_data:
+            cities_per_player.setdefault(city.player_name.lower(), []).append(city)
+
+        for player_name, player_cities in cities_per_player.items():
+            self.players.replace(player_name, player_cities)
+
+    def index_alliance(self, alliance_name: str, cities_data: list[CityData]):
+        """The cities must contain every city of the alliance's active members (e.g. results of an alliance search)"""
+        self.alliances.replace(alliance_name, cities_data)
+
+    def stats(self) -> dict:
+        return {"players": self.players.stats(), "alliances": self.alliances.stats()}
+
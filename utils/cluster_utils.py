@@ -0,0 +1,71 @@
+import numpy as np
+
+from utils.tracing import traced
+from utils.types import CityData
+
+
+class SingleLinkageDendrogram:
+    """
+    Single-linkage clustering of islands, stored as the minimum spanning tree over the islands.
+    Cutting every tree edge that is longer than a distance yields the same clusters as linking every pair of islands
+    within that distance, so any distance can be answered from the same tree without clustering again.
+
+    Distances are measured in tiles along the longest axis (chebyshev), an island at (+2, +2) is 2 tiles away.
+    """
+    islands: list[CityData]
+    edges: list[tuple[int, int, int]]  # (distance, island index, island index), shortest first
+
+    def __init__(self, islands: list[CityData]):
+        self.islands = islands
+        self.edges = self.build_minimum_spanning_tree([island.coords for island in islands])
+
+    @staticmethod
+    @traced()
+    def build_minimum_spanning_tree(coords: list[tuple[int, int]]) -> list[tuple[int, int, int]]:
+        """Prim's algorithm over the complete graph of islands, every step is a vectorized pass over the remaining islands"""
+        if len(coords) < 2:
+            return []
+
+        points = np.asarray(coords, dtype=np.int64)
+        in_tree = np.zeros(len(points), dtype=bool)
+        closest_distance = np.full(len(points), np.iinfo(np.int64).max)
+        closest_tree_island = np.zeros(len(points), dtype=np.int64)
+
+        edges = []
+        current = 0
+        for _ in range(len(points) - 1):
+            in_tree[current] = True
+
+            # Update how close every island outside the tree is to the tree now that 'current' joined it
+            distances = np.abs(points - points[current]).max(axis=1)
+            is_closer = ~in_tree & (distances < closest_distance)
+            closest_distance[is_closer] = distances[is_closer]
+            closest_tree_island[is_closer] = current
+
+            current = int(np.argmin(np.where(in_tree, np.iinfo(np.int64).max, closest_distance)))
+            edges.append((int(closest_distance[current]), int(closest_tree_island[current]), current))
+
+        return sorted(edges)
+
+    def cut(self, max_distance: int) -> list[list[CityData]]:
+        """Returns the clusters formed by islands that are linked within max_distance of each other"""
+        parents = list(range(len(self.islands)))
+
+        def find_root(island_index: int) -> int:
+            while parents[island_index] != island_index:
+                parents[island_index] = parents[parents[island_index]]
+                island_index = parents[island_index]
+            return island_index
+
+        for distance, first_island, second_island in self.edges:
+            if distance > max_distance:
+                break  # Edges are sorted, every following edge is too long as well
+            first_root, second_root = find_root(first_island), find_root(second_island)
+            parents[max(first_root, second_root)] = min(first_root, second_root)
+
+        # Group islands by cluster, keeping the original order of the islands
+        clusters = {}
+        for island_index, island in enumerate(self.islands):
+            clusters.setdefault(find_root(island_index), []).append(island)
+
+        return list(clusters.values())
@@ -3,17 +3,93 @@ import os
 from utils.types import WonderType, UnitType
 
 # - General Settings -
-DATA_FETCH_BASE_URL = 'https://ikalogs.ru/common/report/index/'  # link to call to obtain data from ika-logs
+DATA_FETCH_BASE_URL = os.getenv('IKALOGS_URL', 'https://ikalogs.ru/common/report/index/')  # link to call to obtain data from ika-logs
 BOT_TOKEN = os.getenv('BOT_TOKEN')  # discord app token
 BOT_ENV = str(os.getenv('BOT_ENV'))  # 'dev' or 'prod'
 
+# - Upstream Protection -
+UPSTREAM_TIMEOUT_SECONDS = 10  # requests to ika-logs that take longer than this are abandoned
+UPSTREAM_MAX_REQUESTS_PER_SECOND = 2.0  # request rate to ika-logs while it is healthy
+UPSTREAM_MIN_REQUESTS_PER_SECOND = 0.1  # the request rate never drops below this while ika-logs struggles
+UPSTREAM_BURST_SIZE = 5  # amount of requests that can be sent at once after a quiet period
+UPSTREAM_MAX_WAIT_SECONDS = 5  # how long a request may wait for the rate limiter before giving up
+CIRCUIT_FAILURE_THRESHOLD = 5  # consecutive failed/slow requests that stop all requests to ika-logs
+CIRCUIT_LATENCY_THRESHOLD_SECONDS = 8  # requests slower than this count as failures
+CIRCUIT_RESET_SECONDS = 60  # how long to wait before trying ika-logs again once the circuit opened
+RESPONSE_FRESH_SECONDS = 5 * 60  # cached responses older than this are served once more while being refreshed
+RESPONSE_CACHE_MAX_ENTRIES = 512  # amount of ika-logs responses kept in memory
+
+# - Guild Setup -
+GUILD_JOIN_BATCH_SECONDS = 2  # guilds joining within this long after the first one are set up in the same batch
+GUILD_JOIN_BATCH_SIZE = 100  # a batch of joined guilds is set up right away once it has this many guilds
+
+# - Cache Pre-warming -
+USAGE_WINDOW_SECONDS = 24 * 60 * 60  # command volume is ranked by the usage within this window
+ISLANDS_DATA_CACHE_SECONDS = 30 * 60  # islands data is reloaded from the db after this long
+PREWARM_INTERVAL_SECONDS = 60  # how often the pre-warmer checks for data that is about to expire
+PREWARM_REFRESH_AHEAD_RATIO = 0.8  # data is refreshed once it has lived this much of its lifetime
+PREWARM_ALLIANCES_PER_WORLD = 5  # the most requested alliances of every world are kept warm
+PREWARM_REQUEST_SPACING_SECONDS = 2  # pause between pre-warming requests, spreads the load on ika-logs
+
+# - Shared Cache -
+SHARED_CACHE_URL = os.getenv('SHARED_CACHE_URL', 'memory://')  # memory://, sqlite:///<path> or redis://host:port/db, bot processes sharing a sqlite or redis cache warm each other's caches
+SHARED_CACHE_MEMORY_MAX_ENTRIES = 1024  # amount of entries the memory backend keeps
+
+# - Command Profiling -
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))  # fraction of command invocations profiled, can be changed at runtime with /profiling
+PROFILE_SAMPLE_INTERVAL_SECONDS = 0.005  # how often a profiled command's stack is sampled
+PROFILE_MAX_FILES = 200  # the oldest profiles are deleted past this amount
+
+# - Tracing -
+TRACE_EXPORT_URL = os.getenv('TRACE_EXPORT_URL', '')  # file:///<path> or an OTLP collector's http://host:4318/v1/traces, tracing is off while empty
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.01))  # fraction of the interaction traces exported
+TRACE_SLOW_SECONDS = 3  # traces of interactions slower than this (or that failed) are always exported
+TRACE_EXPORT_QUEUE_SIZE = 1000  # traces waiting to be exported, traces finished while the queue is full are dropped
+
+# - Logging -
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')  # DEBUG also logs every sql query
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text for reading in a terminal, json for log collectors
+LOG_RATE_LIMIT_RECORDS = 20  # records logged per line of code per window, the rest are dropped and counted
+LOG_RATE_LIMIT_WINDOW_SECONDS = 60
+
+# - Snapshot Archive -
+SNAPSHOT_INTERVAL_SECONDS = 60 * 60  # how often the cities collected from ika-logs are archived as a snapshot
+SNAPSHOT_KEYFRAME_INTERVAL = 24  # every this many snapshots a full snapshot is stored instead of the changes only
+
 # - File Paths -
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # Project root
+DATABASE_PATH = os.getenv('DATABASE_PATH', os.path.join(BASE_DIR, 'database', 'guild_settings.sqlite'))  # guild settings, trades, islands and snapshots
 DEFAULT_SETTINGS_FILE_PATH = os.path.join(BASE_DIR, 'settings', 'default_settings.json')  # A set of default settings to fall back to
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(BASE_DIR, 'cache'))  # everything the bot persists besides the database
+RESPONSE_DISK_CACHE_DIR = os.path.join(CACHE_DIR, 'responses')  # ika-logs responses persisted across restarts
+PROFILES_DIR = os.path.join(CACHE_DIR, 'profiles')  # folded stacks of the profiled commands, one file per invocation
+RESPONSE_DISK_CACHE_MAX_BYTES = 200 * 1024 * 1024  # the least recently used responses are deleted past this size
+RESPONSE_DISK_CACHE_TTL_SECONDS = 24 * 60 * 60  # responses persisted longer ago than this are never served
 
 # - Configurations -
+WORLD_MAP_SIZE = 100  # the world map is a WORLD_MAP_SIZE x WORLD_MAP_SIZE grid of islands
+MAX_CITIES_PER_ISLAND = 16
 GOOD_WONDERS = [WonderType.POSEIDON, WonderType.FORGE]
 TRADE_REG_PATTERN = r"trade:\s*(.*)\s*for\s*(.*)"
+TRADE_QUEUE_SIZE = 1000  # trade offers waiting to be processed, offers posted while the queue is full are ignored
+TRADE_BATCH_SIZE = 50  # amount of trade offers matched and saved in a single transaction
+TRADE_BATCH_SECONDS = 0.25  # offers posted within this long after the first one of a batch join it
+TRAVEL_TIME_MATRIX_PAGE_SIZE = 15  # amount of (source, target) rows shown per page
+PLAN_ATTACK_PLAYERS_PER_PAGE = 5  # amount of players shown per page of an attack plan
+PLAN_ATTACK_CITIES_PER_PLAYER = 12  # amount of departures listed for each player, keeps the embed within discord's limits
+FRONTLINE_ROWS = 10  # amount of enemy cities and contested islands listed by the frontline command
+HEATMAP_TILE_SIZE = 6  # size in pixels of every island tile on a rendered heatmap
+HEATMAP_CACHE_SIZE = 64  # amount of rendered heatmaps kept in memory
+CLUSTERS_CACHE_SIZE = 32  # amount of alliance cluster dendrograms kept in memory
+ISLAND_LEADERBOARD_SIZE = 10  # amount of top islands precomputed for every list_best_islands filter combination
+ISLAND_TIER_PERCENTILES = {'S': 90, 'A': 70, 'B': 45, 'C': 20}  # minimum score percentile of every tier, the rest are D
+CITY_INDEX_MAX_CITIES = 200_000  # amount of cities every player/alliance inverted index of a world may hold
+CITY_INDEX_MAX_AGE_SECONDS = 10 * 60  # cities indexed longer ago than this are fetched again
+TARGET_FINDER_MAX_RADIUS = 30  # inactive targets are searched within at most this many tiles
+TARGET_FINDER_MAX_INACTIVE_HOURS = 7 * 24  # how far back the inactive targets finder looks for score changes
+TARGET_FINDER_ROWS = 15  # amount of inactive targets listed
+ISLAND_SEARCH_MAX_RADIUS = 50  # islands are searched within at most this many tiles
+ISLAND_SEARCH_ROWS = 15  # amount of islands listed by the island search
 
 # - Bot Emojis Mappings -
 e_advisor_bloated = '<:advisor_bloated:1287019312103686302>'
@@ -85,7 +161,8 @@ CALCULATE_CLUSTERS_DESCRIPTION = {
 
 GENERATE_HEATMAP_DESCRIPTION = {
     "alliance_name": "Name of the alliance",
-    "min_cities_on_island": "Minimum cities on an island"
+    "min_cities_on_island": "Minimum cities on an island",
+    "smoothing": "How many tiles to spread every island's heat over, 0 shows the exact islands"
 }
 
 FIND_PLAYER_DESCRIPTION = {
@@ -97,6 +174,14 @@ FIND_ISLAND_DESCRIPTION = {
     "coords": "The location of the island (in X:Y format)",
 }
 
+SEARCH_ISLANDS_DESCRIPTION = {
+    "coords": "The location to search around (in X:Y format)",
+    "radius": "Only islands within this many tiles of the coords are listed",
+    "min_free_spots": "Only islands with at least this many free spots are listed",
+    "resource_type": "Only islands with this resource are listed",
+    "miracle_type": "Only islands with this wonder are listed"
+}
+
 TRAVEL_TIME_DESCRIPTION = {
     "unit_type": "LAND/SEA",
     "start_coords": "The coords that the units come from",
@@ -104,6 +189,41 @@ TRAVEL_TIME_DESCRIPTION = {
     "using_poseidon": "Are you using the Poseidon miracle (100% reduction)?"
 }
 
+TRAVEL_TIME_MATRIX_DESCRIPTION = {
+    "unit_type": "LAND/SEA",
+    "search_type": "Whose cities the units come from, a player's or an alliance's",
+    "name": "The name of the player/alliance depending on what you chose at search_type",
+    "target_coords": "Comma separated list of destinations (in X:Y, X:Y format)",
+    "using_poseidon": "Are you using the Poseidon miracle (100% reduction)?",
+    "using_oligarchy": "Are you using the Oligarchy government (10% faster)?",
+    "sea_chart_level": "The level of your Sea Chart Archive (ships only)",
+    "page": "The page of results to show, fastest travel times come first"
+}
+
+PLAN_ATTACK_DESCRIPTION = {
+    "unit_type": "LAND/SEA",
+    "target_coords": "The island every wave should land on (in X:Y format)",
+    "landing_time": "When all waves should land, in UTC ('YYYY-MM-DD HH:MM' or 'HH:MM' for the next occurrence)",
+    "search_type": "Whether the participants are players or alliances",
+    "names": "Comma separated names of the participating players/alliances",
+    "using_poseidon": "Are you using the Poseidon miracle (100% reduction)?",
+    "using_oligarchy": "Are you using the Oligarchy government (10% faster)?",
+    "sea_chart_level": "The level of your Sea Chart Archive (ships only)",
+    "page": "The page of players to show, players that need to leave first come first"
+}
+
+FIND_INACTIVE_TARGETS_DESCRIPTION = {
+    "coords": "Comma separated coords to search around, e.g. '45:52, 47:60'",
+    "radius": "Only cities within this many tiles of the coords are listed",
+    "inactive_hours": "Only players whose score hasn't changed for at least this many hours are listed"
+}
+
+FRONTLINE_DESCRIPTION = {
+    "alliance_name": "Name of your alliance",
+    "enemy_alliance_name": "Name of the enemy alliance",
+    "contested_distance": "Islands with both alliances within this many tiles are considered contested"
+}
+
 CLOSEST_CITY_TO_TARGET_DESCRIPTION = {
     "search_type": "The type of search you'd like to make. If 'alliance', will search for closest ally city, if 'player', will search for closest player city.",
     "name": "The name of the player/alliance depending on what you chose at search_type",
@@ -120,3 +240,12 @@ CHANGE_SETTING_DESCRIPTION = {
     "setting": "The setting to change",
     "new_value": "The new value for the setting"
 }
+
+SET_TRADE_CHANNEL_DESCRIPTION = {
+    "channel": "The only channel trade offers are picked up in, leave empty to pick them up in every channel"
+}
+
+PROFILING_DESCRIPTION = {
+    "sample_rate": "Fraction of all command invocations to profile, between 0 (off) and 1 (every invocation)",
+    "command": "A command to profile on every invocation, pick it again to stop"
+}
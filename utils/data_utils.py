@@ -1,9 +1,10 @@
+import hashlib
 import json
+from urllib.parse import parse_qs
 
-import requests
-
-from utils.constants import DATA_FETCH_BASE_URL
+from utils.tracing import span
 from utils.types import CityData
+from utils.upstream import ikalogs_client
 
 
 # def serialize_islands_data(islands_data: list[IslandData]) -> list[dict]:
@@ -100,32 +101,94 @@ def load_json_file(settings_file_path: str):
 def fetch_data(query: str, filter_for_this_exact_name: str = None) -> list[CityData]:
     """
     Fetch city data from the Ika-logs site based on the provided query.
+    Waits on the Ika-logs rate limiter, so commands call it (and the fetchers built on it) in a worker thread.
 
     :param query: url params for the api call.
     :param filter_for_this_exact_name: optional - if provided, will filter the cities to only those owned by the player with this exact name.
     :return: The cities data in CityInfo object format
     """
 
-    params = {
-        'report': "User_WorldFind",
-        'query': f"{query}&limit=5000",
-        'order': "asc",
-        "sort": "nick",
-        "start": "0",
-        "limit": "5000"
-    }
-
-    response = requests.post(DATA_FETCH_BASE_URL, params=params)
-    if response.headers.get('Content-Type') == 'application/json':
-        data: list[dict] = response.json()['body']['rows']
-        cities = [CityData(row) for row in data]
-
-        if filter_for_this_exact_name:
-            # Filter out any startsWith matches, only exact name matches will remain
-            cities = [city for city in cities if city.player_name.lower() == filter_for_this_exact_name.lower()]
-
-        return cities
-
-    else:
-        raise ValueError(
-            f"the {f'player {filter_for_this_exact_name}' if filter_for_this_exact_name else 'alliance'} doesn't exist in this world/region")
+    with span("fetch_data", query=query):
+        data = ikalogs_client.fetch_rows(query)
+        if data is None:
+            raise ValueError(
+                f"the {f'player {filter_for_this_exact_name}' if filter_for_this_exact_name else 'alliance'} doesn't exist in this world/region")
+
+        with span("parse_cities", rows=len(data)):
+            cities = [CityData(row) for row in data]
+            index_fetched_cities(query, cities)
+
+    if filter_for_this_exact_name:
+        # Filter out any startsWith matches, only exact name matches will remain
+        cities = [city for city in cities if city.player_name.lower() == filter_for_this_exact_name.lower()]
+
+    return cities
+
+
+def get_world_from_query(query: str) -> tuple[int, int] | None:
+    """Extracts the (region_id, world_id) that an Ika-logs query targets"""
+    params = parse_qs(query)
+    try:
+        return int(params['server'][0]), int(params['world'][0])
+    except (KeyError, ValueError):
+        return None
+
+
+def index_fetched_cities(query: str, cities_data: list[CityData]):
+    """Feeds the results of a query into the indexes of the world it targets, as long as a guild still plays in it"""
+    # utils.world_data fetches its cities through this module, so it can only be imported here
+    from utils.world_data import get_world_data
+
+    world = get_world_from_query(query)
+    world_data = get_world_data(*world) if world else None
+    if world_data is None:
+        return
+
+    # Every name we come across is remembered for autocompletion
+    world_data.name_indexes.index_cities(cities_data)
+
+    # Only queries that return every city of a player/alliance may replace what the inverted indexes hold for it
+    params = parse_qs(query, keep_blank_values=True)
+    search, state = params.get('search', [''])[0], params.get('state', [None])[0]
+
+    has_every_city_of_its_players = False
+
+    if search == 'ally' and state == 'active' and 'allies[1]' in params:
+        world_data.city_indexes.index_alliance(params['allies[1]'][0], cities_data)
+        has_every_city_of_its_players = True
+
+    elif search == 'city' and state == '' and 'nick' in params and 'x' not in params:
+        world_data.city_indexes.index_players(cities_data)
+        has_every_city_of_its_players = True
+
+    # Every city we come across ends up in the world's next snapshot
+    world_data.snapshot_archive.observe(cities_data, has_every_city_of_its_players)
+
+
+def fetch_player_cities(region_id: int, world_id: int, player_name: str) -> list[CityData]:
+    """Fetch every city owned by the player with this exact name"""
+    return fetch_data(f"server={region_id}&world={world_id}&state=&search=city&nick={player_name}", player_name)
+
+
+def get_alliance_query(region_id: int, world_id: int, alliance_name: str) -> str:
+    return f"server={region_id}&world={world_id}&state=active&search=ally&allies[1]={alliance_name}"
+
+
+def fetch_alliance_cities(region_id: int, world_id: int, alliance_name: str) -> list[CityData]:
+    """Fetch every city of the active members of the alliance"""
+    return fetch_data(get_alliance_query(region_id, world_id, alliance_name))
+
+
+def prefetch_alliance_cities(region_id: int, world_id: int, alliance_name: str):
+    """Fetches the alliance's cities from Ika-logs even if they are cached, so they are refreshed before they expire"""
+    query = get_alliance_query(region_id, world_id, alliance_name)
+
+    rows = ikalogs_client.fetch_and_cache(query)
+    if rows is not None:
+        index_fetched_cities(query, [CityData(row) for row in rows])
+
+
+def get_cities_data_version(cities_data: list[CityData]) -> str:
+    """Fingerprints the cities data, any city that moves, changes owner or levels up results in a different version"""
+    fingerprint = sorted((city.x, city.y, city.player_name, city.city_name, city.city_level) for city in cities_data)
+    return hashlib.sha1(repr(fingerprint).encode()).hexdigest()
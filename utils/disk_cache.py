@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Queries that only differ by the order or case of their params are the same query"""
+    return urlencode(sorted((key, value.lower()) for key, value in parse_qsl(query, keep_blank_values=True)))
+
+
+class DiskResponseCache:
+    """
+    Second tier of the Ika-logs response cache, persisted as one gzip-compressed json file per query so that
+    a restarted bot comes back with warm data. Nothing is read from disk until the cache is first used, and once the
+    files take more than max_bytes the least recently used ones are deleted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.files = None  # file name -> (size in bytes, last access time), loaded on first use
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get_file_name(self, query: str) -> str:
+        return f"{hashlib.sha1(normalize_query(query).encode()).hexdigest()}.json.gz"
+
+    def load_index(self):
+        """Lists the cached files without reading them, only called once the cache is first needed"""
+        if self.files is not None:
+            return
+
+        self.files = {}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith('.json.gz'):
+                    stat = entry.stat()
+                    self.files[entry.name] = (stat.st_size, stat.st_mtime)
+        except OSError as e:
+            # Starts out empty, responses are still served from memory and upstream
+            logger.warning(f"Could not list the response cache at {self.directory}: {e}")
+
+        self.total_bytes = sum(size for size, _ in self.files.values())
+
+    def get(self, query: str) -> tuple[list[dict] | None, float] | None:
+        """Returns the cached (rows, time fetched at) of the query, None if it isn't cached or has expired"""
+        file_name = self.get_file_name(query)
+
+        with self.lock:
+            self.load_index()
+            if file_name not in self.files:
+                return None
+
+            file_path = os.path.join(self.directory, file_name)
+            try:
+                with gzip.open(file_path, 'rt', encoding='utf-8') as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                self.remove(file_name)
+                return None
+
+            if time.time() - cached['fetched_at'] > self.ttl_seconds:
+                self.remove(file_name)
+                return None
+
+            # The modification time doubles as the last access time, it survives restarts that way
+            os.utime(file_path)
+            self.files[file_name] = (self.files[file_name][0], time.time())
+
+        return cached['rows'], cached['fetched_at']
+
+    def set(self, query: str, rows: list[dict] | None, fetched_at: float):
+        file_name = self.get_file_name(query)
+        file_path = os.path.join(self.directory, file_name)
+        compressed = gzip.compress(json.dumps({"query": query, "fetched_at": fetched_at, "rows": rows}, separators=(',', ':')).encode())
+
+        with self.lock:
+            self.load_index()
+
+            # Write to a temporary file first, a crash mid-write must never leave a corrupted entry behind
+            temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(compressed)
+                os.replace(temp_path, file_path)
+            except OSError as e:
+                # Upstream already answered, the response is served all the same, it just won't survive a restart
+                logger.warning(f"Could not write the response of '{query}' to the response cache: {e}")
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                return
+
+            self.total_bytes -= self.files.get(file_name, (0, 0))[0]
+            self.files[file_name] = (len(compressed), time.time())
+            self.total_bytes += len(compressed)
+
+            self.evict()
+
+    def evict(self):
+        """Deletes the least recently used files until the cache fits within max_bytes"""
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        for file_name, _ in sorted(self.files.items(), key=lambda file: file[1][1]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            self.remove(file_name)
+
+    def remove(self, file_name: str):
+        size, _ = self.files.pop(file_name, (0, 0))
+        self.total_bytes -= size
+
+        try:
+            os.remove(os.path.join(self.directory, file_name))
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        with self.lock:
+            self.load_index()
+            return {"files": len(self.files), "bytes": self.total_bytes, "max_bytes": self.max_bytes}
@@ -1,9 +1,19 @@
+import datetime
 import random
 from collections import defaultdict
 from typing import LiteralString
 
-from utils.constants import GOOD_WONDERS, BOT_EMJOIS
-from utils.math_utils import get_distance_from_target
+import numpy as np
+
+from utils.constants import BOT_EMJOIS, MAX_CITIES_PER_ISLAND
+from utils.island_scoring import (
+    DEFAULT_SCORING_WEIGHTS,
+    IslandColumns,
+    IslandScoringWeights,
+    assign_tiers,
+    rank_island_indexes,
+    score_islands
+)
 from utils.types import CityData, ResourceType, WonderType
 
 
@@ -31,49 +41,69 @@ def generate_cluster_name() -> str:
     return f"{random.choice(prefixes)}{random.choice(suffixes)}"
 
 
-def rank_islands(islands_data: list[dict], resource_type: ResourceType = None, miracle_type: WonderType = None, no_full_islands: bool = False) -> list[tuple[dict, int]]:
-    # Filter islands based on the input criteria
+def calculate_island_score(island: dict, weights: IslandScoringWeights = DEFAULT_SCORING_WEIGHTS) -> int:
+    """Scores a single island, use score_islands to score many islands at once"""
+    return int(score_islands(IslandColumns([island]), weights)[0])
+
+
+def assign_island_tiers(islands_data: list[dict], weights: IslandScoringWeights = DEFAULT_SCORING_WEIGHTS):
+    """Sets the S/A/B/C/D tier of every island, based on the percentile of its score among all islands of the world"""
+    tiers = assign_tiers(score_islands(IslandColumns(islands_data), weights))
+    for island, tier in zip(islands_data, tiers):
+        island['tier'] = tier
 
+
+def rank_islands(islands_data: list[dict], resource_type: ResourceType = None, miracle_type: WonderType = None, no_full_islands: bool = False,
+                 weights: IslandScoringWeights = DEFAULT_SCORING_WEIGHTS) -> list[tuple[dict, int]]:
+    columns = IslandColumns(islands_data)
+
+    # Filter islands based on the input criteria
+    applicable = np.ones(len(columns), dtype=bool)
     if resource_type:
-        islands_data = [island for island in islands_data if island['resource_type'] == str(resource_type)]
+        applicable &= columns.resource_type == str(resource_type)
 
     if miracle_type:
-        islands_data = [island for island in islands_data if island['wonder_type'] == str(miracle_type)]
+        applicable &= columns.wonder_type == str(miracle_type)
 
     if no_full_islands:
-        # Check how many times an island appears in the list
-        islands_data = [island for island in islands_data if island['taken_spots'] < 16]
+        applicable &= columns.taken_spots < MAX_CITIES_PER_ISLAND
 
-    # Calculate ranking score for each island
-    def calculate_rank(island: dict) -> int:
-        rank_score = 0
-        free_spots_weight = 5  # Score weight per free spot
+    # List of islands with their rank scores, best first
+    scores = score_islands(columns, weights)
+    return [(islands_data[index], int(scores[index])) for index in rank_island_indexes(scores) if applicable[index]]
 
-        # Prioritize islands with free spots (max 16 cities per island)
-        free_spots = 16 - len(island.cities) if hasattr(island, 'cities') else 16
-        rank_score += free_spots * free_spots_weight
 
-        # Add wood, resource, and wonder levels to the score
-        rank_score += island['wood_level'] * 5
-        rank_score += island['resource_level'] * 6
-        rank_score += island['wonder_level'] * 2
+def build_island_leaderboards(islands_data: list[dict], leaderboard_size: int,
+                              weights: IslandScoringWeights = DEFAULT_SCORING_WEIGHTS) -> dict[tuple[str, str, bool], tuple[int, list[tuple[dict, int]]]]:
+    """
+    Scores the islands once and splits them into a leaderboard for every (resource, wonder, no full islands) combination.
 
-        # Extra boost if the wonder is considered "good"
-        if island['wonder_type'] in map(str, GOOD_WONDERS):
-            rank_score += 150
+    :return: (resource_type, wonder_type, no_full_islands) -> (amount of applicable islands, top islands with their scores)
+    """
+    columns = IslandColumns(islands_data)
+    scores = score_islands(columns, weights)
+    ranking = rank_island_indexes(scores)
 
-        # Rank the island higher the closer it is to the map's center
-        distance_from_center = get_distance_from_target((island['x'], island['y']), (50, 50))
-        rank_score -= int(distance_from_center)
+    # Reordering the columns by rank once means every filter's islands come out already sorted
+    ranked_resource_types = columns.resource_type[ranking]
+    ranked_wonder_types = columns.wonder_type[ranking]
+    ranked_open = columns.taken_spots[ranking] < MAX_CITIES_PER_ISLAND
 
-        return rank_score
+    leaderboards = {}
+    for resource_type in ResourceType:
+        resource_mask = ranked_resource_types == str(resource_type)
 
-    # List of islands with their rank scores
-    ranked_islands = [(island, calculate_rank(island)) for island in islands_data]
-    ranked_islands.sort(key=lambda ranked_island: ranked_island[1],
-                        reverse=True)  # ranked_island[1] is the score of the island
+        for wonder_type in WonderType:
+            filter_mask = resource_mask & (ranked_wonder_types == str(wonder_type))
 
-    return ranked_islands
+            for no_full_islands, mask in ((False, filter_mask), (True, filter_mask & ranked_open)):
+                filter_ranking = ranking[mask]
+                leaderboards[(str(resource_type), str(wonder_type), no_full_islands)] = (
+                    len(filter_ranking),
+                    [(islands_data[index], int(scores[index])) for index in filter_ranking[:leaderboard_size]]
+                )
+
+    return leaderboards
 
 
 def truncate_string(raw_string: str, char_limit: int):
@@ -84,16 +114,8 @@ def get_amount_of_open_spots(taken_spots: int) -> int:
     return 16 - taken_spots
 
 
-def get_island_tier(x_pos: int, y_pos: int, islands_data: list[dict]) -> str:
-    if not islands_data:
-        return 'N/A'
-
-    for island in islands_data:
-        if 'tier' in island:
-            if island['x'] == x_pos and island['y'] == y_pos:
-                return island['tier']
-        else:
-            return 'N/A'
+def get_island_tier(x_pos: int, y_pos: int, island_tiers: dict[tuple[int, int], str]) -> str:
+    return island_tiers.get((x_pos, y_pos), 'N/A')
 
 
 def collect_island_data(island_data: dict, coords: tuple) -> list[tuple | int | str]:
@@ -120,3 +142,47 @@ def convert_to_emojis(message: LiteralString):
 
     # Convert to emoji if available, otherwise keep the original name
     return ", ".join([BOT_EMJOIS.get(substring.lower(), substring) for substring in split_message])
+
+
+def parse_coords(raw_coords: str) -> tuple[int, int]:
+    """Parses a 'X:Y' string into a coords tuple"""
+    try:
+        x, y = map(int, raw_coords.strip().split(':'))
+    except ValueError:
+        raise ValueError(f"invalid coordinates format: {raw_coords}. Expected format 'X:Y'.")
+
+    return x, y
+
+
+def parse_coords_list(raw_coords_list: str) -> list[tuple[int, int]]:
+    """Parses a comma separated list of 'X:Y' strings, duplicates are removed while keeping the original order"""
+    coords_list = [parse_coords(raw_coords) for raw_coords in raw_coords_list.split(',') if raw_coords.strip()]
+    if not coords_list:
+        raise ValueError("no coordinates were provided! Use 'X:Y, X:Y'.")
+
+    return list(dict.fromkeys(coords_list))
+
+
+def format_travel_time(travel_time_minutes: float) -> str:
+    hours, minutes = divmod(int(travel_time_minutes), 60)
+    return f"{hours}h {minutes:02d}m"
+
+
+def parse_landing_time(raw_landing_time: str, now: datetime.datetime = None) -> datetime.datetime:
+    """
+    Parses a UTC landing time in 'YYYY-MM-DD HH:MM' or 'HH:MM' format.
+    When only 'HH:MM' is given, the next occurrence of that time is used.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    raw_landing_time = raw_landing_time.strip()
+
+    try:
+        if ' ' in raw_landing_time:
+            return datetime.datetime.strptime(raw_landing_time, "%Y-%m-%d %H:%M").replace(tzinfo=datetime.timezone.utc)
+
+        time_of_day = datetime.datetime.strptime(raw_landing_time, "%H:%M").time()
+    except ValueError:
+        raise ValueError(f"invalid landing time: {raw_landing_time}. Expected format 'YYYY-MM-DD HH:MM' or 'HH:MM' (UTC).")
+
+    landing_time = datetime.datetime.combine(now.date(), time_of_day, tzinfo=datetime.timezone.utc)
+    return landing_time if landing_time > now else landing_time + datetime.timedelta(days=1)
@@ -0,0 +1,82 @@
+import struct
+import zlib
+
+import numpy as np
+
+from utils.constants import WORLD_MAP_SIZE
+from utils.tracing import traced
+
+# Colors that the heatmap fades through, from empty sea to the densest island
+HEATMAP_COLOR_STOPS = np.array([
+    [12, 27, 51],
+    [31, 84, 133],
+    [46, 160, 67],
+    [241, 196, 15],
+    [230, 126, 34],
+    [192, 57, 43],
+], dtype=np.float64)
+
+
+@traced()
+def rasterize_coords(coords: list[tuple[int, int]], weights: list[int] = None) -> np.ndarray:
+    """
+    Bins coordinates onto the world map grid in a single vectorized pass.
+
+    :return: a (WORLD_MAP_SIZE x WORLD_MAP_SIZE) grid indexed by [y - 1, x - 1]
+    """
+    if not coords:
+        return np.zeros((WORLD_MAP_SIZE, WORLD_MAP_SIZE), dtype=np.float64)
+
+    coords_array = np.clip(np.asarray(coords, dtype=np.int64).reshape(-1, 2) - 1, 0, WORLD_MAP_SIZE - 1)
+    flat_indexes = coords_array[:, 1] * WORLD_MAP_SIZE + coords_array[:, 0]
+
+    grid = np.bincount(flat_indexes, weights=weights, minlength=WORLD_MAP_SIZE * WORLD_MAP_SIZE)
+    return grid.reshape(WORLD_MAP_SIZE, WORLD_MAP_SIZE).astype(np.float64)
+
+
+@traced()
+def smooth_grid(grid: np.ndarray, radius: int) -> np.ndarray:
+    """Applies a separable gaussian blur with the given radius (in tiles), a radius of 0 returns the grid as is"""
+    if radius <= 0:
+        return grid
+
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-(offsets ** 2) / (2 * (radius / 2) ** 2))
+    kernel /= kernel.sum()
+
+    # Blur the rows and then the columns, every output cell is a weighted sum of its shifted neighbors
+    padded = np.pad(grid, radius)
+    rows_blurred = sum(weight * padded[:, radius + offset:radius + offset + grid.shape[1]] for offset, weight in zip(offsets, kernel))
+    return sum(weight * rows_blurred[radius + offset:radius + offset + grid.shape[0], :] for offset, weight in zip(offsets, kernel))
+
+
+@traced()
+def grid_to_heatmap_rgb(grid: np.ndarray, tile_size: int) -> np.ndarray:
+    """Maps every grid cell to a color and scales each cell up to a (tile_size x tile_size) block of pixels"""
+    max_value = grid.max()
+    normalized = grid / max_value if max_value > 0 else grid
+
+    # Interpolate every channel between the color stops
+    stop_positions = np.linspace(0, 1, len(HEATMAP_COLOR_STOPS))
+    rgb = np.stack([np.interp(normalized, stop_positions, HEATMAP_COLOR_STOPS[:, channel]) for channel in range(3)], axis=-1)
+
+    return np.repeat(np.repeat(rgb.astype(np.uint8), tile_size, axis=0), tile_size, axis=1)
+
+
+@traced()
+def encode_png(rgb: np.ndarray) -> bytes:
+    """Encodes a (height x width x 3) uint8 array as a PNG file"""
+    height, width, _ = rgb.shape
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+
+    # Every scanline starts with a filter type byte, 0 means no filtering
+    scanlines = np.hstack([np.zeros((height, 1), dtype=np.uint8), rgb.reshape(height, width * 3)])
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
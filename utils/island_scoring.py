@@ -0,0 +1,94 @@
+import hashlib
+from typing import NamedTuple
+
+import numpy as np
+
+from utils.constants import GOOD_WONDERS, ISLAND_TIER_PERCENTILES, MAX_CITIES_PER_ISLAND, WORLD_MAP_SIZE
+
+
+class IslandScoringWeights(NamedTuple):
+    """How much every island attribute is worth, pass different weights to score islands for a different play style"""
+    free_spot: float = 5
+    wood_level: float = 5
+    resource_level: float = 6
+    wonder_level: float = 2
+    good_wonder_bonus: float = 150
+    distance_from_center: float = 1  # subtracted per field away from the center of the map
+
+    def get_version(self) -> str:
+        """Short fingerprint of the weights, scores computed with other weights are not comparable"""
+        return hashlib.sha1(repr(tuple(self)).encode()).hexdigest()[:8]
+
+
+DEFAULT_SCORING_WEIGHTS = IslandScoringWeights()
+GOOD_WONDER_NAMES = [str(wonder) for wonder in GOOD_WONDERS]
+
+
+class IslandColumns:
+    """
+    The attributes of a list of islands stored as one numpy array per attribute,
+    so every island can be scored at once instead of looping over the islands one by one.
+    """
+    x: np.ndarray
+    y: np.ndarray
+    wood_level: np.ndarray
+    resource_level: np.ndarray
+    wonder_level: np.ndarray
+    taken_spots: np.ndarray
+    resource_type: np.ndarray
+    wonder_type: np.ndarray
+
+    def __init__(self, islands_data: list[dict]):
+        def int_column(key: str) -> np.ndarray:
+            return np.fromiter((island[key] or 0 for island in islands_data), dtype=np.int64, count=len(islands_data))
+
+        self.x = int_column('x')
+        self.y = int_column('y')
+        self.wood_level = int_column('wood_level')
+        self.resource_level = int_column('resource_level')
+        self.wonder_level = int_column('wonder_level')
+        self.taken_spots = int_column('taken_spots')
+        self.resource_type = np.array([island['resource_type'] for island in islands_data], dtype=object)
+        self.wonder_type = np.array([island['wonder_type'] for island in islands_data], dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def get_free_spots(self) -> np.ndarray:
+        # Some islands report more taken spots than they have, they have no free spots left either way
+        return np.clip(MAX_CITIES_PER_ISLAND - self.taken_spots, 0, MAX_CITIES_PER_ISLAND)
+
+
+def score_islands(columns: IslandColumns, weights: IslandScoringWeights = DEFAULT_SCORING_WEIGHTS) -> np.ndarray:
+    """Scores every island in a single vectorized pass, higher is better"""
+    center = WORLD_MAP_SIZE / 2
+    distance_from_center = np.hypot(columns.x - center, columns.y - center)
+
+    scores = (
+        columns.get_free_spots() * weights.free_spot
+        + columns.wood_level * weights.wood_level
+        + columns.resource_level * weights.resource_level
+        + columns.wonder_level * weights.wonder_level
+        + np.isin(columns.wonder_type, GOOD_WONDER_NAMES) * weights.good_wonder_bonus
+        - np.trunc(distance_from_center) * weights.distance_from_center
+    )
+
+    return np.trunc(scores).astype(np.int64)
+
+
+def assign_tiers(scores: np.ndarray) -> np.ndarray:
+    """Gives every island the tier of the score percentile it falls in, e.g. S for the best 10% of the islands"""
+    tiers = np.full(len(scores), 'D', dtype=object)
+    if len(scores) == 0:
+        return tiers
+
+    # Going from the lowest to the highest tier, so every island ends up with the highest tier it qualifies for
+    for tier, percentile in sorted(ISLAND_TIER_PERCENTILES.items(), key=lambda tier_percentile: tier_percentile[1]):
+        tiers[scores >= np.percentile(scores, percentile)] = tier
+
+    return tiers
+
+
+def rank_island_indexes(scores: np.ndarray) -> np.ndarray:
+    """Indexes of the islands from the highest to the lowest score, islands with the same score keep their order"""
+    return np.argsort(-scores, kind='stable')
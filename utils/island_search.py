@@ -0,0 +1,84 @@
+import math
+
+import numpy as np
+
+from utils.constants import MAX_CITIES_PER_ISLAND
+from utils.island_scoring import IslandColumns
+from utils.spatial_utils import SpatialGrid
+from utils.tracing import traced
+from utils.types import ResourceType, WonderType
+
+
+class IslandSearchIndex:
+    """
+    Indexes the islands of a world for compound searches (location + attributes).
+
+    Every attribute value has a precomputed bitmap of the islands that have it, so a compound filter is a couple of
+    ANDs over bitmaps. The matching islands are then either measured directly, or looked up around the location on a
+    spatial grid, whichever has fewer islands to check.
+    """
+    islands_data: list[dict]
+    columns: IslandColumns
+    grid: SpatialGrid
+    resource_bitmaps: dict[str, np.ndarray]
+    wonder_bitmaps: dict[str, np.ndarray]
+    free_spots_bitmaps: list[np.ndarray]  # index n holds the islands with at least n free spots
+
+    def __init__(self, islands_data: list[dict]):
+        self.islands_data = islands_data
+        self.columns = IslandColumns(islands_data)
+        self.grid = SpatialGrid(list(zip(self.columns.x.tolist(), self.columns.y.tolist())))
+
+        self.resource_bitmaps = {str(resource_type): self.columns.resource_type == str(resource_type) for resource_type in ResourceType}
+        self.wonder_bitmaps = {str(wonder_type): self.columns.wonder_type == str(wonder_type) for wonder_type in WonderType}
+
+        free_spots = self.columns.get_free_spots()
+        self.free_spots_bitmaps = [free_spots >= spots for spots in range(MAX_CITIES_PER_ISLAND + 1)]
+
+    def get_filter_bitmap(self, min_free_spots: int = 0, resource_type: str = None, wonder_type: str = None) -> np.ndarray:
+        bitmap = self.free_spots_bitmaps[max(0, min(min_free_spots, MAX_CITIES_PER_ISLAND))]
+
+        if resource_type:
+            bitmap = bitmap & self.resource_bitmaps.get(resource_type, np.zeros(len(self.columns), dtype=bool))
+
+        if wonder_type:
+            bitmap = bitmap & self.wonder_bitmaps.get(wonder_type, np.zeros(len(self.columns), dtype=bool))
+
+        return bitmap
+
+    def estimate_islands_in_radius(self, radius: float) -> float:
+        """Roughly how many islands a grid lookup would visit, assuming islands are spread evenly over the used cells"""
+        if not self.grid.cells:
+            return 0
+
+        islands_per_cell = len(self.grid) / len(self.grid.cells)
+        cells_visited = (2 * math.ceil(radius / self.grid.cell_size) + 1) ** 2
+
+        return islands_per_cell * cells_visited
+
+    @traced()
+    def search(self, coords: tuple[int, int], radius: float, min_free_spots: int = 0, resource_type: str = None,
+               wonder_type: str = None) -> list[tuple[dict, float]]:
+        """
+        Finds the islands within the radius of the coords that pass every filter.
+
+        :return: (island, distance to the coords) pairs, closest first
+        """
+        bitmap = self.get_filter_bitmap(min_free_spots, resource_type, wonder_type)
+        matches_count = int(np.count_nonzero(bitmap))
+        if matches_count == 0:
+            return []
+
+        # Selective filters leave few islands to measure, wide filters are better narrowed down by location first
+        if matches_count <= self.estimate_islands_in_radius(radius):
+            indexes = np.flatnonzero(bitmap)
+            distances = np.hypot(self.columns.x[indexes] - coords[0], self.columns.y[indexes] - coords[1])
+            within_radius = distances <= radius
+            indexes, distances = indexes[within_radius], distances[within_radius]
+
+            matches = zip(indexes.tolist(), distances.tolist())
+        else:
+            matches = ((index, distance) for index, distance in self.grid.within_radius(coords, radius) if bitmap[index])
+
+        # Both paths break ties the same way, so the results never depend on which one was taken
+        return [(self.islands_data[index], distance) for index, distance in sorted(matches, key=lambda match: (match[1], match[0]))]
@@ -0,0 +1,177 @@
+import atexit
+import contextlib
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+from utils.tracing import get_trace_id
+
+MAX_QUEUED_RECORDS = 10000  # records waiting to be written, records logged while the queue is full are dropped
+
+# Fields every record logged within the current command carries, e.g. the command name and guild
+log_context: contextvars.ContextVar[dict] = contextvars.ContextVar("log_context", default={})
+
+# The attributes every LogRecord has, anything else on a record was passed through extra={...}
+STANDARD_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "context", "suppressed", "dropped"}
+
+
+@contextlib.contextmanager
+def logging_context(**fields):
+    """Adds the fields to every record logged within the block, including from tasks and threads started in it"""
+    token = log_context.set({**log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Attaches the current logging context and trace id to the record, runs in the thread that logged it"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = dict(log_context.get())
+        trace_id = get_trace_id()
+        if trace_id:
+            record.context["trace_id"] = trace_id
+
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most max_records records per call site every window_seconds, the rest are dropped.
+    The first record let through after some were dropped says how many (the 'suppressed' field).
+    """
+
+    def __init__(self, max_records: int, window_seconds: float):
+        super().__init__()
+        self.max_records = max_records
+        self.window_seconds = window_seconds
+        self.call_sites = {}  # (logger, file, line) -> [window start, records let through, records suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.CRITICAL:
+            return True
+
+        now = time.monotonic()
+        with self.lock:
+            call_site = self.call_sites.setdefault((record.name, record.pathname, record.lineno), [now, 0, 0])
+            if now - call_site[0] >= self.window_seconds:
+                call_site[0], call_site[1] = now, 0
+
+            if call_site[1] >= self.max_records:
+                call_site[2] += 1
+                return False
+
+            call_site[1] += 1
+            if call_site[2]:
+                record.suppressed, call_site[2] = call_site[2], 0
+
+        return True
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records over to the listener thread, which formats and writes them, so logging never blocks the event loop
+    on stdout. Records logged while the queue is full are dropped, the next record that makes it says how many.
+    """
+
+    def __init__(self, record_queue: queue.Queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The message is merged with its args right away since the args may change before the record is written
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.dropped:
+            record.dropped = self.dropped
+
+        try:
+            self.queue.put_nowait(record)
+            self.dropped = 0
+        except queue.Full:
+            self.dropped += 1
+
+
+def get_record_fields(record: logging.LogRecord) -> dict:
+    """The context, extra and rate limiting fields of the record"""
+    fields = dict(getattr(record, "context", {}))
+    fields.update((key, value) for key, value in vars(record).items() if key not in STANDARD_RECORD_ATTRIBUTES)
+    for key in ("suppressed", "dropped"):
+        if hasattr(record, key):
+            fields[key] = getattr(record, key)
+
+    return fields
+
+
+class JsonFormatter(logging.Formatter):
+    """A json object per line, for log collectors"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **get_record_fields(record),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """'time | level | message | key=value ...' lines, for reading the logs in a terminal"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{datetime.datetime.fromtimestamp(record.created)} | {record.levelname} | {record.getMessage()}"
+        fields = get_record_fields(record)
+        if fields:
+            line += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+
+        return line
+
+
+log_queue = queue.Queue(MAX_QUEUED_RECORDS)
+queue_handler = BackgroundQueueHandler(log_queue)
+queue_handler.addFilter(ContextFilter())
+
+queue_listener: logging.handlers.QueueListener | None = None
+
+
+def setup_logging(level: str, log_format: str, rate_limit_records: int, rate_limit_window_seconds: float):
+    """Starts writing the logged records to stdout from a background thread, as json or text lines"""
+    global queue_listener
+    if queue_listener is not None:
+        return
+
+    # Only installed once the listener writes the queued records, until then (and in scripts that never call this)
+    # python's last resort handler writes the warnings and errors to stderr
+    logging.getLogger().addHandler(queue_handler)
+    logging.getLogger().setLevel(level.upper())
+    queue_handler.addFilter(RateLimitFilter(rate_limit_records, rate_limit_window_seconds))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+
+    queue_listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    queue_listener.start()
+
+    # Writes whatever is still queued when the bot exits
+    atexit.register(queue_listener.stop)
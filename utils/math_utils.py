@@ -1,6 +1,10 @@
 import math
 
-from utils.types import CityData
+import numpy as np
+
+from utils.constants import ship_units, unit_speeds
+from utils.tracing import traced
+from utils.types import CityData, UnitType
 
 
 def get_distance_from_target(city_coords: tuple, target_coords: tuple):
@@ -14,3 +18,51 @@ def get_distance_from_target(city_coords: tuple, target_coords: tuple):
 def get_closest_city(cities_data: list[CityData], target_coords: tuple) -> CityData:
     """Helper method to find the closest city of a list of cities to the target coordinates"""
     return min(cities_data, key=lambda city: get_distance_from_target(city.coords, target_coords))
+
+
+def get_unit_speed(unit_type: UnitType, using_oligarchy: bool = False, using_poseidon: bool = False, sea_chart_level: int = 0) -> float:
+    """Calculates the speed of a unit after applying every available speed modifier"""
+    base_speed = unit_speeds.get(unit_type)
+
+    # Apply Oligarchy bonus (1.10x speed if Oligarchy is active)
+    if using_oligarchy:
+        base_speed *= 1.1
+
+    # Apply Sea Chart Archive bonus (only for ships, level increases speed)
+    if unit_type in ship_units:
+        base_speed *= (1 + sea_chart_level / 100)
+
+    # Apply Poseidon Miracle bonus
+    if using_poseidon:
+        base_speed *= 2
+
+    return base_speed
+
+
+def get_travel_time_minutes(distance: float, unit_speed: float) -> float:
+    """Time to travel in minutes = 1200 / speed * distance"""
+    return (1200 / unit_speed) * distance
+
+
+def get_distances_matrix(source_coords: list[tuple], target_coords: list[tuple]) -> np.ndarray:
+    """
+    Vectorized version of get_distance_from_target for many sources and many targets at once.
+
+    :return: a (sources x targets) matrix of distances, same island distances are 0.5 like in get_distance_from_target
+    """
+    sources = np.asarray(source_coords, dtype=np.float64).reshape(-1, 2)
+    targets = np.asarray(target_coords, dtype=np.float64).reshape(-1, 2)
+
+    distances = np.hypot(
+        sources[:, 0, np.newaxis] - targets[np.newaxis, :, 0],
+        sources[:, 1, np.newaxis] - targets[np.newaxis, :, 1]
+    )
+    distances[distances == 0] = 0.5
+
+    return distances
+
+
+@traced()
+def get_travel_times_matrix(source_coords: list[tuple], target_coords: list[tuple], unit_speed: float) -> np.ndarray:
+    """Calculates the travel time (in minutes) from every source to every target in a single pass"""
+    return get_travel_time_minutes(get_distances_matrix(source_coords, target_coords), unit_speed)
@@ -0,0 +1,69 @@
+import threading
+from bisect import bisect_left, insort
+
+from utils.types import CityData
+
+
+class NamePrefixIndex:
+    """
+    Keeps names sorted by their lowercase form, so every name that starts with a prefix sits in one contiguous
+    slice of the list that is found with a binary search, no matter how many names the world has.
+    """
+    sorted_names: list[str]  # lowercase names, sorted
+    display_names: dict[str, str]  # lowercase name -> name as it appears in the game
+
+    def __init__(self):
+        self.sorted_names = []
+        self.display_names = {}
+        self.lock = threading.Lock()  # fetches index their results from worker threads
+
+    def __len__(self) -> int:
+        return len(self.sorted_names)
+
+    def add_names(self, names: list[str]):
+        with self.lock:
+            new_names = {}
+            for name in names:
+                if name and name.lower() not in self.display_names:
+                    new_names[name.lower()] = name
+
+            if not new_names:
+                return
+
+            self.display_names.update(new_names)
+
+            # Re-sorting an almost sorted list is cheap, inserting one by one would shift the list for every name
+            if len(new_names) > 1:
+                self.sorted_names = sorted(self.sorted_names + list(new_names))
+            else:
+                insort(self.sorted_names, next(iter(new_names)))
+
+    def search(self, prefix: str, limit: int = 25) -> list[str]:
+        """Returns up to `limit` names that start with the prefix (case-insensitive), in alphabetical order"""
+        prefix = prefix.lower()
+        with self.lock:
+            start = bisect_left(self.sorted_names, prefix)
+            candidates = self.sorted_names[start:start + limit]
+
+        matches = []
+        for name in candidates:
+            if not name.startswith(prefix):
+                break
+            matches.append(self.display_names[name])
+
+        return matches
+
+
+class WorldNameIndexes:
+    """The player and alliance name indexes of a single world"""
+    players: NamePrefixIndex
+    alliances: NamePrefixIndex
+
+    def __init__(self):
+        self.players = NamePrefixIndex()
+        self.alliances = NamePrefixIndex()
+
+    def index_cities(self, cities_data: list[CityData]):
+        self.players.add_names([city.player_name for city in cities_data])
+        self.alliances.add_names([city.ally_name for city in cities_data if getattr(city, 'ally_name', None)])
+
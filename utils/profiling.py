@@ -0,0 +1,226 @@
+import contextvars
+import datetime
+import functools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_STACK_DEPTH = 128
+
+
+def format_frame(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def get_stack(frame, anchor=None) -> tuple[str, ...] | None:
+    """
+    The innermost frames of the stack, outermost first. With an anchor frame only the frames from the anchor inwards
+    are kept, None if the anchor isn't on the stack.
+    """
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        if frame is anchor:
+            break
+        frame = frame.f_back
+    else:
+        if anchor is not None:
+            return None
+
+    return tuple(format_frame(frame) for frame in reversed(frames[:MAX_STACK_DEPTH]))
+
+
+class StackSampler:
+    """
+    Samples the stacks of threads every interval_seconds from a background thread. The sampled threads never notice,
+    so the overhead is one stack walk per sample, no matter how many calls the profiled code makes.
+
+    Every sampled thread comes with an anchor frame, only the samples taken while the thread runs code called from
+    that frame are kept. That's how the event loop thread is only sampled while it runs the profiled command's
+    coroutine, and not while it runs other commands or waits for events.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.anchors = {}  # thread id -> anchor frame
+        self.samples = Counter()  # stack -> times it was sampled
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample_forever, name="stack-sampler", daemon=True)
+
+    def add_thread(self, thread_id: int, anchor):
+        with self.lock:
+            self.anchors[thread_id] = anchor
+
+    def remove_thread(self, thread_id: int):
+        with self.lock:
+            self.anchors.pop(thread_id, None)
+
+    def sample_forever(self):
+        while not self.stopped.wait(self.interval_seconds):
+            with self.lock:
+                anchors = list(self.anchors.items())
+
+            frames = sys._current_frames()
+            for thread_id, anchor in anchors:
+                stack = get_stack(frames.get(thread_id), anchor)
+                if stack:
+                    self.samples[stack] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self) -> Counter:
+        self.stopped.set()
+        self.thread.join()
+        return self.samples
+
+
+def to_folded_stacks(samples: Counter, root_frame: str) -> str:
+    """
+    The samples in the collapsed stack format ('root;outer;inner count' lines) that flamegraph.pl, speedscope
+    and inferno read, every stack under the given root frame
+    """
+    return "".join(f"{';'.join((root_frame, *stack))} {count}\n" for stack, count in samples.most_common())
+
+
+class CommandProfile:
+    """
+    A running profile of a single command invocation: the frames called from the frame that started it, on the
+    event loop while the command's coroutine runs, and in the threads started for it through utils.async_utils.to_thread.
+    Time spent awaiting (on discord, on other tasks) isn't on any stack, the traces of utils.tracing break that down.
+    """
+
+    def __init__(self, profiler: 'CommandProfiler', command_name: str, command_params: dict, anchor):
+        self.profiler = profiler
+        self.command_name = command_name
+        self.command_params = command_params
+        self.start_time = time.perf_counter()
+        self.context_token = None  # resets active_profile once the command is done, see CommandProfiler.start
+        self.sampler = StackSampler(profiler.interval_seconds)
+        self.sampler.add_thread(threading.get_ident(), anchor)
+        self.sampler.start()
+
+    def get_root_frame(self) -> str:
+        params = ",".join(f"{key}={value}" for key, value in self.command_params.items())
+        # ';' separates frames and whitespace separates the count in the folded format
+        return re.sub(r"[;\s]+", "_", f"{self.command_name}({params})")
+
+    def deactivate(self):
+        """Threads started from the command's context from now on aren't sampled anymore, called from that context"""
+        active_profile.reset(self.context_token)
+
+    def stop(self) -> str | None:
+        """Stops sampling and writes the folded stacks, returns the path of the written file (None if nothing was sampled)"""
+        samples = self.sampler.stop()
+        duration = time.perf_counter() - self.start_time
+        if not samples:
+            return None
+
+        file_name = f"{datetime.datetime.now():%Y%m%d_%H%M%S_%f}_{self.command_name}_{int(duration * 1000)}ms.folded"
+        return self.profiler.save(file_name, to_folded_stacks(samples, self.get_root_frame()))
+
+
+class CommandProfiler:
+    """
+    Decides which command invocations are profiled: a random sample_rate fraction of them, plus every invocation
+    of the commands in always_profiled. Both can be changed at runtime, profiling is off while both are empty.
+    """
+
+    def __init__(self, output_dir: str, sample_rate: float, interval_seconds: float, max_files: int):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.interval_seconds = interval_seconds
+        self.max_files = max_files
+        self.always_profiled = set()
+        self.lock = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        return self.sample_rate > 0 or bool(self.always_profiled)
+
+    def should_profile(self, command_name: str) -> bool:
+        return command_name in self.always_profiled or random.random() < self.sample_rate
+
+    def start(self, command_name: str, command_params: dict) -> CommandProfile | None:
+        """
+        Starts profiling the invocation if it was picked, everything called from the caller's frame is sampled.
+        The profile must be deactivated and stopped once the command is done.
+        """
+        if not self.should_profile(command_name):
+            return None
+
+        profile = CommandProfile(self, command_name, command_params, sys._getframe(1))
+        profile.context_token = active_profile.set(profile)
+        return profile
+
+    def toggle_command(self, command_name: str) -> bool:
+        """Starts or stops profiling every invocation of the command, returns whether it is profiled now"""
+        if command_name in self.always_profiled:
+            self.always_profiled.discard(command_name)
+            return False
+
+        self.always_profiled.add(command_name)
+        return True
+
+    def save(self, file_name: str, folded_stacks: str) -> str:
+        with self.lock:
+            os.makedirs(self.output_dir, exist_ok=True)
+            file_path = os.path.join(self.output_dir, file_name)
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(folded_stacks)
+
+            # Only the latest profiles are kept
+            profiles = sorted(entry.path for entry in os.scandir(self.output_dir) if entry.name.endswith('.folded'))
+            for old_profile in profiles[:-self.max_files]:
+                os.remove(old_profile)
+
+        return file_path
+
+    def count_profiles(self) -> int:
+        if not os.path.isdir(self.output_dir):
+            return 0
+
+        return sum(1 for entry in os.scandir(self.output_dir) if entry.name.endswith('.folded'))
+
+
+# The profile of the command invocation being handled, asyncio copies it into the tasks and threads started for it
+active_profile: contextvars.ContextVar[CommandProfile | None] = contextvars.ContextVar("active_profile", default=None)
+
+command_profiler: CommandProfiler | None = None
+
+
+def get_command_profiler() -> CommandProfiler:
+    """The profiler of every command, configured by the PROFILE_* constants when first used"""
+    global command_profiler
+    if command_profiler is None:
+        # utils.constants imports utils.types, which uses this module, so the constants can only be imported here
+        from utils.constants import PROFILES_DIR, PROFILE_SAMPLE_RATE, PROFILE_SAMPLE_INTERVAL_SECONDS, PROFILE_MAX_FILES
+        command_profiler = CommandProfiler(PROFILES_DIR, PROFILE_SAMPLE_RATE, PROFILE_SAMPLE_INTERVAL_SECONDS, PROFILE_MAX_FILES)
+
+    return command_profiler
+
+
+def sampled_in_thread(func):
+    """
+    Wraps a function about to run in a worker thread so that the thread is sampled as part of the profile of the
+    command that started it, while it runs the function
+    """
+    profile = active_profile.get()
+    if profile is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        thread_id = threading.get_ident()
+        profile.sampler.add_thread(thread_id, sys._getframe())
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.sampler.remove_thread(thread_id)
+
+    return wrapper
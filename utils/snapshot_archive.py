@@ -0,0 +1,239 @@
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from utils.types import CityData
+
+# The values recorded for every city in a snapshot, in the order they are encoded in. observed_at is the time of the
+# snapshot the city was last seen by a query in, cities that weren't seen again are carried over with their old values
+SNAPSHOT_COLUMNS = ('city_level', 'player_score', 'alliance_id', 'observed_at')
+
+# (player_name, city_name, x, y), a relocated city shows up as a city that disappeared and another one that appeared
+CityKey = tuple[str, str, int, int]
+
+
+def encode_snapshot(changed_cities: dict[int, tuple], removed_city_ids: list[int], previous_state: dict[int, tuple]) -> bytes:
+    """
+    Encodes the cities that changed since the previous snapshot, column by column.
+    City ids are stored as the gap from the previous id and values as the change from the city's previous values,
+    so most numbers end up as small repeated values (mostly zeros) that compress very well.
+    """
+    city_ids = np.array(sorted(changed_cities), dtype=np.int64)
+    removed_ids = np.array(sorted(removed_city_ids), dtype=np.int64)
+
+    empty_values = (0,) * len(SNAPSHOT_COLUMNS)
+    values = np.array([changed_cities[city_id] for city_id in city_ids.tolist()], dtype=np.int64).reshape(-1, len(SNAPSHOT_COLUMNS))
+    previous_values = np.array([previous_state.get(city_id, empty_values) for city_id in city_ids.tolist()], dtype=np.int64).reshape(-1, len(SNAPSHOT_COLUMNS))
+
+    encoded = np.concatenate([
+        np.array([len(city_ids), len(removed_ids)], dtype=np.int64),
+        np.diff(city_ids, prepend=0),
+        *(values - previous_values).T,  # one column after the other
+        np.diff(removed_ids, prepend=0)
+    ])
+
+    return zlib.compress(encoded.tobytes(), 9)
+
+
+def apply_snapshot(state: dict[int, tuple], payload: bytes, city_ids: set[int] = None) -> list[tuple[int, tuple | None]]:
+    """
+    Moves the state (city id -> values) forward to the snapshot the payload was encoded for.
+    When city_ids is given only those cities are tracked, the rest of the snapshot is skipped.
+
+    :return: (city id, values before the snapshot) of every city the snapshot changed, None for cities that were added
+    """
+    encoded = np.frombuffer(zlib.decompress(payload), dtype=np.int64)
+    changed_count, removed_count = int(encoded[0]), int(encoded[1])
+    offset = 2
+
+    changed_ids = np.cumsum(encoded[offset:offset + changed_count])
+    offset += changed_count
+
+    deltas = encoded[offset:offset + changed_count * len(SNAPSHOT_COLUMNS)].reshape(len(SNAPSHOT_COLUMNS), changed_count).T
+    offset += changed_count * len(SNAPSHOT_COLUMNS)
+
+    removed_ids = np.cumsum(encoded[offset:offset + removed_count])
+
+    if city_ids is not None:
+        tracked = np.isin(changed_ids, list(city_ids))
+        changed_ids, deltas = changed_ids[tracked], deltas[tracked]
+        removed_ids = removed_ids[np.isin(removed_ids, list(city_ids))]
+
+    changes = []
+    empty_values = (0,) * len(SNAPSHOT_COLUMNS)
+    for city_id, city_deltas in zip(changed_ids.tolist(), deltas.tolist()):
+        previous_values = state.get(city_id)
+        state[city_id] = tuple(previous + delta for previous, delta in zip(previous_values or empty_values, city_deltas))
+        changes.append((city_id, previous_values))
+
+    for city_id in removed_ids.tolist():
+        state.pop(city_id, None)
+
+    return changes
+
+
+class SnapshotRecord:
+    """
+    A snapshot ready to be persisted, along with the city keys and alliance names it introduced.
+    The archive only moves on to it once it was persisted (commit_snapshot), until then it can be dropped
+    (discard_snapshot) and what it was taken from is part of the next snapshot again.
+    """
+    snapshot_id: int
+    taken_at: float
+    is_keyframe: bool
+    cities_count: int
+    payload: bytes
+    new_cities: list[tuple[int, CityKey]]
+    new_alliances: list[tuple[int, str]]
+    state: dict[int, tuple]  # city id -> values, as of this snapshot
+    observed_cities: dict[CityKey, tuple[int, int, str]]  # what the snapshot was taken from
+    complete_players: set[str]
+
+    def __init__(self, snapshot_id: int, taken_at: float, is_keyframe: bool, cities_count: int, payload: bytes,
+                 new_cities: list[tuple[int, CityKey]], new_alliances: list[tuple[int, str]], state: dict[int, tuple],
+                 observed_cities: dict[CityKey, tuple[int, int, str]], complete_players: set[str]):
+        self.snapshot_id = snapshot_id
+        self.taken_at = taken_at
+        self.is_keyframe = is_keyframe
+        self.cities_count = cities_count
+        self.payload = payload
+        self.new_cities = new_cities
+        self.new_alliances = new_alliances
+        self.state = state
+        self.observed_cities = observed_cities
+        self.complete_players = complete_players
+
+
+class WorldSnapshotArchive:
+    """
+    Collects every city of a world that Ika-logs returns to us, and turns what was collected into periodic snapshots.
+    Each snapshot only holds what changed since the previous one, every keyframe_interval snapshots a full keyframe
+    is stored instead so reconstructing any snapshot never has to replay more than keyframe_interval deltas.
+
+    Cities are only ever removed when a query returned every city of their player and they weren't in it.
+    """
+
+    def __init__(self, keyframe_interval: int):
+        self.keyframe_interval = keyframe_interval
+        self.city_ids: dict[CityKey, int] = {}
+        self.city_keys: dict[int, CityKey] = {}
+        self.alliance_ids: dict[str, int] = {}
+        self.state: dict[int, tuple] = {}  # city id -> values, as of the last snapshot
+        self.last_snapshot_id = 0
+        self.snapshots_since_keyframe = 0
+        self.is_restored = False  # whether the archive was loaded from the db yet
+
+        self.observed_cities: dict[CityKey, tuple[int, int, str]] = {}  # city key -> (city level, player score, alliance)
+        self.complete_players: set[str] = set()  # players whose every city is in observed_cities
+        self.lock = threading.Lock()
+
+    def observe(self, cities_data: list[CityData], has_every_city_of_its_players: bool = False):
+        """Records the cities returned by a query, they are part of the next snapshot"""
+        with self.lock:
+            for city in cities_data:
+                city_key = (city.player_name, city.city_name, city.x, city.y)
+                self.observed_cities[city_key] = (city.city_level or 0, city.player_score or 0, city.ally_name or '')
+
+            if has_every_city_of_its_players:
+                self.complete_players.update(city.player_name.lower() for city in cities_data)
+
+    def has_pending_changes(self) -> bool:
+        return bool(self.observed_cities)
+
+    def restore(self, city_keys: dict[int, CityKey], alliance_names: dict[int, str], state: dict[int, tuple],
+                last_snapshot_id: int, snapshots_since_keyframe: int):
+        """Continues an archive persisted by a previous run of the bot"""
+        with self.lock:
+            self.city_keys = dict(city_keys)
+            self.city_ids = {city_key: city_id for city_id, city_key in city_keys.items()}
+            self.alliance_ids = {alliance_name: alliance_id for alliance_id, alliance_name in alliance_names.items()}
+            self.state = dict(state)
+            self.last_snapshot_id = last_snapshot_id
+            self.snapshots_since_keyframe = snapshots_since_keyframe
+            self.is_restored = True
+
+    def take_snapshot(self, taken_at: float = None) -> SnapshotRecord | None:
+        """
+        Turns everything observed since the last snapshot into a new snapshot, None if nothing changed.
+        The archive itself doesn't change until the snapshot is committed, so a snapshot that couldn't be persisted
+        never leaves the archive referencing cities or alliances the database doesn't have.
+        """
+        with self.lock:
+            observed_cities, complete_players = self.observed_cities, self.complete_players
+            self.observed_cities, self.complete_players = {}, set()
+
+            new_cities, new_alliances = [], []
+            new_city_ids: dict[CityKey, int] = {}
+            new_alliance_ids: dict[str, int] = {}
+
+            def get_city_id(city_key: CityKey) -> int:
+                if city_key in self.city_ids:
+                    return self.city_ids[city_key]
+                if city_key not in new_city_ids:
+                    new_city_ids[city_key] = len(self.city_ids) + len(new_city_ids) + 1
+                    new_cities.append((new_city_ids[city_key], city_key))
+                return new_city_ids[city_key]
+
+            def get_alliance_id(alliance_name: str) -> int:
+                if alliance_name in self.alliance_ids:
+                    return self.alliance_ids[alliance_name]
+                if alliance_name not in new_alliance_ids:
+                    new_alliance_ids[alliance_name] = len(self.alliance_ids) + len(new_alliance_ids) + 1
+                    new_alliances.append((new_alliance_ids[alliance_name], alliance_name))
+                return new_alliance_ids[alliance_name]
+
+            taken_at = taken_at or time.time()
+            new_state = dict(self.state)
+            observed_ids = set()
+            for city_key, (city_level, player_score, alliance_name) in observed_cities.items():
+                city_id = get_city_id(city_key)
+                new_state[city_id] = (city_level, player_score, get_alliance_id(alliance_name), int(taken_at))
+                observed_ids.add(city_id)
+
+            # Cities of fully observed players that weren't observed were destroyed or relocated
+            removed_ids = [
+                city_id for city_id in self.state
+                if city_id not in observed_ids and self.city_keys[city_id][0].lower() in complete_players
+            ]
+            for city_id in removed_ids:
+                del new_state[city_id]
+
+            is_keyframe = self.last_snapshot_id == 0 or self.snapshots_since_keyframe + 1 >= self.keyframe_interval
+            if is_keyframe:
+                payload = encode_snapshot(new_state, [], {})
+            else:
+                changed_cities = {city_id: values for city_id, values in new_state.items() if self.state.get(city_id) != values}
+                if not changed_cities and not removed_ids:
+                    return None
+                payload = encode_snapshot(changed_cities, removed_ids, self.state)
+
+            return SnapshotRecord(
+                self.last_snapshot_id + 1, taken_at, is_keyframe, len(new_state), payload, new_cities,
+                new_alliances, new_state, observed_cities, complete_players
+            )
+
+    def commit_snapshot(self, record: SnapshotRecord):
+        """Moves the archive on to the snapshot, once it was persisted"""
+        with self.lock:
+            if record.snapshot_id != self.last_snapshot_id + 1:
+                raise ValueError(f"snapshot {record.snapshot_id} doesn't follow snapshot {self.last_snapshot_id}")
+
+            for city_id, city_key in record.new_cities:
+                self.city_ids[city_key] = city_id
+                self.city_keys[city_id] = city_key
+            for alliance_id, alliance_name in record.new_alliances:
+                self.alliance_ids[alliance_name] = alliance_id
+
+            self.state = record.state
+            self.last_snapshot_id = record.snapshot_id
+            self.snapshots_since_keyframe = 0 if record.is_keyframe else self.snapshots_since_keyframe + 1
+
+    def discard_snapshot(self, record: SnapshotRecord):
+        """Drops a snapshot that couldn't be persisted, what it was taken from goes into the next snapshot instead"""
+        with self.lock:
+            # Cities observed since the snapshot was taken are more recent than the ones it was taken from
+            self.observed_cities = {**record.observed_cities, **self.observed_cities}
+            self.complete_players |= record.complete_players
+
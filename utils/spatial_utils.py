@@ -0,0 +1,91 @@
+import math
+from collections import defaultdict
+
+
+class SpatialGrid:
+    """
+    Buckets coordinates on the world map into square cells, so that nearest neighbor and radius
+    lookups only visit the cells around the searched location instead of every point on the map.
+    """
+    cell_size: int
+    points: list[tuple[int, int]]
+    cells: dict[tuple[int, int], list[int]]
+
+    def __init__(self, points: list[tuple[int, int]], cell_size: int = 5):
+        self.cell_size = cell_size
+        self.points = list(points)
+        self.cells = defaultdict(list)
+
+        for point_index, (x, y) in enumerate(self.points):
+            self.cells[self.get_cell(x, y)].append(point_index)
+
+    def __len__(self):
+        return len(self.points)
+
+    def get_cell(self, x: int, y: int) -> tuple[int, int]:
+        return x // self.cell_size, y // self.cell_size
+
+    def get_ring_cells(self, center_cell: tuple[int, int], ring: int):
+        """Yields the cells that are exactly `ring` cells away from the center cell"""
+        center_x, center_y = center_cell
+
+        if ring == 0:
+            yield center_cell
+            return
+
+        for dx in range(-ring, ring + 1):
+            yield center_x + dx, center_y - ring
+            yield center_x + dx, center_y + ring
+
+        for dy in range(-ring + 1, ring):
+            yield center_x - ring, center_y + dy
+            yield center_x + ring, center_y + dy
+
+    def nearest(self, coords: tuple[int, int]) -> tuple[int, float] | None:
+        """
+        Finds the point closest to the coords.
+
+        :return: (index of the closest point, euclidean distance to it), None if the grid is empty
+        """
+        if not self.points:
+            return None
+
+        x, y = coords
+        center_cell = self.get_cell(x, y)
+        max_ring = max(max(abs(cell_x - center_cell[0]), abs(cell_y - center_cell[1])) for cell_x, cell_y in self.cells)
+        best_index, best_distance = None, math.inf
+
+        for ring in range(max_ring + 1):
+            # Every point in this ring is at least (ring - 1) cells away, no need to look further once we beat that
+            if best_distance <= (ring - 1) * self.cell_size:
+                break
+
+            for cell in self.get_ring_cells(center_cell, ring):
+                for point_index in self.cells.get(cell, ()):
+                    point_x, point_y = self.points[point_index]
+                    distance = math.hypot(point_x - x, point_y - y)
+                    if distance < best_distance:
+                        best_index, best_distance = point_index, distance
+
+        return best_index, best_distance
+
+    def within_radius(self, coords: tuple[int, int], radius: float) -> list[tuple[int, float]]:
+        """
+        Finds every point within the radius of the coords.
+
+        :return: (index of the point, euclidean distance to it) pairs, closest first
+        """
+        x, y = coords
+        min_cell_x, min_cell_y = self.get_cell(math.floor(x - radius), math.floor(y - radius))
+        max_cell_x, max_cell_y = self.get_cell(math.ceil(x + radius), math.ceil(y + radius))
+
+        matches = []
+        for cell_x in range(min_cell_x, max_cell_x + 1):
+            for cell_y in range(min_cell_y, max_cell_y + 1):
+                for point_index in self.cells.get((cell_x, cell_y), ()):
+                    point_x, point_y = self.points[point_index]
+                    distance = math.hypot(point_x - x, point_y - y)
+                    if distance <= radius:
+                        matches.append((point_index, distance))
+
+        return sorted(matches, key=lambda match: match[1])
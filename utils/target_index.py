@@ -0,0 +1,56 @@
+from utils.spatial_utils import SpatialGrid
+from utils.tracing import traced
+
+
+class InactiveTargetsIndex:
+    """
+    The archived cities of a world, bucketed by island on a spatial grid and tagged with when their owner's score
+    last changed and was last observed. A search only visits the islands around the searched coords and filters them
+    by inactivity, so it never has to look at the rest of the world.
+    """
+    snapshot_id: int
+    tracked_since: float  # inactivity can't be told for longer than since this time
+    last_score_change: dict[str, float]  # lowercase player name -> time its score last changed
+    last_observed: dict[str, float]  # lowercase player name -> time any of its cities was last observed
+    islands: dict[tuple[int, int], list[dict]]
+    grid: SpatialGrid
+
+    def __init__(self, snapshot_id: int, cities: list[dict], last_score_change: dict[str, float], tracked_since: float):
+        self.snapshot_id = snapshot_id
+        self.tracked_since = tracked_since
+        self.last_score_change = last_score_change
+
+        self.islands = {}
+        self.last_observed = {}
+        for city in cities:
+            self.islands.setdefault((city['x'], city['y']), []).append(city)
+
+            player_name = city['player_name'].lower()
+            self.last_observed[player_name] = max(self.last_observed.get(player_name, 0), city['observed_at'])
+
+        self.grid = SpatialGrid(list(self.islands))
+
+    def get_inactive_since(self, player_name: str) -> float:
+        return self.last_score_change.get(player_name.lower(), self.tracked_since)
+
+    @traced()
+    def find(self, coords_list: list[tuple[int, int]], radius: float, inactive_since: float) -> list[tuple[dict, float, float]]:
+        """
+        Finds the cities within the radius of any of the coords whose owner's score didn't change since inactive_since.
+        Owners that weren't observed since inactive_since are left out, their score may have changed unseen.
+
+        :return: (city, distance to the closest coords, time its owner's score last changed), closest and biggest first
+        """
+        targets = {}
+        for coords in coords_list:
+            for island_index, distance in self.grid.within_radius(coords, radius):
+                for city in self.islands[self.grid.points[island_index]]:
+                    last_change = self.get_inactive_since(city['player_name'])
+                    if last_change > inactive_since or self.last_observed[city['player_name'].lower()] <= inactive_since:
+                        continue
+
+                    city_key = (city['player_name'], city['city_name'], city['x'], city['y'])
+                    if city_key not in targets or distance < targets[city_key][1]:
+                        targets[city_key] = (city, distance, last_change)
+
+        return sorted(targets.values(), key=lambda target: (target[1], -target[0]['city_level']))
@@ -0,0 +1,233 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORT_TIMEOUT_SECONDS = 5
+
+
+class Span:
+    """A timed operation of a trace, e.g. a fetch from ika-logs or a db query"""
+
+    def __init__(self, trace: 'Trace', name: str, parent_id: str | None, attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self):
+        self.end_ns = time.time_ns()
+
+    def to_otlp(self) -> dict:
+        otlp_span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # internal
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [to_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            otlp_span["parentSpanId"] = self.parent_id
+
+        return otlp_span
+
+
+class Trace:
+    """Every span recorded while handling a single interaction"""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: list[Span] = []  # appended to from worker threads too, list.append is atomic
+
+    def start_span(self, name: str, parent: Span | None, attributes: dict) -> Span:
+        new_span = Span(self, name, parent.span_id if parent else None, attributes)
+        self.spans.append(new_span)
+        return new_span
+
+    def get_duration_seconds(self) -> float:
+        root_span = self.spans[0]
+        return ((root_span.end_ns or time.time_ns()) - root_span.start_ns) / 1e9
+
+
+def to_otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def to_otlp_request(traces: list[Trace]) -> dict:
+    """The traces as an OTLP/JSON ExportTraceServiceRequest, the body an OTLP collector expects at /v1/traces"""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [to_otlp_attribute("service.name", "ika-discord-bot")]},
+        "scopeSpans": [{
+            "scope": {"name": "utils.tracing"},
+            "spans": [trace_span.to_otlp() for trace in traces for trace_span in trace.spans],
+        }],
+    }]}
+
+
+class TraceExporter:
+    """
+    Exports finished traces from a background thread, so handling an interaction never waits on disk or network.
+    file:// urls append a line of OTLP/JSON per trace to the file, http(s):// urls post them to an OTLP collector.
+    """
+
+    def __init__(self, export_url: str, queue_size: int):
+        self.export_url = export_url
+        self.traces = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self.export_forever, name="trace-exporter", daemon=True)
+        self.thread.start()
+
+    def export(self, trace: Trace):
+        try:
+            self.traces.put_nowait(trace)
+        except queue.Full:
+            logger.warning(f"Dropped trace {trace.trace_id}, too many traces are waiting to be exported")
+
+    def export_forever(self):
+        while True:
+            traces = [self.traces.get()]
+            while not self.traces.empty() and len(traces) < 100:
+                traces.append(self.traces.get_nowait())
+
+            try:
+                self.write(traces)
+            except Exception as e:
+                logger.warning(f"Exporting {len(traces)} traces to {self.export_url} failed: {e}")
+
+    def write(self, traces: list[Trace]):
+        if self.export_url.startswith("file://"):
+            file_path = self.export_url.removeprefix("file://")
+            os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+            with open(file_path, 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps(to_otlp_request([trace])) + "\n" for trace in traces)
+        else:
+            response = requests.post(self.export_url, json=to_otlp_request(traces), timeout=TRACE_EXPORT_TIMEOUT_SECONDS)
+            response.raise_for_status()
+
+
+class Tracer:
+    """
+    Records a trace for every interaction while tracing is configured (an export url is set).
+    Only a sample_rate fraction of the traces is exported, plus every trace that failed or took longer than
+    slow_trace_seconds, so that the problematic interactions can always be broken down.
+    """
+
+    def __init__(self, exporter: TraceExporter | None, sample_rate: float, slow_trace_seconds: float):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.slow_trace_seconds = slow_trace_seconds
+
+    def finish(self, trace: Trace):
+        if (random.random() < self.sample_rate or trace.get_duration_seconds() >= self.slow_trace_seconds
+                or any(trace_span.error for trace_span in trace.spans)):
+            self.exporter.export(trace)
+
+
+# The innermost span of the interaction being handled, None outside of traced interactions.
+# asyncio tasks and asyncio.to_thread copy it, so the spans of work they run nest under the span that started it
+current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("current_span", default=None)
+
+tracer: Tracer | None = None
+
+
+def get_tracer() -> Tracer:
+    """The tracer of every interaction, configured by the TRACE_* constants when first used"""
+    global tracer
+    if tracer is None:
+        # utils.constants imports utils.types, which uses this module, so the constants can only be imported here
+        from utils.constants import TRACE_EXPORT_URL, TRACE_SAMPLE_RATE, TRACE_SLOW_SECONDS, TRACE_EXPORT_QUEUE_SIZE
+        tracer = Tracer(
+            TraceExporter(TRACE_EXPORT_URL, TRACE_EXPORT_QUEUE_SIZE) if TRACE_EXPORT_URL else None,
+            TRACE_SAMPLE_RATE, TRACE_SLOW_SECONDS
+        )
+
+    return tracer
+
+
+@contextlib.contextmanager
+def start_trace(name: str, **attributes):
+    """Starts the trace of an interaction, every span started within it joins the trace. Yields None while tracing is off"""
+    trace_tracer = get_tracer()
+    if trace_tracer.exporter is None:
+        yield None
+        return
+
+    trace = Trace()
+    try:
+        with record_span(trace, name, None, attributes) as root_span:
+            yield root_span
+    finally:
+        trace_tracer.finish(trace)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """Times the wrapped code as a child of the current span, does nothing (and yields None) outside of traces"""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    with record_span(parent.trace, name, parent, attributes) as child_span:
+        yield child_span
+
+
+@contextlib.contextmanager
+def record_span(trace: Trace, name: str, parent: Span | None, attributes: dict):
+    new_span = trace.start_span(name, parent, attributes)
+    token = current_span.set(new_span)
+    try:
+        yield new_span
+    except Exception as e:
+        new_span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        new_span.end()
+        current_span.reset(token)
+
+
+def traced(name: str = None):
+    """Decorator that records every call of the function as a span, named after the function unless a name is given"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_trace_id() -> str | None:
+    """The id of the trace of the interaction being handled, None outside of traced interactions"""
+    active_span = current_span.get()
+    return active_span.trace.trace_id if active_span else None
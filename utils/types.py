@@ -1,9 +1,23 @@
+import asyncio
 import datetime
-import traceback
+import hashlib
+import logging
 from enum import Enum
+from typing import TYPE_CHECKING
 
 import discord
 
+from utils.async_utils import to_thread
+from utils.cache_backends import SharedCache
+from utils.logging_utils import logging_context
+from utils.profiling import get_command_profiler
+from utils.tracing import start_trace, span
+
+if TYPE_CHECKING:
+    from utils.world_data import WorldData
+
+logger = logging.getLogger(__name__)
+
 
 class BaseCommand:
     """This class implements the basics that every command requires"""
@@ -13,8 +27,14 @@ class BaseCommand:
     guild_settings: dict
     region_id: int
     world_id: int
+    world_data: 'WorldData'  # the data of the guild's world, shared with every other guild that plays in it
+
+    cache_results: bool = False  # commands whose response only depends on their params and data may opt in
+    # hashed (command name, world, params) -> (data version, response), shared by every command (and bot process).
+    # Responses expire after an hour even if their data didn't change.
+    results_cache = SharedCache("results", 60 * 60)
 
-    def __init__(self, ctx: discord.Interaction, command_params: dict, guild_settings: dict):
+    def __init__(self, ctx: discord.Interaction, command_params: dict, guild_settings: dict, world_data: 'WorldData'):
         # Gather basic information about queued command run
         self.ctx = ctx
         self.command_params = command_params
@@ -22,36 +42,90 @@ class BaseCommand:
         self.guild_settings = guild_settings
         self.region_id = self.guild_settings['region_id']
         self.world_id = self.guild_settings['world_id']
+        self.world_data = world_data
 
     async def log_at_run_end(self):
-        print(f"{datetime.datetime.now()} | Finished running the '{self.ctx.command.name}' command!")
+        duration_ms = int((datetime.datetime.now() - self.command_start_time).total_seconds() * 1000)
+        logger.info(f"Finished running the '{self.ctx.command.name}' command!", extra={"duration_ms": duration_ms})
 
     async def run(self):
         """Run logic for the command"""
-        print(
-            f"{self.command_start_time} | Guild: {self.ctx.guild.name} | {str(self.guild_settings['region']).upper()} {str(self.guild_settings['world']).capitalize()} | User {self.ctx.user.name} ran the '{self.ctx.command.name}' command with params {self.command_params}")
-        await self.execute_with_logging()
+        # Every record logged while the command runs carries these, see utils.logging_utils
+        with logging_context(
+                command=self.ctx.command.name, guild=self.ctx.guild.name, user=self.ctx.user.name,
+                world=f"{str(self.guild_settings['region']).upper()} {str(self.guild_settings['world']).capitalize()}"
+        ), start_trace(
+                f"/{self.ctx.command.name}", command=self.ctx.command.name, guild_id=self.ctx.guild.id, region_id=self.region_id,
+                world_id=self.world_id, **{f"param.{key}": value for key, value in self.command_params.items()}
+        ):
+            logger.info(f"User {self.ctx.user.name} ran the '{self.ctx.command.name}' command", extra={"params": self.command_params})
+            await self.execute_with_logging()
 
     async def execute_with_logging(self):
         """Execute the command logic and log after completion."""
+        # Only the invocations the profiler picks (see the /profiling command) are sampled, the others aren't slowed down
+        profile = get_command_profiler().start(self.ctx.command.name, self.command_params)
         try:
-            await self.command_logic()  # Call the logic defined in subclasses
+            if not await self.send_cached_result():
+                with span("command_logic"):
+                    await self.command_logic()  # Call the logic defined in subclasses
 
         except Exception as e:
-            stack_trace = traceback.format_exc()  # Capture the stack trace
-            print(
-                f"{datetime.datetime.now()} | An error occurred while executing command '{self.ctx.command.name}': {str(e)}\n{stack_trace}")
+            logger.exception(f"An error occurred while executing command '{self.ctx.command.name}': {str(e)}")
             embed = discord.Embed(
                 title="Error",
                 description=f"An error occurred: {str(e)}. If this issue persists, please yell at my creator.",
                 color=discord.Color.red()
             )
-            # noinspection PyUnresolvedReferences
-            await self.ctx.response.send_message(embed=embed)
+            await self.send_message(embed=embed)
 
         finally:
+            if profile:
+                profile.deactivate()
+                profile_path = await asyncio.to_thread(profile.stop)
+                if profile_path:
+                    logger.info(f"Saved the profile of the '{self.ctx.command.name}' command to {profile_path}")
+                else:
+                    logger.info(f"The '{self.ctx.command.name}' command finished before it could be profiled")
+
             await self.log_at_run_end()
 
+    def get_result_cache_key(self) -> str:
+        normalized_params = tuple(sorted((key, str(value).lower()) for key, value in self.command_params.items()))
+        return hashlib.sha1(repr((self.ctx.command.name, self.region_id, self.world_id, normalized_params)).encode()).hexdigest()
+
+    async def get_data_version(self):
+        """The version of the data the command's response depends on, override in commands that cache their results"""
+        return None
+
+    async def send_cached_result(self) -> bool:
+        """Sends the response of an identical earlier run, as long as the data it was built from didn't change since"""
+        if not self.cache_results:
+            return False
+
+        # A shared backend may be a network round trip away, it is only ever waited on in a worker thread
+        cached = await to_thread(self.results_cache.get, self.get_result_cache_key())
+        if cached is None or cached[0] != await self.get_data_version():
+            return False
+
+        await self.send_message(**{key: discord.Embed.from_dict(value) if key == 'embed' else value for key, value in cached[1].items()})
+        return True
+
+    async def send_response(self, **kwargs):
+        """Sends the command's response, and remembers it if the command caches its results"""
+        if self.cache_results:
+            # Embeds are cached as dicts, every other argument must be json-compatible already
+            cached_kwargs = {key: value.to_dict() if isinstance(value, discord.Embed) else value for key, value in kwargs.items()}
+            await to_thread(self.results_cache.set, self.get_result_cache_key(), (await self.get_data_version(), cached_kwargs))
+
+        await self.send_message(**kwargs)
+
+    async def send_message(self, **kwargs):
+        """Every message of the command goes through here, so the time spent waiting on discord is traced"""
+        with span("discord.send"):
+            # noinspection PyUnresolvedReferences
+            await self.ctx.response.send_message(**kwargs)
+
     async def command_logic(self):
         """This should be implemented in subclasses"""
         raise NotImplementedError("Subclasses must implement command_logic method.")
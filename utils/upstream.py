@@ -0,0 +1,311 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+from utils.constants import (
+    DATA_FETCH_BASE_URL,
+    UPSTREAM_TIMEOUT_SECONDS,
+    UPSTREAM_MAX_REQUESTS_PER_SECOND,
+    UPSTREAM_MIN_REQUESTS_PER_SECOND,
+    UPSTREAM_BURST_SIZE,
+    UPSTREAM_MAX_WAIT_SECONDS,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_LATENCY_THRESHOLD_SECONDS,
+    CIRCUIT_RESET_SECONDS,
+    RESPONSE_FRESH_SECONDS,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_DISK_CACHE_DIR,
+    RESPONSE_DISK_CACHE_MAX_BYTES,
+    RESPONSE_DISK_CACHE_TTL_SECONDS
+)
+from utils.cache_backends import SharedCache
+from utils.disk_cache import DiskResponseCache, normalize_query
+from utils.tracing import span
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket that hands out one token per upstream request.
+    The refill rate halves whenever upstream struggles and slowly climbs back up while it is healthy.
+    """
+
+    def __init__(self, max_rate: float, min_rate: float, burst_size: int):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.rate = max_rate
+        self.burst_size = burst_size
+        self.tokens = float(burst_size)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst_size, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, max_wait: float) -> bool:
+        """
+        Waits up to max_wait seconds for a token, returns False if none became available in time.
+        Blocks the calling thread while waiting, so it must never be called from the event loop.
+        """
+        deadline = time.monotonic() + max_wait
+
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+
+                wait_time = (1 - self.tokens) / self.rate
+
+            if time.monotonic() + wait_time > deadline:
+                return False
+            time.sleep(wait_time)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.min_rate)
+
+    def on_failure(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+
+class CircuitBreaker:
+    """
+    Stops calling upstream after too many consecutive failures (errors or calls slower than the latency threshold).
+    Once reset_seconds pass, a single trial call is let through, it closes the circuit again if it succeeds.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, latency_threshold: float, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                return True
+
+            # Either still open, or a trial call is already in flight
+            return False
+
+    def record_success(self, latency: float):
+        if latency > self.latency_threshold:
+            self.record_failure()
+            return
+
+        with self.lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def abort_trial(self):
+        """The trial call was never made, the next request may try again"""
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class UpstreamClient:
+    """
+    Calls the Ika-logs 'User_WorldFind' report, guarded by a rate limiter and a circuit breaker.
+
+    Responses are cached with stale-while-revalidate semantics: a fresh response is returned as is, a stale response is
+    returned right away while a background refresh fetches a new one, and the last good response is served whenever
+    upstream is failing. Only a query we never saw before has to wait for upstream.
+    Responses are also persisted to disk, a restarted bot serves them (and refreshes them when stale) instead of
+    starting cold. When several bot processes share a cache backend, a response fetched by one of them is published
+    there, and the others take it from there instead of fetching it again.
+    """
+
+    def __init__(self):
+        self.rate_limiter = AdaptiveRateLimiter(UPSTREAM_MAX_REQUESTS_PER_SECOND, UPSTREAM_MIN_REQUESTS_PER_SECOND, UPSTREAM_BURST_SIZE)
+        self.circuit_breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_LATENCY_THRESHOLD_SECONDS, CIRCUIT_RESET_SECONDS)
+        self.responses = OrderedDict()  # query -> (rows, time fetched at)
+        self.disk_cache = DiskResponseCache(RESPONSE_DISK_CACHE_DIR, RESPONSE_DISK_CACHE_MAX_BYTES, RESPONSE_DISK_CACHE_TTL_SECONDS)
+        self.shared_cache = SharedCache("responses", RESPONSE_DISK_CACHE_TTL_SECONDS)
+        self.refreshing = set()  # queries with a background refresh in flight
+        self.in_flight: dict[str, Future] = {}  # query -> result of the upstream request being made for it
+        self.lock = threading.Lock()
+        self.refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="upstream-refresh")
+
+    def fetch_rows(self, query: str) -> list[dict] | None:
+        """
+        Returns the rows Ika-logs has for the query, None if Ika-logs doesn't know the player/alliance.
+
+        Raises:
+            ValueError: If upstream is unavailable and there is no cached response to fall back to.
+        """
+        cached = self.get_cached(query) or self.get_cached_shared(query) or self.get_cached_on_disk(query)
+
+        if cached is not None:
+            rows, fetched_at = cached
+            if time.time() - fetched_at > RESPONSE_FRESH_SECONDS:
+                self.refresh_in_background(query)
+            return rows
+
+        return self.fetch_and_cache(query)
+
+    def get_cached(self, query: str) -> tuple[list[dict] | None, float] | None:
+        with self.lock:
+            if query not in self.responses:
+                return None
+
+            self.responses.move_to_end(query)
+            return self.responses[query]
+
+    def get_response_age(self, query: str) -> float | None:
+        """How many seconds ago the cached response of the query was fetched, None if it isn't cached"""
+        with self.lock:
+            cached = self.responses.get(query)
+
+        return time.time() - cached[1] if cached else None
+
+    def get_cached_on_disk(self, query: str) -> tuple[list[dict] | None, float] | None:
+        """Promotes a response persisted by a previous run of the bot back into memory"""
+        cached = self.disk_cache.get(query)
+        if cached is not None:
+            self.cache_response(query, *cached)
+
+        return cached
+
+    def get_cached_shared(self, query: str) -> tuple[list[dict] | None, float] | None:
+        """Takes the response another bot process fetched, only when the processes share a cache backend"""
+        if not self.shared_cache.is_shared:
+            return None
+
+        cached = self.shared_cache.get(normalize_query(query))
+        if cached is None:
+            return None
+
+        rows, fetched_at = cached
+        self.cache_response(query, rows, fetched_at)
+        return rows, fetched_at
+
+    def cache_response(self, query: str, rows: list[dict] | None, fetched_at: float = None):
+        with self.lock:
+            self.responses[query] = (rows, fetched_at or time.time())
+            self.responses.move_to_end(query)
+
+            while len(self.responses) > RESPONSE_CACHE_MAX_ENTRIES:
+                self.responses.popitem(last=False)
+
+    def refresh_in_background(self, query: str):
+        with self.lock:
+            if query in self.refreshing:
+                return
+            self.refreshing.add(query)
+
+        def refresh():
+            try:
+                # Another bot process may have refreshed it already
+                shared = self.get_cached_shared(query)
+                if shared is None or time.time() - shared[1] > RESPONSE_FRESH_SECONDS:
+                    self.fetch_and_cache(query)
+            except ValueError:
+                pass  # The stale response keeps being served until upstream recovers
+            finally:
+                with self.lock:
+                    self.refreshing.discard(query)
+
+        self.refresh_executor.submit(refresh)
+
+    def fetch_and_cache(self, query: str) -> list[dict] | None:
+        """
+        Requests the query from upstream and caches the response. Fetches run in parallel threads, so a query that is
+        already being requested waits for that request's response instead of making its own.
+        """
+        with self.lock:
+            in_flight = self.in_flight.get(query)
+            is_requesting = in_flight is None
+            if is_requesting:
+                in_flight = self.in_flight[query] = Future()
+
+        if not is_requesting:
+            return in_flight.result()
+
+        try:
+            rows = self.request_upstream(query)
+            fetched_at = time.time()
+
+            self.cache_response(query, rows, fetched_at)
+            self.disk_cache.set(query, rows, fetched_at)
+            if self.shared_cache.is_shared:
+                self.shared_cache.set(normalize_query(query), (rows, fetched_at))
+        except Exception as e:
+            in_flight.set_exception(e)
+            raise
+        else:
+            in_flight.set_result(rows)
+        finally:
+            with self.lock:
+                del self.in_flight[query]
+
+        return rows
+
+    def request_upstream(self, query: str) -> list[dict] | None:
+        if not self.circuit_breaker.allow_request():
+            raise ValueError("Ika-logs isn't responding at the moment, please try again in a few minutes")
+
+        if not self.rate_limiter.acquire(UPSTREAM_MAX_WAIT_SECONDS):
+            self.circuit_breaker.abort_trial()
+            raise ValueError("too many requests are being made to Ika-logs right now, please try again in a few seconds")
+
+        params = {
+            'report': "User_WorldFind",
+            'query': f"{query}&limit=5000",
+            'order': "asc",
+            "sort": "nick",
+            "start": "0",
+            "limit": "5000"
+        }
+
+        start_time = time.monotonic()
+        try:
+            with span("ikalogs.request", query=query) as request_span:
+                response = requests.post(DATA_FETCH_BASE_URL, params=params, timeout=UPSTREAM_TIMEOUT_SECONDS)
+                if request_span:
+                    request_span.set_attribute("http.status_code", response.status_code)
+                response.raise_for_status()
+        except requests.RequestException:
+            self.circuit_breaker.record_failure()
+            self.rate_limiter.on_failure()
+            raise ValueError("Ika-logs isn't responding at the moment, please try again in a few minutes")
+
+        latency = time.monotonic() - start_time
+        self.circuit_breaker.record_success(latency)
+        if latency > CIRCUIT_LATENCY_THRESHOLD_SECONDS:
+            self.rate_limiter.on_failure()
+        else:
+            self.rate_limiter.on_success()
+
+        # Ika-logs answers with a non-json page when nothing matches the query
+        if response.headers.get('Content-Type') != 'application/json':
+            return None
+
+        return response.json()['body']['rows']
+
+
+ikalogs_client = UpstreamClient()
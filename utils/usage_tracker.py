@@ -0,0 +1,45 @@
+import threading
+import time
+from collections import defaultdict, deque
+
+from utils.constants import USAGE_WINDOW_SECONDS
+
+
+class UsageTracker:
+    """Counts how many times every key was used within a sliding window of time"""
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self.usages = defaultdict(deque)  # key -> times it was used at, oldest first
+        self.lock = threading.Lock()
+
+    def record(self, key):
+        with self.lock:
+            self.usages[key].append(time.time())
+
+    def counts(self) -> dict:
+        """Returns how many times every key was used within the window, keys that weren't used are forgotten"""
+        window_start = time.time() - self.window_seconds
+
+        with self.lock:
+            for key in list(self.usages):
+                usage_times = self.usages[key]
+                while usage_times and usage_times[0] < window_start:
+                    usage_times.popleft()
+
+                if not usage_times:
+                    del self.usages[key]
+
+            return {key: len(usage_times) for key, usage_times in self.usages.items()}
+
+    def most_common(self, limit: int = None, key_filter=None) -> list[tuple]:
+        """Returns the (key, count) pairs of the most used keys, busiest first"""
+        counts = [(key, count) for key, count in self.counts().items() if key_filter is None or key_filter(key)]
+        return sorted(counts, key=lambda usage: usage[1], reverse=True)[:limit]
+
+
+# (region_id, world_id) of every command that was run
+command_usage = UsageTracker(USAGE_WINDOW_SECONDS)
+
+# (region_id, world_id, alliance_name) of every alliance that was looked up
+alliance_usage = UsageTracker(USAGE_WINDOW_SECONDS)
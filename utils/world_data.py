@@ -0,0 +1,252 @@
+import logging
+import threading
+import time
+
+from database import guild_settings_manager
+from database.snapshot_store import get_latest_snapshot_id, get_player_activity
+from utils import data_utils
+from utils.async_utils import to_thread
+from utils.city_index import WorldCityIndexes
+from utils.constants import (
+    CITY_INDEX_MAX_AGE_SECONDS,
+    ISLANDS_DATA_CACHE_SECONDS,
+    SNAPSHOT_KEYFRAME_INTERVAL,
+    TARGET_FINDER_MAX_INACTIVE_HOURS
+)
+from utils.island_search import IslandSearchIndex
+from utils.name_index import WorldNameIndexes
+from utils.snapshot_archive import WorldSnapshotArchive
+from utils.target_index import InactiveTargetsIndex
+from utils.types import CityData
+from utils.usage_tracker import alliance_usage
+
+logger = logging.getLogger(__name__)
+
+
+class LoadedIslands:
+    """The islands of a world as they were loaded at one point in time, along with everything computed from them"""
+    islands_data: list[dict]
+    loaded_at: float
+    generation: int  # of the shared islands cache they were loaded in
+    leaderboards: dict  # (resource_type, wonder_type, no_full_islands) -> (applicable islands count, top islands)
+    search_index: IslandSearchIndex
+    tiers: dict[tuple[int, int], str]  # island coords -> tier
+
+    def __init__(self, islands_data: list[dict], loaded_at: float, generation: int, leaderboards: dict):
+        self.islands_data = islands_data
+        self.loaded_at = loaded_at
+        self.generation = generation
+        self.leaderboards = leaderboards
+        self.search_index = IslandSearchIndex(islands_data)
+        self.tiers = {(island['x'], island['y']): island['tier'] for island in islands_data}
+
+
+class WorldData:
+    """
+    The single owner of everything the bot knows about one world: its cities, islands and their indexes.
+    Every guild that plays in the world shares it, so the data of a world is fetched, parsed and held in memory once
+    no matter how many guilds use it. It is released once the last of those guilds moves to another world or leaves.
+    """
+    region_id: int
+    world_id: int
+    guild_ids: set[int]
+    city_indexes: WorldCityIndexes
+    name_indexes: WorldNameIndexes
+    snapshot_archive: WorldSnapshotArchive
+
+    def __init__(self, region_id: int, world_id: int, snapshot_archive: WorldSnapshotArchive = None):
+        self.region_id = region_id
+        self.world_id = world_id
+        self.guild_ids = set()
+        self.city_indexes = WorldCityIndexes()
+        self.name_indexes = WorldNameIndexes()
+        self.snapshot_archive = snapshot_archive or WorldSnapshotArchive(SNAPSHOT_KEYFRAME_INTERVAL)
+        self.islands = None  # LoadedIslands, once they were loaded
+        self.islands_lock = threading.Lock()
+        self.inactive_targets_index = None
+
+    def __repr__(self):
+        return f"<WorldData(region_id={self.region_id}, world_id={self.world_id}, guilds={len(self.guild_ids)})>"
+
+    # - Cities -
+    # Fetches may wait on Ika-logs and its rate limiter for seconds, so they run in worker threads and the event loop
+    # keeps serving every other interaction meanwhile
+    async def fetch_player_cities(self, player_name: str) -> list[CityData]:
+        cities_data = self.city_indexes.players.get(player_name, CITY_INDEX_MAX_AGE_SECONDS)
+        if cities_data is not None:
+            return cities_data
+
+        return await to_thread(data_utils.fetch_player_cities, self.region_id, self.world_id, player_name)
+
+    async def fetch_alliance_cities(self, alliance_name: str) -> list[CityData]:
+        alliance_usage.record((self.region_id, self.world_id, alliance_name.lower()))
+
+        cities_data = self.city_indexes.alliances.get(alliance_name, CITY_INDEX_MAX_AGE_SECONDS)
+        if cities_data is not None:
+            return cities_data
+
+        return await to_thread(data_utils.fetch_alliance_cities, self.region_id, self.world_id, alliance_name)
+
+    async def fetch_island_cities(self, x: int, y: int) -> list[CityData]:
+        return await to_thread(data_utils.fetch_data, f"server={self.region_id}&world={self.world_id}&search=city&x={x}&y={y}")
+
+    def prefetch_alliance_cities(self, alliance_name: str):
+        data_utils.prefetch_alliance_cities(self.region_id, self.world_id, alliance_name)
+
+    def get_alliance_query(self, alliance_name: str) -> str:
+        return data_utils.get_alliance_query(self.region_id, self.world_id, alliance_name)
+
+    # - Islands -
+    # Checking whether the islands are still current may read the shared cache over the network, and reloading them
+    # queries the database, so commands only ever get them through a worker thread
+    async def get_islands(self) -> list[dict]:
+        return (await to_thread(self.load_islands)).islands_data
+
+    async def get_islands_version(self) -> float:
+        """Changes every time the islands are reloaded, results computed from older islands are outdated"""
+        return (await to_thread(self.load_islands)).loaded_at
+
+    async def get_island_leaderboard(self, resource_type: str, wonder_type: str, no_full_islands: bool) -> tuple[int, list[tuple[dict, int]]]:
+        """The precomputed (applicable islands count, top islands with their scores) of a filter combination"""
+        islands = await to_thread(self.load_islands)
+        return islands.leaderboards.get((resource_type, wonder_type, no_full_islands), (0, []))
+
+    async def get_island_search_index(self) -> IslandSearchIndex:
+        return (await to_thread(self.load_islands)).search_index
+
+    async def get_island_tiers(self) -> dict[tuple[int, int], str]:
+        """Island coords -> tier"""
+        return (await to_thread(self.load_islands)).tiers
+
+    def get_islands_age(self) -> float | None:
+        """How many seconds ago the islands were loaded, None if they weren't yet"""
+        islands = self.islands
+        return time.time() - islands.loaded_at if islands else None
+
+    def are_current(self, islands: LoadedIslands | None) -> bool:
+        return (
+            islands is not None and time.time() - islands.loaded_at < ISLANDS_DATA_CACHE_SECONDS
+            and islands.generation == guild_settings_manager.shared_islands_cache.get_generation()
+        )
+
+    def load_islands(self) -> LoadedIslands:
+        """The islands, reloaded once they expired or another bot process invalidated the shared islands cache"""
+        islands = self.islands
+        if self.are_current(islands):
+            return islands
+
+        with self.islands_lock:
+            # Another thread may have reloaded them while we waited for the lock
+            if self.are_current(self.islands):
+                return self.islands
+
+            return self.read_islands()
+
+    def reload_islands(self) -> LoadedIslands:
+        """Loads the islands again even if they are current, so they are refreshed before they expire"""
+        with self.islands_lock:
+            return self.read_islands()
+
+    def read_islands(self) -> LoadedIslands:
+        # Read first, an invalidation made while the islands load makes them reload again on the next use
+        generation = guild_settings_manager.shared_islands_cache.get_generation()
+        islands_data, loaded_at = guild_settings_manager.load_islands_data(
+            self.world_id, self.region_id, self.islands.loaded_at if self.islands else None
+        )
+        leaderboards = guild_settings_manager.get_or_build_island_leaderboards(self.world_id, self.region_id, islands_data)
+
+        self.islands = LoadedIslands(islands_data, loaded_at, generation, leaderboards)
+        return self.islands
+
+    # - Snapshots -
+    async def get_inactive_targets_index(self) -> InactiveTargetsIndex | None:
+        """Only rebuilt once a new snapshot of the world was archived, None if the world has no snapshots yet"""
+        # Replaying the snapshots reads and decodes a week of them, off the event loop
+        return await to_thread(self.load_inactive_targets_index)
+
+    def load_inactive_targets_index(self) -> InactiveTargetsIndex | None:
+        latest_snapshot_id = get_latest_snapshot_id(self.region_id, self.world_id)
+
+        if self.inactive_targets_index is None or self.inactive_targets_index.snapshot_id != latest_snapshot_id:
+            activity = get_player_activity(self.region_id, self.world_id, time.time() - TARGET_FINDER_MAX_INACTIVE_HOURS * 60 * 60)
+            if activity is None:
+                return None
+
+            self.inactive_targets_index = InactiveTargetsIndex(latest_snapshot_id, *activity)
+
+        return self.inactive_targets_index
+
+    def release(self):
+        """
+        Frees the memory held for the world right away, even if a command that is still running holds on to it.
+        Cities fetched for the world from now on are no longer indexed, see data_utils.index_fetched_cities.
+        """
+        self.city_indexes = WorldCityIndexes()
+        self.name_indexes = WorldNameIndexes()
+        self.islands = None
+        self.inactive_targets_index = None
+
+
+# (region_id, world_id) -> the data of every world at least one guild plays in
+world_data_registry: dict[tuple[int, int], WorldData] = {}
+
+# guild_id -> (region_id, world_id) the guild is attached to
+guild_worlds: dict[int, tuple[int, int]] = {}
+
+# (region_id, world_id) -> the snapshot archive of a released world, kept until the cities collected in it are stored
+released_snapshot_archives: dict[tuple[int, int], WorldSnapshotArchive] = {}
+
+
+def attach_guild(guild_id: int, region_id: int, world_id: int) -> WorldData:
+    """Registers the guild as a user of the world, moving it away from the world it used before if it changed"""
+    if guild_worlds.get(guild_id) not in (None, (region_id, world_id)):
+        detach_guild(guild_id)
+
+    if (region_id, world_id) not in world_data_registry:
+        # A world that is used again before its archive was stored carries on with it
+        world_data_registry[(region_id, world_id)] = WorldData(
+            region_id, world_id, released_snapshot_archives.pop((region_id, world_id), None)
+        )
+
+    world_data = world_data_registry[(region_id, world_id)]
+    world_data.guild_ids.add(guild_id)
+    guild_worlds[guild_id] = (region_id, world_id)
+
+    return world_data
+
+
+def detach_guild(guild_id: int):
+    """The guild no longer uses its world, the world is released once no guild uses it anymore"""
+    world = guild_worlds.pop(guild_id, None)
+    world_data = world_data_registry.get(world)
+    if world_data is None:
+        return
+
+    world_data.guild_ids.discard(guild_id)
+    if not world_data.guild_ids:
+        del world_data_registry[world]
+        world_data.release()
+
+        # Cities collected since the last snapshot are kept until the archiver stores them
+        if world_data.snapshot_archive.has_pending_changes():
+            released_snapshot_archives[world] = world_data.snapshot_archive
+
+        logger.info(f"Released the data of world {world[0]}:{world[1]}, no guild uses it anymore")
+
+
+def get_world_data(region_id: int, world_id: int) -> WorldData | None:
+    """The data of the world, None if no guild uses it"""
+    return world_data_registry.get((region_id, world_id))
+
+
+def get_snapshot_archives() -> list[tuple[tuple[int, int], WorldSnapshotArchive]]:
+    """(region_id, world_id), archive of every world that may hold cities that weren't stored yet"""
+    archives = [((world_data.region_id, world_data.world_id), world_data.snapshot_archive) for world_data in world_data_registry.values()]
+    return archives + list(released_snapshot_archives.items())
+
+
+def drop_stored_snapshot_archives():
+    """Forgets the archives of released worlds once every city collected in them is stored"""
+    for world, archive in list(released_snapshot_archives.items()):
+        if not archive.has_pending_changes():
+            del released_snapshot_archives[world]